@@ -0,0 +1,212 @@
+import logging
+import os
+import threading
+
+from cachetools import TTLCache
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Seconds the dashboard numbers are served from memory
+ADMIN_STATS_TTL = int(os.getenv("ADMIN_STATS_TTL", 30))
+
+# Tables whose row counts are kept in table_counters by triggers
+COUNTED_TABLES = ("users", "locations", "scores")
+# Counters kept for each counted table
+TABLE_COUNTERS = {
+    "users": ("users",),
+    "locations": ("locations",),
+    "scores": ("scores", "scores_sum"),
+}
+# Key of the advisory lock that keeps workers from seeding at the same time
+_SEED_LOCK_KEY = 36_001
+
+_cache = TTLCache(maxsize=1, ttl=ADMIN_STATS_TTL)
+_lock = threading.Lock()
+
+
+# Only seeded counters hold a full count
+COUNTERS_SQL = text(
+    """
+    SELECT c.name, SUM(c.value) AS value
+    FROM table_counters c
+    JOIN table_counter_seeds s ON c.name IN (s.name, s.name || '_sum')
+    GROUP BY c.name
+    """
+)
+
+# Planner estimates, used for any table whose counter has not been seeded yet
+ESTIMATES_SQL = text(
+    """
+    SELECT relname AS name, GREATEST(reltuples, 0)::bigint AS value
+    FROM pg_class
+    WHERE relname IN :tables AND relkind = 'r'
+    """
+).bindparams(bindparam("tables", expanding=True))
+
+# Read from the hourly activity rollup. Guesses of the previous clock hour
+# count for the share of it that is still within the last 60 minutes.
+RECENT_ACTIVITY_SQL = text(
+    """
+    SELECT
+        COALESCE(SUM(guesses) FILTER (WHERE hour = date_trunc('hour', now())), 0)
+        + COALESCE(
+            SUM(guesses) FILTER (
+                WHERE hour = date_trunc('hour', now()) - interval '1 hour'
+            ),
+            0
+        ) * (1 - EXTRACT(EPOCH FROM now() - date_trunc('hour', now())) / 3600)
+            AS guesses_last_hour,
+        COUNT(DISTINCT user_id) AS active_users
+    FROM user_activity_hours
+    WHERE hour >= date_trunc('hour', now() - interval '24 hours')
+    """
+)
+
+REBUILD_ACTIVITY_SQL = text(
+    """
+    INSERT INTO user_activity_hours (hour, user_id, guesses)
+    SELECT date_trunc('hour', created_at), user_id, COUNT(*)
+    FROM scores
+    WHERE user_id IS NOT NULL AND created_at >= now() - interval '25 hours'
+    GROUP BY 1, 2
+    """
+)
+
+REBUILD_COUNTERS_SQL = text(
+    """
+    INSERT INTO table_counters (name, shard, value)
+    SELECT 'users', 0, COUNT(*) FROM users
+    UNION ALL SELECT 'locations', 0, COUNT(*) FROM locations
+    UNION ALL SELECT 'scores', 0, COUNT(*) FROM scores
+    UNION ALL SELECT 'scores_sum', 0, COALESCE(SUM(score), 0) FROM scores
+    """
+)
+
+SEED_COUNTERS_SQL = {
+    "users": text(
+        "INSERT INTO table_counters (name, shard, value) "
+        "SELECT 'users', 0, COUNT(*) FROM users"
+    ),
+    "locations": text(
+        "INSERT INTO table_counters (name, shard, value) "
+        "SELECT 'locations', 0, COUNT(*) FROM locations"
+    ),
+    "scores": text(
+        """
+        INSERT INTO table_counters (name, shard, value)
+        SELECT 'scores', 0, COUNT(*) FROM scores
+        UNION ALL SELECT 'scores_sum', 0, COALESCE(SUM(score), 0) FROM scores
+        """
+    ),
+}
+
+MARK_SEEDED_SQL = text(
+    "INSERT INTO table_counter_seeds (name) VALUES (:name) ON CONFLICT DO NOTHING"
+)
+
+
+def _compute_stats(db: Session) -> dict:
+    counters = {row.name: int(row.value) for row in db.execute(COUNTERS_SQL)}
+
+    missing = tuple(table for table in COUNTED_TABLES if table not in counters)
+    if missing:
+        for row in db.execute(ESTIMATES_SQL, {"tables": missing}):
+            counters[row.name] = int(row.value)
+
+    total_guesses = counters.get("scores", 0)
+    score_sum = counters.get("scores_sum")
+    average_score = score_sum / total_guesses if score_sum and total_guesses else 0
+
+    activity = db.execute(RECENT_ACTIVITY_SQL).one()
+
+    return {
+        "totalUsers": counters.get("users", 0),
+        "totalLocations": counters.get("locations", 0),
+        "totalGuesses": total_guesses,
+        "averageScore": float(average_score),
+        "guessesLastHour": round(activity.guesses_last_hour),
+        "activeUsers": activity.active_users,
+    }
+
+
+def get_admin_stats(db: Session) -> dict:
+    """Return the admin dashboard numbers, recomputed at most every ADMIN_STATS_TTL."""
+    with _lock:
+        stats = _cache.get("stats")
+    if stats is None:
+        stats = _compute_stats(db)
+        with _lock:
+            _cache["stats"] = stats
+    return stats
+
+
+def seed_table_counters(db: Session) -> list:
+    """
+    Count the tables whose counters have not been seeded yet, so the
+    triggers start adding to a full count. Returns the tables seeded.
+    """
+    db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _SEED_LOCK_KEY})
+    seeded = {
+        row.name for row in db.execute(text("SELECT name FROM table_counter_seeds"))
+    }
+    tables = [table for table in COUNTED_TABLES if table not in seeded]
+    for table in tables:
+        # Block writers while counting, so every change is either in the
+        # count or made after the seed is visible to the triggers
+        db.execute(text(f"LOCK TABLE {table} IN SHARE MODE"))
+        db.execute(
+            text("DELETE FROM table_counters WHERE name IN :names").bindparams(
+                bindparam("names", expanding=True)
+            ),
+            {"names": TABLE_COUNTERS[table]},
+        )
+        db.execute(SEED_COUNTERS_SQL[table])
+        db.execute(MARK_SEEDED_SQL, {"name": table})
+    db.commit()
+    if tables:
+        with _lock:
+            _cache.clear()
+    return tables
+
+
+def run_counter_seeding():
+    db = SessionLocal()
+    try:
+        tables = seed_table_counters(db)
+        if tables:
+            logger.info(f"Seeded table counters of {', '.join(tables)}")
+    except Exception as e:
+        logger.error(f"Error seeding table counters: {str(e)}")
+    finally:
+        db.close()
+
+
+def rebuild_table_counters(db: Session):
+    """
+    Recount every counted table and the last day of activity (after the
+    counters have drifted, e.g. from rows changed with triggers disabled).
+    """
+    # Block writers while counting so no trigger increment is lost
+    db.execute(text("LOCK TABLE users, locations, scores IN SHARE MODE"))
+    db.execute(text("DELETE FROM table_counters"))
+    db.execute(REBUILD_COUNTERS_SQL)
+    for table in COUNTED_TABLES:
+        db.execute(MARK_SEEDED_SQL, {"name": table})
+    db.execute(text("DELETE FROM user_activity_hours"))
+    db.execute(REBUILD_ACTIVITY_SQL)
+    db.commit()
+    with _lock:
+        _cache.clear()
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        rebuild_table_counters(db)
+        print("Table counters rebuilt")
+    finally:
+        db.close()
@@ -0,0 +1,111 @@
+import os
+import threading
+from typing import Optional
+
+from cachetools import LRUCache, TTLCache
+from sqlalchemy.orm import Session
+
+import models
+
+# Static challenge data (participants and locations) rarely changes once a
+# challenge is created, so it is cached per challenge id for this many seconds
+CHALLENGE_CACHE_TTL = int(os.getenv("CHALLENGE_CACHE_TTL", 600))
+CHALLENGE_CACHE_SIZE = int(os.getenv("CHALLENGE_CACHE_SIZE", 1024))
+
+# Results of completed challenges never change, so they only need a size bound
+CHALLENGE_RESULTS_CACHE_SIZE = int(os.getenv("CHALLENGE_RESULTS_CACHE_SIZE", 1024))
+
+_cache = TTLCache(maxsize=CHALLENGE_CACHE_SIZE, ttl=CHALLENGE_CACHE_TTL)
+_results_cache = LRUCache(maxsize=CHALLENGE_RESULTS_CACHE_SIZE)
+_lock = threading.Lock()
+
+
+def _user_data(user: models.User) -> dict:
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "is_admin": user.is_admin,
+        "created_at": user.created_at,
+    }
+
+
+def _location_data(location: models.Location) -> dict:
+    return {
+        "id": location.id,
+        "name": location.name,
+        "latitude": location.latitude,
+        "longitude": location.longitude,
+        "image_url": location.image_url,
+        "category_id": location.category_id,
+        "difficulty_level": location.difficulty_level,
+        "country": location.country,
+        "region": location.region,
+        "description": location.description,
+        "created_at": location.created_at,
+        "updated_at": location.updated_at,
+    }
+
+
+def _build_static_detail(db: Session, challenge: models.Challenge) -> dict:
+    challenge_locations = (
+        db.query(models.ChallengeLocation, models.Location)
+        .join(
+            models.Location, models.ChallengeLocation.location_id == models.Location.id
+        )
+        .filter(models.ChallengeLocation.challenge_id == challenge.id)
+        .order_by(models.ChallengeLocation.order_index)
+        .all()
+    )
+
+    return {
+        "challenger": _user_data(challenge.challenger),
+        "challenged": _user_data(challenge.challenged),
+        "locations": [
+            {
+                "id": cl.id,
+                "challenge_id": cl.challenge_id,
+                "location_id": cl.location_id,
+                "order_index": cl.order_index,
+                "location": _location_data(loc),
+            }
+            for cl, loc in challenge_locations
+        ],
+    }
+
+
+def get_static_detail(db: Session, challenge: models.Challenge) -> dict:
+    """Return the cached participants and ordered locations for a challenge."""
+    with _lock:
+        cached = _cache.get(challenge.id)
+    if cached is not None:
+        return cached
+
+    static_detail = _build_static_detail(db, challenge)
+    with _lock:
+        _cache[challenge.id] = static_detail
+    return static_detail
+
+
+def get_results(challenge_id: int) -> Optional[dict]:
+    """Return the cached results snapshot of a completed challenge, if any."""
+    with _lock:
+        return _results_cache.get(challenge_id)
+
+
+def set_results(challenge_id: int, results: dict):
+    with _lock:
+        _results_cache[challenge_id] = results
+
+
+def invalidate(challenge_id: int):
+    """Drop everything cached for a single challenge."""
+    with _lock:
+        _cache.pop(challenge_id, None)
+        _results_cache.pop(challenge_id, None)
+
+
+def clear():
+    """Drop all cached challenge data (e.g. after a location is edited)."""
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+import psycopg2
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Fan events out to every worker through Postgres LISTEN/NOTIFY
+CHALLENGE_EVENTS_NOTIFY = (
+    os.getenv("CHALLENGE_EVENTS_NOTIFY", "false").lower() == "true"
+)
+CHALLENGE_EVENTS_CHANNEL = "challenge_events"
+
+# Seconds between keep-alive comments on idle event streams
+CHALLENGE_EVENTS_KEEPALIVE = int(os.getenv("CHALLENGE_EVENTS_KEEPALIVE", 15))
+
+# Events buffered per subscriber before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class ChallengeEventBroker:
+    """
+    In-process publish/subscribe for challenge events.
+
+    Every open event stream registers an asyncio.Queue under its user id.
+    Publishing puts the event on the queues of the addressed users. When
+    CHALLENGE_EVENTS_NOTIFY is enabled, events are sent through pg_notify
+    instead and a listener thread delivers them to the local subscribers of
+    each worker.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[threading.Thread] = None
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[user_id].add(queue)
+        if CHALLENGE_EVENTS_NOTIFY:
+            self._start_listener()
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    def deliver(self, user_ids: Iterable[int], event: dict):
+        """Hand an event to the local subscribers of the given users."""
+        for user_id in user_ids:
+            for queue in list(self._subscribers.get(user_id, ())):
+                if queue.full():
+                    # Slow consumer: drop the oldest event rather than block
+                    queue.get_nowait()
+                queue.put_nowait(event)
+
+    def publish(self, db: Session, user_ids: Iterable[int], event: dict):
+        """
+        Publish an event to the given users.
+
+        Call this after the change has been committed so that clients
+        refetching on the event see the new state.
+        """
+        user_ids = [user_id for user_id in set(user_ids) if user_id is not None]
+        if CHALLENGE_EVENTS_NOTIFY:
+            payload = json.dumps({"user_ids": user_ids, "event": event}, default=str)
+            db.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": CHALLENGE_EVENTS_CHANNEL, "payload": payload},
+            )
+            db.commit()
+        else:
+            self.deliver(user_ids, event)
+
+    def _start_listener(self):
+        if self._listener is not None and self._listener.is_alive():
+            return
+        self._listener = threading.Thread(
+            target=self._listen, name="challenge-events-listener", daemon=True
+        )
+        self._listener.start()
+
+    def _listen(self):
+        conn = psycopg2.connect(
+            host=os.getenv("PGHOST"),
+            dbname=os.getenv("PGDATABASE"),
+            user=os.getenv("PGUSER"),
+            password=os.getenv("PGPASSWORD"),
+            sslmode="require",
+        )
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute(f"LISTEN {CHALLENGE_EVENTS_CHANNEL};")
+        logger.info("Listening for challenge events")
+
+        try:
+            while True:
+                readable, _, _ = select.select(
+                    [conn], [], [], CHALLENGE_EVENTS_KEEPALIVE
+                )
+                if not readable:
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        message = json.loads(notify.payload)
+                    except ValueError:
+                        logger.error("Invalid challenge event payload")
+                        continue
+                    self._loop.call_soon_threadsafe(
+                        self.deliver, message["user_ids"], message["event"]
+                    )
+        except Exception as e:
+            logger.error(f"Challenge event listener stopped: {str(e)}")
+        finally:
+            conn.close()
+
+
+def challenge_event(event_type: str, challenge, **extra) -> dict:
+    """Build the event payload sent to clients for a challenge change."""
+    return {
+        "type": event_type,
+        "challenge_id": challenge.id,
+        "status": challenge.status,
+        "winner_id": challenge.winner_id,
+        **extra,
+    }
+
+
+def format_sse(event: dict) -> str:
+    """Encode an event as a Server-Sent Events message."""
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+broker = ChallengeEventBroker()
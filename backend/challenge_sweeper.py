@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import challenge_cache
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Pending challenges nobody accepted within this many days are expired
+CHALLENGE_PENDING_TTL_DAYS = int(os.getenv("CHALLENGE_PENDING_TTL_DAYS", 7))
+# Accepted or in-progress challenges older than this are settled as they stand
+CHALLENGE_ACTIVE_TTL_DAYS = int(os.getenv("CHALLENGE_ACTIVE_TTL_DAYS", 14))
+# Completed and expired challenges older than this leave the live tables
+CHALLENGE_ARCHIVE_AFTER_DAYS = int(os.getenv("CHALLENGE_ARCHIVE_AFTER_DAYS", 30))
+# Rows handled per transaction, so no pass holds locks for long
+CHALLENGE_SWEEP_BATCH_SIZE = int(os.getenv("CHALLENGE_SWEEP_BATCH_SIZE", 500))
+# Seconds between sweeps when running inside the API process (0 disables)
+CHALLENGE_SWEEP_INTERVAL = int(os.getenv("CHALLENGE_SWEEP_INTERVAL", 3600))
+
+
+EXPIRE_PENDING_SQL = text(
+    """
+    UPDATE challenges SET status = 'expired'
+    WHERE id IN (
+        SELECT id FROM challenges
+        WHERE status = 'pending'
+        AND created_at < now() - make_interval(days => :days)
+        ORDER BY id
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id
+    """
+)
+
+SETTLE_ACTIVE_SQL = text(
+    """
+    WITH batch AS (
+        SELECT id, challenger_id, challenged_id FROM challenges
+        WHERE status IN ('accepted', 'in_progress')
+        AND created_at < now() - make_interval(days => :days)
+        ORDER BY id
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    ), totals AS (
+        SELECT
+            b.id,
+            COALESCE(SUM(cs.score) FILTER (WHERE cs.user_id = b.challenger_id), 0)
+                AS challenger_total,
+            COALESCE(SUM(cs.score) FILTER (WHERE cs.user_id = b.challenged_id), 0)
+                AS challenged_total
+        FROM batch b
+        LEFT JOIN challenge_scores cs ON cs.challenge_id = b.id
+        GROUP BY b.id, b.challenger_id, b.challenged_id
+    )
+    UPDATE challenges c SET
+        status = 'completed',
+        completed_at = now(),
+        winner_id = CASE
+            WHEN t.challenger_total > t.challenged_total THEN c.challenger_id
+            WHEN t.challenged_total > t.challenger_total THEN c.challenged_id
+        END
+    FROM totals t
+    WHERE c.id = t.id
+    RETURNING c.id
+    """
+)
+
+ARCHIVE_COMPLETED_SQL = text(
+    """
+    WITH batch AS (
+        SELECT id FROM challenges
+        WHERE status = 'completed'
+        AND completed_at < now() - make_interval(days => :days)
+        ORDER BY id
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    ), archived AS (
+        INSERT INTO challenge_history (
+            challenge_id, challenger_id, challenged_id, winner_id,
+            challenger_score, challenged_score, created_at, completed_at
+        )
+        SELECT
+            c.id, c.challenger_id, c.challenged_id, c.winner_id,
+            COALESCE(SUM(cs.score) FILTER (WHERE cs.user_id = c.challenger_id), 0),
+            COALESCE(SUM(cs.score) FILTER (WHERE cs.user_id = c.challenged_id), 0),
+            c.created_at, c.completed_at
+        FROM challenges c
+        JOIN batch b ON b.id = c.id
+        LEFT JOIN challenge_scores cs ON cs.challenge_id = c.id
+        GROUP BY c.id
+        ON CONFLICT (challenge_id) DO NOTHING
+        RETURNING challenge_id
+    )
+    DELETE FROM challenges WHERE id IN (SELECT id FROM batch)
+    RETURNING id
+    """
+)
+
+DELETE_EXPIRED_SQL = text(
+    """
+    DELETE FROM challenges
+    WHERE id IN (
+        SELECT id FROM challenges
+        WHERE status = 'expired'
+        AND created_at < now() - make_interval(days => :days)
+        ORDER BY id
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id
+    """
+)
+
+
+def _run_in_batches(db: Session, statement, days: int, batch_size: int) -> int:
+    """Run a batched statement until it touches fewer rows than a full batch."""
+    total = 0
+    while True:
+        ids = (
+            db.execute(statement, {"days": days, "batch_size": batch_size})
+            .scalars()
+            .all()
+        )
+        db.commit()
+        for challenge_id in ids:
+            challenge_cache.invalidate(challenge_id)
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
+
+
+def sweep_challenges(db: Session, batch_size: int = CHALLENGE_SWEEP_BATCH_SIZE) -> dict:
+    """Expire, settle and archive stale challenges. Returns the counts."""
+    result = {
+        "expired": _run_in_batches(
+            db, EXPIRE_PENDING_SQL, CHALLENGE_PENDING_TTL_DAYS, batch_size
+        ),
+        "settled": _run_in_batches(
+            db, SETTLE_ACTIVE_SQL, CHALLENGE_ACTIVE_TTL_DAYS, batch_size
+        ),
+        "archived": _run_in_batches(
+            db, ARCHIVE_COMPLETED_SQL, CHALLENGE_ARCHIVE_AFTER_DAYS, batch_size
+        ),
+        "deleted": _run_in_batches(
+            db, DELETE_EXPIRED_SQL, CHALLENGE_ARCHIVE_AFTER_DAYS, batch_size
+        ),
+    }
+    logger.info(f"Challenge sweep finished: {result}")
+    return result
+
+
+def run_sweep() -> dict:
+    db = SessionLocal()
+    try:
+        return sweep_challenges(db)
+    finally:
+        db.close()
+
+
+async def run_periodic_sweeps(interval: int = CHALLENGE_SWEEP_INTERVAL):
+    """Run the sweeper every `interval` seconds without blocking the event loop."""
+    while True:
+        try:
+            await asyncio.to_thread(run_sweep)
+        except Exception as e:
+            logger.error(f"Error sweeping challenges: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(run_sweep())
@@ -1,12 +1,28 @@
 import models
 import schemas
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List, Optional
+from sqlalchemy import (
+    String,
+    cast,
+    exists,
+    func,
+    insert,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import List, Optional, Tuple
+from datetime import timedelta
+import re
 from fastapi import HTTPException, status
 
 # ... (keep your existing crud functions) ...
 
+# Shortest search term matched anywhere in a username (pg_trgm needs 3 characters)
+USER_SEARCH_TRIGRAM_MIN_LENGTH = 3
+
 
 def get_or_create_game_result(
     db: Session, user_id: int, category: str, total_score: int
@@ -79,73 +95,335 @@ def create_pending_location(
     return db_location
 
 
-def get_pending_locations(db: Session) -> List[models.PendingLocation]:
-    """Get all pending location submissions."""
-    return (
-        db.query(models.PendingLocation)
-        .filter(models.PendingLocation.status == "pending")
-        .all()
+def get_pending_locations(
+    db: Session,
+    limit: Optional[int] = None,
+    after_id: Optional[int] = None,
+    available_to: Optional[int] = None,
+) -> List[models.PendingLocation]:
+    """
+    Get pending location submissions in id order, starting after `after_id`.
+    With `available_to`, submissions leased to other moderators are skipped.
+    """
+    query = db.query(models.PendingLocation).filter(
+        models.PendingLocation.status == "pending"
     )
+    if after_id is not None:
+        query = query.filter(models.PendingLocation.id > after_id)
+    if available_to is not None:
+        query = query.filter(_claim_available_to(available_to))
+    query = query.order_by(models.PendingLocation.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
 
 
-def approve_pending_location(db: Session, location_id: int) -> models.Location:
-    """Approve a pending location and move it to the main locations table."""
-    # Get the pending location
-    pending_location = (
-        db.query(models.PendingLocation)
-        .filter(
-            models.PendingLocation.id == location_id,
+def _claim_available_to(moderator_id: int):
+    """Pending locations that are unclaimed, whose lease ran out, or that the moderator holds."""
+    return or_(
+        models.PendingLocation.claimed_until.is_(None),
+        models.PendingLocation.claimed_until < func.now(),
+        models.PendingLocation.claimed_by == moderator_id,
+    )
+
+
+def claim_pending_locations(
+    db: Session, moderator_id: int, limit: int, lease_seconds: int
+) -> List[models.PendingLocation]:
+    """
+    Lease up to `limit` pending locations to a moderator, oldest first.
+
+    Rows locked by a concurrent claim are skipped rather than waited for, so
+    moderators claiming at the same time get disjoint batches.
+    """
+    claimable = (
+        select(models.PendingLocation.id)
+        .where(
             models.PendingLocation.status == "pending",
+            _claim_available_to(moderator_id),
         )
-        .first()
+        .order_by(models.PendingLocation.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
     )
-
-    if not pending_location:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Pending location not found"
+    claimed = db.scalars(
+        update(models.PendingLocation)
+        .where(models.PendingLocation.id.in_(claimable))
+        .values(
+            claimed_by=moderator_id,
+            claimed_until=func.now() + timedelta(seconds=lease_seconds),
         )
+        .returning(models.PendingLocation)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return sorted(claimed, key=lambda location: location.id)
 
-    # Create new location from pending location data
-    location_data = {
-        "image_url": pending_location.image_url,
-        "latitude": pending_location.latitude,
-        "longitude": pending_location.longitude,
-        "name": pending_location.name,
-        "description": pending_location.description,
-        "category_id": pending_location.category_id,
-        "difficulty_level": pending_location.difficulty_level,
-        "country": pending_location.country,
-        "region": pending_location.region,
-    }
-
-    new_location = models.Location(**location_data)
-    db.add(new_location)
-
-    # Update pending location status
-    pending_location.status = "approved"
 
+def release_pending_locations(
+    db: Session, moderator_id: int, location_ids: List[int]
+) -> List[int]:
+    """Give back claimed pending locations. Returns the ids released."""
+    released = db.scalars(
+        update(models.PendingLocation)
+        .where(
+            models.PendingLocation.id.in_(location_ids),
+            models.PendingLocation.claimed_by == moderator_id,
+        )
+        .values(claimed_by=None, claimed_until=None)
+        .returning(models.PendingLocation.id)
+        .execution_options(synchronize_session=False)
+    ).all()
     db.commit()
-    db.refresh(new_location)
-    return new_location
+    return released
 
 
-def reject_pending_location(db: Session, location_id: int) -> bool:
-    """Reject and delete a pending location."""
-    pending_location = (
-        db.query(models.PendingLocation)
-        .filter(
-            models.PendingLocation.id == location_id,
+def _resolve_pending_locations(
+    db: Session, location_ids: List[int], moderator_id: int, new_status: str
+) -> List[int]:
+    """Move actionable pending locations to `new_status`, returning their ids."""
+    return db.scalars(
+        update(models.PendingLocation)
+        .where(
+            models.PendingLocation.id.in_(location_ids),
             models.PendingLocation.status == "pending",
+            _claim_available_to(moderator_id),
         )
-        .first()
+        .values(status=new_status, claimed_by=None, claimed_until=None)
+        .returning(models.PendingLocation.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+
+def approve_pending_locations(
+    db: Session, location_ids: List[int], moderator_id: int
+) -> Tuple[List[int], List[models.Location]]:
+    """
+    Approve pending locations in one transaction: mark them approved, then
+    copy them into locations with a single INSERT ... SELECT ... RETURNING.
+    Locations that are not pending or are leased to another moderator are
+    left untouched. Returns the approved pending ids and the new locations.
+    """
+    approved_ids = _resolve_pending_locations(
+        db, location_ids, moderator_id, "approved"
+    )
+    if not approved_ids:
+        db.commit()
+        return [], []
+
+    columns = [
+        "image_url",
+        "latitude",
+        "longitude",
+        "name",
+        "description",
+        "category_id",
+        "difficulty_level",
+        "country",
+        "region",
+        "image_hash",
+    ]
+    pending = models.PendingLocation
+    source = (
+        select(
+            pending.image_url,
+            pending.latitude,
+            pending.longitude,
+            pending.name,
+            pending.description,
+            pending.category_id,
+            # The two tables may store the difficulty with different types
+            cast(
+                cast(pending.difficulty_level, String),
+                models.Location.difficulty_level.type,
+            ),
+            pending.country,
+            pending.region,
+            pending.image_hash,
+        )
+        .where(pending.id.in_(approved_ids))
+        .order_by(pending.id)
+    )
+    new_locations = db.scalars(
+        insert(models.Location).from_select(columns, source).returning(models.Location)
+    ).all()
+    db.commit()
+    return approved_ids, new_locations
+
+
+def reject_pending_locations(
+    db: Session, location_ids: List[int], moderator_id: int
+) -> List[int]:
+    """Reject pending locations in one statement. Returns the ids rejected."""
+    rejected_ids = _resolve_pending_locations(
+        db, location_ids, moderator_id, "rejected"
     )
+    db.commit()
+    return rejected_ids
 
-    if not pending_location:
+
+def approve_pending_location(
+    db: Session, location_id: int, moderator_id: int
+) -> models.Location:
+    """Approve a pending location and move it to the main locations table."""
+    _, new_locations = approve_pending_locations(db, [location_id], moderator_id)
+    if not new_locations:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Pending location not found"
         )
+    return new_locations[0]
 
-    # Update status to rejected
-    pending_location.status = "rejected"
-    db.commit()
+
+def reject_pending_location(db: Session, location_id: int, moderator_id: int) -> bool:
+    """Reject a pending location."""
+    if not reject_pending_locations(db, [location_id], moderator_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Pending location not found"
+        )
     return True
+
+
+def escape_like(term: str) -> str:
+    """Escape LIKE wildcards in user input; match with escape="!"."""
+    return term.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+
+def search_users(
+    db: Session, term: str, exclude_user_id: int, limit: int
+) -> List[models.User]:
+    """
+    Case-insensitive username search, prefix matches first.
+
+    Terms shorter than USER_SEARCH_TRIGRAM_MIN_LENGTH only match as a prefix
+    (served by the text_pattern_ops index); longer ones also match anywhere
+    in the name through the pg_trgm GIN index and are ranked by trigram
+    similarity. Friends of the searching user are removed with an anti-join.
+    """
+    term = term.lower()
+    username = func.lower(models.User.username)
+    is_prefix = username.like(escape_like(term) + "%", escape="!")
+
+    query = db.query(models.User).filter(
+        models.User.id != exclude_user_id,
+        ~exists().where(
+            models.Friends.user_id == exclude_user_id,
+            models.Friends.friend_id == models.User.id,
+        ),
+    )
+    if len(term) < USER_SEARCH_TRIGRAM_MIN_LENGTH:
+        query = query.filter(is_prefix).order_by(
+            func.length(models.User.username), username
+        )
+    else:
+        query = query.filter(
+            username.like("%" + escape_like(term) + "%", escape="!")
+        ).order_by(
+            is_prefix.desc(),
+            func.similarity(username, term).desc(),
+            func.length(models.User.username),
+            username,
+        )
+    return query.limit(limit).all()
+
+
+def location_search_query(text: str):
+    """Prefix tsquery matching every word of `text`, or None if it has no words."""
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    return func.to_tsquery("simple", " & ".join(f"{word}:*" for word in words))
+
+
+def search_locations(
+    db: Session,
+    text: str,
+    limit: int,
+    category_id: Optional[int] = None,
+    difficulty: Optional[models.DifficultyLevel] = None,
+    after: Optional[tuple] = None,
+) -> List[tuple]:
+    """
+    Full-text search over locations through the search_vector GIN index.
+
+    Returns (location, rank) pairs, best match first; `after` is the
+    (rank, id) of the last row of the previous page.
+    """
+    query = location_search_query(text)
+    if query is None:
+        return []
+    rank = func.ts_rank(models.Location.search_vector, query)
+
+    results = db.query(models.Location, rank.label("rank")).filter(
+        models.Location.search_vector.op("@@")(query)
+    )
+    if category_id is not None:
+        results = results.filter(models.Location.category_id == category_id)
+    if difficulty is not None:
+        results = results.filter(models.Location.difficulty_level == difficulty)
+    if after is not None:
+        results = results.filter(tuple_(rank, models.Location.id) < tuple_(*after))
+    return results.order_by(rank.desc(), models.Location.id.desc()).limit(limit).all()
+
+
+def get_next_challenge_round(db: Session, challenge_id: int, user_id: int) -> int:
+    """Get the next round a user has to play in a challenge."""
+    last_round = (
+        db.query(func.max(models.ChallengeScore.round_number))
+        .filter(
+            models.ChallengeScore.challenge_id == challenge_id,
+            models.ChallengeScore.user_id == user_id,
+        )
+        .scalar()
+    )
+    return (last_round or 0) + 1
+
+
+def add_score_to_game_session(
+    db: Session, session_id: int, user_id: int, location_id: int, score: int
+) -> None:
+    """Atomically add a guess to a game session's running totals."""
+    location_category = (
+        select(models.Location.category_id)
+        .where(models.Location.id == location_id)
+        .scalar_subquery()
+    )
+    db.query(models.GameSession).filter(
+        models.GameSession.id == session_id,
+        models.GameSession.user_id == user_id,
+    ).update(
+        {
+            models.GameSession.total_score: models.GameSession.total_score + score,
+            models.GameSession.rounds_played: models.GameSession.rounds_played + 1,
+            models.GameSession.category_id: func.coalesce(
+                models.GameSession.category_id, location_category
+            ),
+        },
+        synchronize_session=False,
+    )
+
+
+def record_session_leaderboards(
+    db: Session, user_id: int, category_id: Optional[int], score: int
+) -> int:
+    """Upsert a finished session into the leaderboards and return the user's best."""
+    if category_id is not None:
+        db.execute(
+            pg_insert(models.CategoryLeaderboard)
+            .values(user_id=user_id, category_id=category_id, score=score)
+            .on_conflict_do_nothing(index_elements=["user_id", "category_id", "score"])
+        )
+
+    leaderboard_insert = pg_insert(models.Leaderboard).values(
+        user_id=user_id, highest_score=score
+    )
+    return db.execute(
+        leaderboard_insert.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={
+                "highest_score": func.greatest(
+                    models.Leaderboard.highest_score,
+                    leaderboard_insert.excluded.highest_score,
+                )
+            },
+        ).returning(models.Leaderboard.highest_score)
+    ).scalar_one()
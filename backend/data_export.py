@@ -0,0 +1,364 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy import Float, Integer, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+import models
+from database import ReplicaSessionLocal, SessionLocal
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet exports are optional
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip from the server-side cursor (and per Parquet row group)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 5000))
+# Watermarked exports stop this many seconds before now, so rows from
+# transactions that are still open are not skipped by the next run
+EXPORT_WATERMARK_LAG = int(os.getenv("EXPORT_WATERMARK_LAG", 60))
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Exportable tables and the timestamp that orders them. Sessions are exported
+# once they have ended, so each one is exported with its final totals.
+EXPORT_TABLES = {
+    "scores": (models.Score, models.Score.created_at),
+    "game_sessions": (models.GameSession, models.GameSession.ended_at),
+    "challenge_scores": (models.ChallengeScore, models.ChallengeScore.created_at),
+}
+
+
+# Commit time of the last transaction a replica has replayed (NULL on the primary)
+REPLAY_TIMESTAMP_SQL = text(
+    """
+    SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_xact_replay_timestamp() END
+    """
+)
+
+
+def _export_query(
+    db: Session,
+    table: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    after: Optional[models.ExportWatermark],
+):
+    model, timestamp = EXPORT_TABLES[table]
+    query = db.query(*model.__table__.columns).filter(timestamp.isnot(None))
+    if start is not None:
+        query = query.filter(timestamp >= start)
+    if end is not None:
+        query = query.filter(timestamp < end)
+    if after is not None:
+        query = query.filter(
+            tuple_(timestamp, model.id) > tuple_(after.last_timestamp, after.last_id)
+        )
+    return query.order_by(timestamp, model.id).execution_options(
+        stream_results=True, yield_per=EXPORT_BATCH_SIZE
+    )
+
+
+def _parquet_schema(table: str):
+    model, _ = EXPORT_TABLES[table]
+    fields = []
+    for column in model.__table__.columns:
+        if isinstance(column.type, Integer):
+            field_type = pa.int64()
+        elif isinstance(column.type, Float):
+            field_type = pa.float64()
+        elif column.type.python_type is datetime:
+            field_type = pa.timestamp("us", tz="UTC")
+        else:
+            field_type = pa.string()
+        fields.append(pa.field(column.name, field_type))
+    return pa.schema(fields)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what has been written so far."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _batches(rows, size: int) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _encode_csv(columns: list, batches) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        for row in batch:
+            writer.writerow(
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in row
+            )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _encode_ndjson(columns: list, batches) -> Iterator[bytes]:
+    for batch in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in batch
+        ).encode()
+
+
+def _encode_parquet(table: str, columns: list, batches) -> Iterator[bytes]:
+    schema = _parquet_schema(table)
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in batches:
+            writer.write_table(
+                pa.Table.from_pydict(
+                    {
+                        column: [row[index] for row in batch]
+                        for index, column in enumerate(columns)
+                    },
+                    schema=schema,
+                )
+            )
+            yield sink.drain()
+    # The footer is written when the writer closes
+    yield sink.drain()
+
+
+def check_export_format(export_format: str):
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid format. Must be one of: {', '.join(EXPORT_FORMATS)}")
+    if export_format == "parquet" and pq is None:
+        raise ValueError("Parquet exports require pyarrow to be installed")
+
+
+def export_table(
+    table: str,
+    export_format: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    watermark: Optional[str] = None,
+) -> Iterator[bytes]:
+    """
+    Export a table as a stream of encoded chunks, in (timestamp, id) order.
+
+    Rows are read from the read replica (the primary when PGREPLICAHOST is
+    unset) through a server-side cursor, so memory stays flat. Watermarked
+    exports also stop short of the replica's replay lag. With a
+    `watermark` name the export resumes after the last row the previous run
+    with that name delivered, and the watermark is advanced once the stream
+    has been fully consumed.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Invalid table. Must be one of: {', '.join(EXPORT_TABLES)}")
+    check_export_format(export_format)
+    # Naive bounds are taken as UTC
+    start, end = (
+        bound.replace(tzinfo=timezone.utc) if bound and bound.tzinfo is None else bound
+        for bound in (start, end)
+    )
+
+    after = None
+    if watermark:
+        with SessionLocal() as db:
+            after = db.get(models.ExportWatermark, watermark)
+        if after is not None and after.table_name != table:
+            raise ValueError(
+                f"Watermark {watermark} belongs to the {after.table_name} export"
+            )
+        horizon = datetime.now(timezone.utc) - timedelta(seconds=EXPORT_WATERMARK_LAG)
+        end = min(end, horizon) if end else horizon
+
+    model, timestamp = EXPORT_TABLES[table]
+    columns = [column.name for column in model.__table__.columns]
+    timestamp_index = columns.index(timestamp.key)
+    id_index = columns.index("id")
+
+    def stream() -> Iterator[bytes]:
+        last_row = None
+        exported = 0
+
+        def tracked(batches):
+            nonlocal last_row, exported
+            for batch in batches:
+                last_row = batch[-1]
+                exported += len(batch)
+                yield batch
+
+        db = ReplicaSessionLocal()
+        try:
+            query_end = end
+            if watermark:
+                # Rows the replica has not replayed yet must not fall behind
+                # the watermark, so stay behind what it has caught up to
+                replayed = db.execute(REPLAY_TIMESTAMP_SQL).scalar()
+                if replayed is not None:
+                    replica_horizon = replayed - timedelta(seconds=EXPORT_WATERMARK_LAG)
+                    query_end = min(query_end, replica_horizon)
+            rows = _export_query(db, table, start, query_end, after)
+            batches = tracked(_batches(rows, EXPORT_BATCH_SIZE))
+            if export_format == "csv":
+                yield from _encode_csv(columns, batches)
+            elif export_format == "ndjson":
+                yield from _encode_ndjson(columns, batches)
+            else:
+                yield from _encode_parquet(table, columns, batches)
+        except Exception as e:
+            logger.error(f"Error exporting {table}: {str(e)}")
+            raise
+        finally:
+            db.close()
+
+        if watermark and last_row is not None:
+            with SessionLocal() as db:
+                save_watermark(
+                    db, watermark, table, last_row[timestamp_index], last_row[id_index]
+                )
+                db.commit()
+        logger.info(f"Exported {exported} rows from {table}")
+
+    return stream()
+
+
+def save_watermark(
+    db: Session, name: str, table: str, last_timestamp: datetime, last_id: int
+):
+    """
+    Record the last (timestamp, id) a named incremental job has processed.
+    Runs in the caller's transaction, so the position commits with the work.
+    """
+    statement = pg_insert(models.ExportWatermark).values(
+        name=name,
+        table_name=table,
+        last_timestamp=last_timestamp,
+        last_id=last_id,
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[models.ExportWatermark.name],
+            set_={
+                "last_timestamp": statement.excluded.last_timestamp,
+                "last_id": statement.excluded.last_id,
+                "updated_at": datetime.now(timezone.utc),
+            },
+        )
+    )
+
+
+def fold_new_rows(
+    db: Session,
+    name: str,
+    table: str,
+    statement,
+    fold: Callable[[Session, list], None],
+    batch_size: int,
+    lock_key: int,
+) -> int:
+    """
+    Feed the rows added since watermark `name` to `fold`, batch by batch.
+
+    `statement` selects rows after (:last_timestamp, :last_id) and before
+    :horizon in (created_at, id) order, LIMIT :batch_size. Each batch
+    commits together with the watermark, so every row is folded in exactly
+    once, and stops EXPORT_WATERMARK_LAG seconds before now so rows from
+    transactions still in flight are not skipped. An advisory lock on
+    `lock_key` keeps runs from overlapping. Returns the number of rows.
+    """
+    horizon = datetime.now(timezone.utc) - timedelta(seconds=EXPORT_WATERMARK_LAG)
+    total = 0
+    while True:
+        locked = db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": lock_key}
+        ).scalar()
+        if not locked:
+            db.rollback()
+            logger.info(f"{name} is already running elsewhere")
+            return total
+
+        watermark = db.get(models.ExportWatermark, name)
+        rows = db.execute(
+            statement,
+            {
+                "last_timestamp": watermark.last_timestamp if watermark else _EPOCH,
+                "last_id": watermark.last_id if watermark else 0,
+                "horizon": horizon,
+                "batch_size": batch_size,
+            },
+        ).all()
+        if rows:
+            fold(db, rows)
+            save_watermark(db, name, table, rows[-1].created_at, rows[-1].id)
+        db.commit()
+
+        total += len(rows)
+        if len(rows) < batch_size:
+            return total
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export gameplay data")
+    parser.add_argument("table", choices=EXPORT_TABLES)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--start", type=datetime.fromisoformat)
+    parser.add_argument("--end", type=datetime.fromisoformat)
+    parser.add_argument("--watermark", help="Resume from and advance this watermark")
+    parser.add_argument("--output", help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    chunks = export_table(args.table, args.format, args.start, args.end, args.watermark)
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
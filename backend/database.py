@@ -20,4 +20,18 @@ SQLALCHEMY_DATABASE_URL = (
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional read replica for heavy reads such as data exports
+PGREPLICAHOST = os.getenv("PGREPLICAHOST")
+
+replica_engine = (
+    create_engine(
+        f"postgresql://{PGUSER}:{PGPASSWORD}@{PGREPLICAHOST}/{PGDATABASE}?sslmode=require"
+    )
+    if PGREPLICAHOST
+    else engine
+)
+ReplicaSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=replica_engine
+)
+
 Base = declarative_base()
@@ -0,0 +1,253 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, UnidentifiedImageError
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+from utils import calculate_distance
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the index is reloaded to pick up writes made by other workers
+DUPLICATE_INDEX_TTL = int(os.getenv("DUPLICATE_INDEX_TTL", 300))
+# Submissions closer than this (in meters) to another photo are candidates
+DUPLICATE_RADIUS_M = float(os.getenv("DUPLICATE_RADIUS_M", 150))
+# Share of matching hash bits above which two photos are flagged as the same
+DUPLICATE_IMAGE_SIMILARITY = float(os.getenv("DUPLICATE_IMAGE_SIMILARITY", 0.85))
+# Geohash cells of precision 6 are about 1.2 x 0.6 km, so a cell and its
+# neighbours always cover DUPLICATE_RADIUS_M
+GEOHASH_PRECISION = 6
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_HASH_BITS = 64
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    value = bits = 0
+    even = True
+    while len(geohash) < precision:
+        coordinate, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            geohash.append(_BASE32[value])
+            value = bits = 0
+    return "".join(geohash)
+
+
+def _cell_size(precision: int) -> Tuple[float, float]:
+    """Height and width in degrees of a geohash cell."""
+    total_bits = 5 * precision
+    lat_bits = total_bits // 2
+    lon_bits = total_bits - lat_bits
+    return 180.0 / 2**lat_bits, 360.0 / 2**lon_bits
+
+
+def geohash_neighbourhood(
+    latitude: float, longitude: float, precision: int = GEOHASH_PRECISION
+) -> set:
+    """The geohash cell of a point and the eight cells around it."""
+    cell_height, cell_width = _cell_size(precision)
+    cells = set()
+    for lat_step in (-1, 0, 1):
+        for lon_step in (-1, 0, 1):
+            lat = min(90.0, max(-90.0, latitude + lat_step * cell_height))
+            lon = (longitude + lon_step * cell_width + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(lat, lon, precision))
+    return cells
+
+
+def image_dhash(path) -> Optional[int]:
+    """
+    64-bit difference hash of an image: each bit tells whether a pixel of
+    the 9x8 grayscale thumbnail is brighter than its right-hand neighbour.
+    Re-encoded, resized or slightly recoloured copies hash (nearly) alike.
+    Returned as a signed integer so it fits a BIGINT column.
+    """
+    try:
+        with Image.open(path) as image:
+            pixels = list(
+                image.convert("L").resize((9, 8), Image.Resampling.LANCZOS).getdata()
+            )
+    except (UnidentifiedImageError, OSError) as e:
+        logger.warning(f"Could not hash image {path}: {str(e)}")
+        return None
+
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            right = pixels[row * 9 + column + 1]
+            value = (value << 1) | (left > right)
+    return value - (1 << _HASH_BITS) if value >= 1 << (_HASH_BITS - 1) else value
+
+
+def image_similarity(first: Optional[int], second: Optional[int]) -> Optional[float]:
+    if first is None or second is None:
+        return None
+    differing = bin((first ^ second) & ((1 << _HASH_BITS) - 1)).count("1")
+    return 1 - differing / _HASH_BITS
+
+
+class NearDuplicateIndex:
+    """
+    In-process geohash grid over locations and pending submissions.
+
+    Every photo is bucketed by its geohash cell, so finding the photos near
+    a point reads nine buckets instead of scanning the tables. Writes in
+    this process update the index directly; writes made by other workers
+    are picked up when the index expires.
+    """
+
+    def __init__(self, ttl: int = DUPLICATE_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cells: Dict[str, Dict[Tuple[str, int], tuple]] = {}
+        self._entries: Dict[Tuple[str, int], str] = {}
+        self._loaded_at = 0.0
+
+    def _load(self, db: Session):
+        self._cells = {}
+        self._entries = {}
+        locations = db.query(
+            models.Location.id,
+            models.Location.latitude,
+            models.Location.longitude,
+            models.Location.image_hash,
+        )
+        pending = db.query(
+            models.PendingLocation.id,
+            models.PendingLocation.latitude,
+            models.PendingLocation.longitude,
+            models.PendingLocation.image_hash,
+        ).filter(models.PendingLocation.status == "pending")
+        for kind, rows in (("location", locations), ("pending", pending)):
+            for row in rows:
+                self._add(kind, row.id, row.latitude, row.longitude, row.image_hash)
+        self._loaded_at = time.monotonic()
+        logger.info(f"Loaded duplicate index with {len(self._entries)} photos")
+
+    def _ensure_loaded(self, db: Session):
+        if time.monotonic() - self._loaded_at > self.ttl:
+            self._load(db)
+
+    def _add(self, kind, entry_id, latitude, longitude, image_hash):
+        self._remove(kind, entry_id)
+        cell = geohash_encode(latitude, longitude, GEOHASH_PRECISION)
+        self._cells.setdefault(cell, {})[(kind, entry_id)] = (
+            latitude,
+            longitude,
+            image_hash,
+        )
+        self._entries[(kind, entry_id)] = cell
+
+    def _remove(self, kind, entry_id):
+        cell = self._entries.pop((kind, entry_id), None)
+        if cell is not None:
+            self._cells[cell].pop((kind, entry_id), None)
+
+    def add(
+        self,
+        kind: str,
+        entry_id: int,
+        latitude: float,
+        longitude: float,
+        image_hash: Optional[int],
+    ):
+        """Record a created or edited location ("location") or submission ("pending")."""
+        with self._lock:
+            self._add(kind, entry_id, latitude, longitude, image_hash)
+
+    def remove(self, kind: str, entry_id: int):
+        with self._lock:
+            self._remove(kind, entry_id)
+
+    def find(
+        self,
+        db: Session,
+        latitude: float,
+        longitude: float,
+        image_hash: Optional[int],
+        exclude: Optional[Tuple[str, int]] = None,
+    ) -> List[dict]:
+        """
+        Photos within DUPLICATE_RADIUS_M of a point, nearest first, with their
+        distance and image similarity. Those whose image is at least
+        DUPLICATE_IMAGE_SIMILARITY alike are flagged as likely duplicates.
+        """
+        with self._lock:
+            self._ensure_loaded(db)
+            nearby = [
+                (key, entry)
+                for cell in geohash_neighbourhood(latitude, longitude)
+                for key, entry in self._cells.get(cell, {}).items()
+                if key != exclude
+            ]
+
+        candidates = []
+        for (kind, entry_id), (lat, lon, other_hash) in nearby:
+            distance_m = calculate_distance(latitude, longitude, lat, lon) * 1000
+            if distance_m > DUPLICATE_RADIUS_M:
+                continue
+            similarity = image_similarity(image_hash, other_hash)
+            candidates.append(
+                {
+                    "kind": kind,
+                    "id": entry_id,
+                    "distance_m": round(distance_m, 1),
+                    "image_similarity": similarity,
+                    "likely_duplicate": similarity is not None
+                    and similarity >= DUPLICATE_IMAGE_SIMILARITY,
+                }
+            )
+        candidates.sort(key=lambda candidate: candidate["distance_m"])
+        return candidates
+
+    def annotate(self, db: Session, pending_locations: list) -> list:
+        """Attach duplicate candidates to pending locations for the moderation API."""
+        for pending in pending_locations:
+            pending.duplicates = self.find(
+                db,
+                pending.latitude,
+                pending.longitude,
+                pending.image_hash,
+                exclude=("pending", pending.id),
+            )
+        return pending_locations
+
+
+def backfill_image_hashes(db: Session, images_dir: str = "images") -> int:
+    """Hash the photos of locations and submissions stored before hashing existed."""
+    hashed = 0
+    for model in (models.Location, models.PendingLocation):
+        for row in db.query(model).filter(model.image_hash.is_(None)):
+            row.image_hash = image_dhash(os.path.join(images_dir, row.image_url))
+            hashed += row.image_hash is not None
+        db.commit()
+    return hashed
+
+
+duplicate_index = NearDuplicateIndex()
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        print(f"Hashed {backfill_image_hashes(db)} images")
+    finally:
+        db.close()
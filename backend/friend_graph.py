@@ -0,0 +1,84 @@
+import os
+import threading
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+from cachetools import TTLCache
+from sqlalchemy.orm import Session
+
+import models
+
+# Friend sets are cached per user for this many seconds; writes in this
+# process invalidate them directly, writes from other workers expire
+FRIEND_GRAPH_TTL = int(os.getenv("FRIEND_GRAPH_TTL", 300))
+FRIEND_GRAPH_SIZE = int(os.getenv("FRIEND_GRAPH_SIZE", 10000))
+
+_cache = TTLCache(maxsize=FRIEND_GRAPH_SIZE, ttl=FRIEND_GRAPH_TTL)
+_lock = threading.Lock()
+
+
+def _load(db: Session, user_ids: Iterable[int]) -> dict:
+    """Read the friend sets of several users in one query and cache them."""
+    friend_sets = {user_id: set() for user_id in user_ids}
+    if not friend_sets:
+        return {}
+    rows = db.query(models.Friends.user_id, models.Friends.friend_id).filter(
+        models.Friends.user_id.in_(friend_sets)
+    )
+    for user_id, friend_id in rows:
+        friend_sets[user_id].add(friend_id)
+
+    loaded = {user_id: frozenset(friends) for user_id, friends in friend_sets.items()}
+    with _lock:
+        _cache.update(loaded)
+    return loaded
+
+
+def get_friend_ids_many(db: Session, user_ids: Iterable[int]) -> dict:
+    """Friend sets of several users, loading the uncached ones together."""
+    found = {}
+    missing = []
+    with _lock:
+        for user_id in set(user_ids):
+            friends = _cache.get(user_id)
+            if friends is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = friends
+    found.update(_load(db, missing))
+    return found
+
+
+def get_friend_ids(db: Session, user_id: int) -> frozenset:
+    """Ids of the users `user_id` has added as friends."""
+    return get_friend_ids_many(db, [user_id])[user_id]
+
+
+def are_friends(db: Session, user_id: int, other_id: int) -> bool:
+    return other_id in get_friend_ids(db, user_id)
+
+
+def mutual_friends(db: Session, user_id: int, other_id: int) -> frozenset:
+    """Users both `user_id` and `other_id` have added as friends."""
+    friend_sets = get_friend_ids_many(db, [user_id, other_id])
+    return friend_sets[user_id] & friend_sets[other_id]
+
+
+def suggest_friends(db: Session, user_id: int, limit: int) -> List[Tuple[int, int]]:
+    """
+    Friends of friends that the user has not added yet, as (user id, number
+    of friends in common), most shared friends first.
+    """
+    friends = get_friend_ids(db, user_id)
+    candidates = Counter()
+    for friend_set in get_friend_ids_many(db, friends).values():
+        candidates.update(friend_set)
+    for excluded in friends | {user_id}:
+        candidates.pop(excluded, None)
+    return sorted(candidates.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def invalidate(user_id: int):
+    """Drop a user's cached friend set after it changed."""
+    with _lock:
+        _cache.pop(user_id, None)
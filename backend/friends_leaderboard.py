@@ -0,0 +1,154 @@
+import heapq
+import os
+import threading
+from typing import Iterable, List
+
+from cachetools import TTLCache
+from sqlalchemy.orm import Session
+
+import friend_graph
+import models
+
+# Ranked friend leaderboards are cached per viewer for this many seconds;
+# a new best of anyone on a cached board invalidates it right away
+FRIENDS_LEADERBOARD_TTL = int(os.getenv("FRIENDS_LEADERBOARD_TTL", 300))
+FRIENDS_LEADERBOARD_CACHE_SIZE = int(os.getenv("FRIENDS_LEADERBOARD_CACHE_SIZE", 10000))
+# Entries kept on each board
+FRIENDS_LEADERBOARD_SIZE = 100
+
+# user id -> (username, best session score)
+_bests = TTLCache(
+    maxsize=FRIENDS_LEADERBOARD_CACHE_SIZE * 10, ttl=FRIENDS_LEADERBOARD_TTL
+)
+# user id -> viewers whose cached board includes the user
+_watchers = {}
+_lock = threading.Lock()
+
+
+def _unwatch(viewer_id: int, members: Iterable[int]):
+    for member_id in members:
+        viewers = _watchers.get(member_id)
+        if viewers is not None:
+            viewers.discard(viewer_id)
+            if not viewers:
+                del _watchers[member_id]
+
+
+class _BoardCache(TTLCache):
+    """Board cache that drops a board's watcher entries when it is evicted."""
+
+    def popitem(self):
+        viewer_id, board = super().popitem()
+        _unwatch(viewer_id, board[0])
+        return viewer_id, board
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for viewer_id, (members, _) in expired:
+            _unwatch(viewer_id, members)
+        return expired
+
+
+# viewer id -> (board members, ranked entries)
+_boards = _BoardCache(
+    maxsize=FRIENDS_LEADERBOARD_CACHE_SIZE, ttl=FRIENDS_LEADERBOARD_TTL
+)
+
+
+def _drop_board(viewer_id: int):
+    cached = _boards.pop(viewer_id, None)
+    if cached is not None:
+        _unwatch(viewer_id, cached[0])
+
+
+def _get_bests(db: Session, user_ids: Iterable[int]) -> dict:
+    """Best session score per user, reading the uncached ones in one query."""
+    found = {}
+    missing = []
+    with _lock:
+        for user_id in user_ids:
+            best = _bests.get(user_id)
+            if best is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = best
+
+    if missing:
+        rows = (
+            db.query(
+                models.User.id,
+                models.User.username,
+                models.Leaderboard.highest_score,
+            )
+            .outerjoin(models.Leaderboard, models.Leaderboard.user_id == models.User.id)
+            .filter(models.User.id.in_(missing))
+        )
+        loaded = {row.id: (row.username, row.highest_score or 0) for row in rows}
+        with _lock:
+            _bests.update(loaded)
+        found.update(loaded)
+    return found
+
+
+def _rank(user_id: int, bests: dict) -> List[dict]:
+    top = heapq.nlargest(
+        FRIENDS_LEADERBOARD_SIZE,
+        bests.items(),
+        key=lambda item: (item[1][1], -item[0]),
+    )
+    entries = []
+    for position, (member_id, (username, score)) in enumerate(top, start=1):
+        # Equal scores share a rank
+        rank = (
+            entries[-1]["rank"]
+            if entries and entries[-1]["score"] == score
+            else position
+        )
+        entries.append(
+            {
+                "rank": rank,
+                "user_id": member_id,
+                "username": username,
+                "score": score,
+                "is_current_user": member_id == user_id,
+            }
+        )
+    return entries
+
+
+def get_friends_leaderboard(db: Session, user_id: int, limit: int) -> List[dict]:
+    """
+    The user and their friends ranked by best session score.
+
+    Friend ids come from the cached friend graph and scores from the cached
+    per-user bests, so a warm board needs no query at all.
+    """
+    with _lock:
+        cached = _boards.get(user_id)
+    if cached is not None:
+        return cached[1][:limit]
+
+    members = friend_graph.get_friend_ids(db, user_id) | {user_id}
+    board = _rank(user_id, _get_bests(db, members))
+    with _lock:
+        _drop_board(user_id)
+        _boards[user_id] = (members, board)
+        for member_id in members:
+            _watchers.setdefault(member_id, set()).add(user_id)
+    return board[:limit]
+
+
+def record_best(user_id: int, score: int):
+    """Note a user's new best score and drop every board that shows them."""
+    with _lock:
+        cached = _bests.get(user_id)
+        if cached is not None:
+            _bests[user_id] = (cached[0], max(cached[1], score))
+        for viewer_id in list(_watchers.get(user_id, ())):
+            _drop_board(viewer_id)
+
+
+def invalidate(user_id: int):
+    """Drop a viewer's board after their friend list changed."""
+    with _lock:
+        _drop_board(user_id)
@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import logging
+import os
+from typing import Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import models
+from data_export import fold_new_rows
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Web Mercator zoom of the heatmap tiles; 7 splits the world into 128 x 128
+# tiles (about 300 km wide at the equator). Changing it needs a --rebuild.
+HEATMAP_ZOOM = int(os.getenv("HEATMAP_ZOOM", 7))
+# Scores binned per transaction
+HEATMAP_BATCH_SIZE = int(os.getenv("HEATMAP_BATCH_SIZE", 20000))
+# Seconds between heatmap updates inside the API process (0 disables)
+HEATMAP_INTERVAL = int(os.getenv("HEATMAP_INTERVAL", 300))
+
+# Watermark (in export_watermarks) of the last score binned
+HEATMAP_WATERMARK = "guess_heatmaps"
+# Key of the advisory lock that keeps heatmap runs from overlapping
+_HEATMAP_LOCK_KEY = 49_001
+# Latitude limit of the Web Mercator projection
+_MAX_LATITUDE = 85.05112878
+
+NEW_GUESSES_SQL = text(
+    """
+    SELECT s.id, s.location_id, s.guess_latitude, s.guess_longitude, s.created_at
+    FROM scores s
+    JOIN locations l ON l.id = s.location_id
+    WHERE (s.created_at, s.id) > (:last_timestamp, :last_id)
+    AND s.created_at < :horizon
+    ORDER BY s.created_at, s.id
+    LIMIT :batch_size
+    """
+)
+
+
+def tile_cells(latitudes: np.ndarray, longitudes: np.ndarray, zoom: int) -> np.ndarray:
+    """Tile number (y * 2^zoom + x) of every point."""
+    size = 1 << zoom
+    # Map clicks on a wrapped copy of the world can fall outside +-180
+    longitudes = (longitudes + 180.0) % 360.0 - 180.0
+    latitudes = np.radians(np.clip(latitudes, -_MAX_LATITUDE, _MAX_LATITUDE))
+    x = np.floor((longitudes + 180.0) / 360.0 * size)
+    y = np.floor((1.0 - np.arcsinh(np.tan(latitudes)) / np.pi) / 2.0 * size)
+    x = np.clip(x, 0, size - 1).astype(np.int64)
+    y = np.clip(y, 0, size - 1).astype(np.int64)
+    return y * size + x
+
+
+def bin_guesses(
+    location_ids: np.ndarray, latitudes: np.ndarray, longitudes: np.ndarray, zoom: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Count guesses per (location, tile). Returns parallel arrays of location
+    ids, tile numbers and counts, sorted by location and then tile.
+    """
+    tiles = 1 << (2 * zoom)
+    keys = location_ids.astype(np.int64) * tiles + tile_cells(
+        latitudes, longitudes, zoom
+    )
+    keys, counts = np.unique(keys, return_counts=True)
+    return keys // tiles, keys % tiles, counts
+
+
+def merge_cells(
+    cells: np.ndarray, counts: np.ndarray, new_cells: np.ndarray, new_counts: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Add two sparse heatmaps together."""
+    merged_cells, positions = np.unique(
+        np.concatenate([cells, new_cells]), return_inverse=True
+    )
+    merged_counts = np.zeros(len(merged_cells), dtype=np.int64)
+    np.add.at(merged_counts, positions, np.concatenate([counts, new_counts]))
+    return merged_cells, merged_counts
+
+
+def _fold(db: Session, rows: list):
+    """Bin a batch of guesses and merge them into the stored heatmaps."""
+    location_ids, cells, counts = bin_guesses(
+        np.fromiter((row.location_id for row in rows), dtype=np.int64, count=len(rows)),
+        np.fromiter(
+            (row.guess_latitude for row in rows), dtype=np.float64, count=len(rows)
+        ),
+        np.fromiter(
+            (row.guess_longitude for row in rows), dtype=np.float64, count=len(rows)
+        ),
+        HEATMAP_ZOOM,
+    )
+    # Rows of each location form one run, since the keys came back sorted
+    locations, starts = np.unique(location_ids, return_index=True)
+    ends = np.append(starts[1:], len(location_ids))
+
+    existing = {
+        heatmap.location_id: heatmap
+        for heatmap in db.query(models.LocationHeatmap)
+        .filter(models.LocationHeatmap.location_id.in_(locations.tolist()))
+        .with_for_update()
+    }
+    for location_id, start, end in zip(locations.tolist(), starts, ends):
+        new_cells, new_counts = cells[start:end], counts[start:end]
+        heatmap = existing.get(location_id)
+        if heatmap is None:
+            heatmap = models.LocationHeatmap(
+                location_id=location_id, zoom=HEATMAP_ZOOM, total_guesses=0
+            )
+            db.add(heatmap)
+        else:
+            new_cells, new_counts = merge_cells(
+                np.array(heatmap.cells, dtype=np.int64),
+                np.array(heatmap.counts, dtype=np.int64),
+                new_cells,
+                new_counts,
+            )
+        heatmap.cells = new_cells.tolist()
+        heatmap.counts = new_counts.tolist()
+        heatmap.total_guesses = int(new_counts.sum())
+
+
+def update_heatmaps(db: Session, batch_size: int = HEATMAP_BATCH_SIZE) -> int:
+    """
+    Bin the guesses recorded since the last run into the location heatmaps,
+    without rescanning what earlier runs have seen. Returns the number of
+    guesses binned.
+    """
+    total = fold_new_rows(
+        db,
+        HEATMAP_WATERMARK,
+        "scores",
+        NEW_GUESSES_SQL,
+        _fold,
+        batch_size,
+        _HEATMAP_LOCK_KEY,
+    )
+    logger.info(f"Binned {total} guesses into heatmaps")
+    return total
+
+
+def rebuild_heatmaps(db: Session) -> int:
+    """Drop every heatmap and bin all guesses again (after changing HEATMAP_ZOOM)."""
+    db.query(models.LocationHeatmap).delete()
+    db.query(models.ExportWatermark).filter(
+        models.ExportWatermark.name == HEATMAP_WATERMARK
+    ).delete()
+    db.commit()
+    return update_heatmaps(db)
+
+
+def get_heatmap(db: Session, location_id: int) -> dict:
+    """The stored heatmap of a location; empty if nobody has guessed it yet."""
+    heatmap = db.get(models.LocationHeatmap, location_id)
+    if heatmap is None:
+        return {
+            "location_id": location_id,
+            "zoom": HEATMAP_ZOOM,
+            "total_guesses": 0,
+            "cells": [],
+            "counts": [],
+        }
+    return heatmap
+
+
+def run_heatmap_update() -> int:
+    db = SessionLocal()
+    try:
+        return update_heatmaps(db)
+    finally:
+        db.close()
+
+
+async def run_periodic_heatmap_updates(interval: int = HEATMAP_INTERVAL):
+    """Bin new guesses every `interval` seconds without blocking the event loop."""
+    while True:
+        try:
+            await asyncio.to_thread(run_heatmap_update)
+        except Exception as e:
+            logger.error(f"Error updating guess heatmaps: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Update the guess heatmaps")
+    parser.add_argument(
+        "--rebuild", action="store_true", help="Drop the heatmaps and bin every guess"
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        binned = rebuild_heatmaps(db) if args.rebuild else update_heatmaps(db)
+        print(f"Binned {binned} guesses")
+    finally:
+        db.close()
@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import text
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# How long (in seconds) a stored response can be replayed
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 24 * 60 * 60))
+# Seconds after which a key whose request never finished (its worker died)
+# can be claimed again
+IDEMPOTENCY_IN_FLIGHT_TIMEOUT = int(os.getenv("IDEMPOTENCY_IN_FLIGHT_TIMEOUT", 300))
+# Seconds between deletions of expired keys (0 disables)
+IDEMPOTENCY_PRUNE_INTERVAL = int(os.getenv("IDEMPOTENCY_PRUNE_INTERVAL", 60 * 60))
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+# Write endpoints that clients retry on timeouts
+IDEMPOTENT_ROUTES = [
+    ("POST", re.compile(r"^/submit-guess/?$")),
+    ("POST", re.compile(r"^/challenges/\d+/submit-guess/?$")),
+    ("PUT", re.compile(r"^/game-sessions/\d+/end/?$")),
+]
+
+_IN_FLIGHT = object()
+
+# Inserts the key, or takes over one that has expired or whose request was
+# abandoned; a returned row means the caller owns the key
+CLAIM_KEY_SQL = text(
+    """
+    INSERT INTO idempotency_keys AS k (key) VALUES (:key)
+    ON CONFLICT (key) DO UPDATE SET
+        status_code = NULL, body = NULL, media_type = NULL, created_at = now()
+    WHERE k.created_at < now() - make_interval(secs => :ttl)
+    OR (k.status_code IS NULL AND k.created_at < now() - make_interval(secs => :timeout))
+    RETURNING key
+    """
+)
+
+STORED_RESPONSE_SQL = text(
+    "SELECT status_code, body, media_type FROM idempotency_keys WHERE key = :key"
+)
+
+SAVE_RESPONSE_SQL = text(
+    """
+    UPDATE idempotency_keys
+    SET status_code = :status_code, body = :body, media_type = :media_type
+    WHERE key = :key
+    """
+)
+
+RELEASE_KEY_SQL = text(
+    "DELETE FROM idempotency_keys WHERE key = :key AND status_code IS NULL"
+)
+
+PRUNE_KEYS_SQL = text(
+    "DELETE FROM idempotency_keys WHERE created_at < now() - make_interval(secs => :ttl)"
+)
+
+
+class IdempotencyStore:
+    """
+    Responses keyed by a digest of the caller's credentials, the route and
+    the Idempotency-Key header, kept in the idempotency_keys table so a
+    retry is recognised whichever worker it reaches. A key is claimed with
+    an INSERT before the endpoint runs, so only one of two concurrent
+    requests with the same key gets to run it.
+    """
+
+    def __init__(
+        self,
+        ttl: int = IDEMPOTENCY_KEY_TTL,
+        in_flight_timeout: int = IDEMPOTENCY_IN_FLIGHT_TIMEOUT,
+    ):
+        self.ttl = ttl
+        self.in_flight_timeout = in_flight_timeout
+
+    def _execute(self, statement, params: dict):
+        db = SessionLocal()
+        try:
+            result = db.execute(statement, params).first()
+            db.commit()
+            return result
+        finally:
+            db.close()
+
+    def reserve(self, key: str):
+        """
+        Claim a key. Returns the stored (status, body, media type) for a
+        replay, _IN_FLIGHT while the first request is still running, or None
+        when the caller now owns the key.
+        """
+        claimed = self._execute(
+            CLAIM_KEY_SQL,
+            {"key": key, "ttl": self.ttl, "timeout": self.in_flight_timeout},
+        )
+        if claimed is not None:
+            return None
+        stored = self._execute(STORED_RESPONSE_SQL, {"key": key})
+        # Released in between: the other request failed and its caller retries
+        if stored is None or stored.status_code is None:
+            return _IN_FLIGHT
+        return stored.status_code, bytes(stored.body), stored.media_type
+
+    def save(self, key: str, status_code: int, body: bytes, media_type: str):
+        self._execute(
+            SAVE_RESPONSE_SQL,
+            {
+                "key": key,
+                "status_code": status_code,
+                "body": body,
+                "media_type": media_type,
+            },
+        )
+
+    def release(self, key: str):
+        """Forget a key whose request failed, so a retry runs again."""
+        self._execute(RELEASE_KEY_SQL, {"key": key})
+
+    def prune(self) -> int:
+        """Delete the keys that can no longer be replayed."""
+        db = SessionLocal()
+        try:
+            deleted = db.execute(PRUNE_KEYS_SQL, {"ttl": self.ttl}).rowcount
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+
+async def run_periodic_pruning(
+    store: IdempotencyStore, interval: int = IDEMPOTENCY_PRUNE_INTERVAL
+):
+    """Delete expired keys every `interval` seconds without blocking the event loop."""
+    while True:
+        try:
+            deleted = await asyncio.to_thread(store.prune)
+            logger.info(f"Pruned {deleted} expired idempotency keys")
+        except Exception as e:
+            logger.error(f"Error pruning idempotency keys: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+def _store_key(request, idempotency_key: str) -> str:
+    # Hash the credentials so replays never need a user lookup
+    digest = hashlib.sha256()
+    for part in (
+        request.headers.get("authorization", ""),
+        request.method,
+        request.url.path,
+        idempotency_key,
+    ):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    """
+    Replay the stored response for retried guess and session writes.
+
+    Requests to IDEMPOTENT_ROUTES that carry an Idempotency-Key header are
+    answered from the store without running the endpoint when the same
+    caller already used the key.
+    Server errors are not stored, so those requests can be retried.
+    """
+
+    def __init__(self, app, store: IdempotencyStore = None):
+        super().__init__(app)
+        self.store = store or idempotency_store
+
+    async def dispatch(self, request, call_next):
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not idempotency_key or not any(
+            request.method == method and pattern.match(request.url.path)
+            for method, pattern in IDEMPOTENT_ROUTES
+        ):
+            return await call_next(request)
+
+        key = _store_key(request, idempotency_key)
+        stored = await asyncio.to_thread(self.store.reserve, key)
+        if stored is _IN_FLIGHT:
+            return JSONResponse(
+                status_code=409,
+                content={
+                    "detail": "A request with this Idempotency-Key is in progress"
+                },
+            )
+        if stored is not None:
+            status_code, body, media_type = stored
+            return Response(
+                content=body,
+                status_code=status_code,
+                media_type=media_type,
+                headers={"Idempotent-Replayed": "true"},
+            )
+
+        try:
+            response = await call_next(request)
+        except Exception:
+            await asyncio.to_thread(self.store.release, key)
+            raise
+
+        if response.status_code >= 500:
+            await asyncio.to_thread(self.store.release, key)
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        await asyncio.to_thread(
+            self.store.save,
+            key,
+            response.status_code,
+            body,
+            response.headers.get("content-type"),
+        )
+        return Response(
+            content=body,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+        )
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import math
+import os
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import models
+from data_export import fold_new_rows
+from database import SessionLocal
+from utils import calculate_distance
+
+logger = logging.getLogger(__name__)
+
+# Scores folded into the statistics per transaction
+CALIBRATION_BATCH_SIZE = int(os.getenv("CALIBRATION_BATCH_SIZE", 5000))
+# Seconds between calibration runs inside the API process (0 disables)
+CALIBRATION_INTERVAL = int(os.getenv("CALIBRATION_INTERVAL", 300))
+# Guesses a location needs before it gets an empirical difficulty
+CALIBRATION_MIN_GUESSES = int(os.getenv("CALIBRATION_MIN_GUESSES", 20))
+# Median guess distance (km) up to which a location counts as easy / medium
+CALIBRATION_EASY_MAX_KM = float(os.getenv("CALIBRATION_EASY_MAX_KM", 500))
+CALIBRATION_MEDIUM_MAX_KM = float(os.getenv("CALIBRATION_MEDIUM_MAX_KM", 1500))
+
+# Watermark (in export_watermarks) of the last score folded in
+CALIBRATION_WATERMARK = "location_calibration"
+# Key of the advisory lock that keeps calibration runs from overlapping
+_CALIBRATION_LOCK_KEY = 48_001
+
+# Distance sketch layout: bucket 0 holds guesses within SKETCH_MIN_KM, bucket
+# i covers (SKETCH_MIN_KM * gamma^(i-1), SKETCH_MIN_KM * gamma^i], so any
+# quantile is read back within about 2.5% of the true distance
+SKETCH_MIN_KM = 0.1
+SKETCH_GAMMA = 1.05
+SKETCH_MAX_KM = 20040  # Half the earth's circumference
+SKETCH_BUCKETS = (
+    int(math.log(SKETCH_MAX_KM / SKETCH_MIN_KM) / math.log(SKETCH_GAMMA)) + 2
+)
+
+NEW_SCORES_SQL = text(
+    """
+    SELECT s.id, s.location_id, s.score, s.guess_latitude, s.guess_longitude,
+           s.created_at, l.latitude, l.longitude
+    FROM scores s
+    JOIN locations l ON l.id = s.location_id
+    WHERE (s.created_at, s.id) > (:last_timestamp, :last_id)
+    AND s.created_at < :horizon
+    ORDER BY s.created_at, s.id
+    LIMIT :batch_size
+    """
+)
+
+
+class DistanceSketch:
+    """
+    Log-bucketed histogram of guess distances.
+
+    Two sketches merge by adding their bucket counts, so statistics built
+    from separate batches of scores combine exactly as if they had been
+    built from all of them at once.
+    """
+
+    def __init__(self, counts: Optional[Iterable[int]] = None):
+        self.counts = list(counts or [])
+        self.counts.extend([0] * (SKETCH_BUCKETS - len(self.counts)))
+
+    @staticmethod
+    def bucket(distance_km: float) -> int:
+        if distance_km <= SKETCH_MIN_KM:
+            return 0
+        index = 1 + int(math.log(distance_km / SKETCH_MIN_KM) / math.log(SKETCH_GAMMA))
+        return min(index, SKETCH_BUCKETS - 1)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def add(self, distance_km: float):
+        self.counts[self.bucket(distance_km)] += 1
+
+    def merge(self, other: "DistanceSketch"):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Distance below which a share `q` of the guesses fall."""
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen > rank:
+                break
+        if index == 0:
+            return SKETCH_MIN_KM / 2
+        # Point of the bucket with the same relative error to both bounds
+        lower = SKETCH_MIN_KM * SKETCH_GAMMA ** (index - 1)
+        return lower * 2 * SKETCH_GAMMA / (SKETCH_GAMMA + 1)
+
+
+def empirical_difficulty(guess_count: int, median_distance_km: Optional[float]):
+    if guess_count < CALIBRATION_MIN_GUESSES or median_distance_km is None:
+        return None
+    if median_distance_km <= CALIBRATION_EASY_MAX_KM:
+        return models.DifficultyLevel.EASY.value
+    if median_distance_km <= CALIBRATION_MEDIUM_MAX_KM:
+        return models.DifficultyLevel.MEDIUM.value
+    return models.DifficultyLevel.HARD.value
+
+
+def _fold(db: Session, rows: list):
+    """Merge a batch of scores into the per-location statistics."""
+    partials = {}
+    for row in rows:
+        partial = partials.setdefault(
+            row.location_id,
+            {"sketch": DistanceSketch(), "guesses": 0, "distance": 0.0, "score": 0},
+        )
+        distance = calculate_distance(
+            row.guess_latitude, row.guess_longitude, row.latitude, row.longitude
+        )
+        partial["sketch"].add(distance)
+        partial["guesses"] += 1
+        partial["distance"] += distance
+        partial["score"] += row.score
+
+    existing = {
+        stats.location_id: stats
+        for stats in db.query(models.LocationDifficultyStats)
+        .filter(models.LocationDifficultyStats.location_id.in_(partials))
+        .with_for_update()
+    }
+    for location_id, partial in partials.items():
+        stats = existing.get(location_id)
+        if stats is None:
+            stats = models.LocationDifficultyStats(
+                location_id=location_id,
+                guess_count=0,
+                total_distance_km=0.0,
+                total_score=0,
+            )
+            db.add(stats)
+
+        sketch = DistanceSketch(stats.distance_sketch)
+        sketch.merge(partial["sketch"])
+        stats.distance_sketch = sketch.counts
+        stats.guess_count += partial["guesses"]
+        stats.total_distance_km += partial["distance"]
+        stats.total_score += partial["score"]
+        stats.median_distance_km = sketch.quantile(0.5)
+        stats.empirical_difficulty = empirical_difficulty(
+            stats.guess_count, stats.median_distance_km
+        )
+
+
+def calibrate_locations(db: Session, batch_size: int = CALIBRATION_BATCH_SIZE) -> int:
+    """
+    Fold the scores recorded since the last run into the location statistics,
+    without rescanning what earlier runs have seen. Returns the number of
+    scores folded in.
+    """
+    total = fold_new_rows(
+        db,
+        CALIBRATION_WATERMARK,
+        "scores",
+        NEW_SCORES_SQL,
+        _fold,
+        batch_size,
+        _CALIBRATION_LOCK_KEY,
+    )
+    logger.info(f"Location calibration folded in {total} scores")
+    return total
+
+
+def get_location_calibration(db: Session, location_id: int) -> Optional[dict]:
+    """Guess statistics and empirical difficulty of a location, None if it does not exist."""
+    row = (
+        db.query(models.Location.difficulty_level, models.LocationDifficultyStats)
+        .outerjoin(
+            models.LocationDifficultyStats,
+            models.LocationDifficultyStats.location_id == models.Location.id,
+        )
+        .filter(models.Location.id == location_id)
+        .first()
+    )
+    if row is None:
+        return None
+    difficulty_level, stats = row
+    guess_count = stats.guess_count if stats else 0
+    return {
+        "location_id": location_id,
+        "difficulty_level": difficulty_level.value,
+        "guess_count": guess_count,
+        "mean_distance_km": (
+            stats.total_distance_km / guess_count if guess_count else None
+        ),
+        "median_distance_km": stats.median_distance_km if stats else None,
+        "mean_score": stats.total_score / guess_count if guess_count else None,
+        "empirical_difficulty": stats.empirical_difficulty if stats else None,
+    }
+
+
+def run_calibration() -> int:
+    db = SessionLocal()
+    try:
+        return calibrate_locations(db)
+    finally:
+        db.close()
+
+
+async def run_periodic_calibration(interval: int = CALIBRATION_INTERVAL):
+    """Fold new scores in every `interval` seconds without blocking the event loop."""
+    while True:
+        try:
+            await asyncio.to_thread(run_calibration)
+        except Exception as e:
+            logger.error(f"Error calibrating locations: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Folded in {run_calibration()} scores")
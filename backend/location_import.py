@@ -0,0 +1,331 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from PIL import Image, UnidentifiedImageError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+from duplicate_detection import duplicate_index, image_dhash
+from location_index import location_index
+from location_sampler import location_sampler
+from utils import sanitize_filename
+
+logger = logging.getLogger(__name__)
+
+IMAGES_DIR = Path("images")
+
+# Locations inserted per transaction
+LOCATION_IMPORT_BATCH_SIZE = int(os.getenv("LOCATION_IMPORT_BATCH_SIZE", 500))
+# Worker processes decoding and resizing images
+LOCATION_IMPORT_WORKERS = int(
+    os.getenv("LOCATION_IMPORT_WORKERS", min(4, os.cpu_count() or 1))
+)
+# Images with a longer side than this (in pixels) are downscaled on import
+LOCATION_IMAGE_MAX_SIZE = int(os.getenv("LOCATION_IMAGE_MAX_SIZE", 2048))
+
+MANIFEST_FORMATS = ("csv", "geojson")
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def _read_csv(content: str) -> Iterator[dict]:
+    yield from csv.DictReader(io.StringIO(content))
+
+
+def _read_geojson(content: str) -> Iterator[dict]:
+    collection = json.loads(content)
+    for feature in collection.get("features", []):
+        row = dict(feature.get("properties") or {})
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "Point":
+            # GeoJSON positions are [longitude, latitude]
+            row["longitude"], row["latitude"] = geometry["coordinates"][:2]
+        yield row
+
+
+def read_manifest(content: str, manifest_format: str) -> List[dict]:
+    """Parse a CSV or GeoJSON manifest into a list of raw rows."""
+    if manifest_format not in MANIFEST_FORMATS:
+        raise ValueError(
+            f"Invalid manifest format. Must be one of: {', '.join(MANIFEST_FORMATS)}"
+        )
+    reader = _read_csv if manifest_format == "csv" else _read_geojson
+    return list(reader(content))
+
+
+def _category_lookup(db: Session) -> dict:
+    """Map category ids (as strings) and lowercased names to ids."""
+    lookup = {}
+    for category in db.query(models.Category.id, models.Category.name):
+        lookup[str(category.id)] = category.id
+        lookup[category.name.lower()] = category.id
+    return lookup
+
+
+def _coordinate(row: dict, field: str, limit: float) -> float:
+    try:
+        value = float(row.get(field))
+    except (TypeError, ValueError):
+        raise ImportRowError(f"Invalid {field}")
+    if not -limit <= value <= limit:
+        raise ImportRowError(f"{field} must be between {-limit} and {limit}")
+    return value
+
+
+def validate_row(row: dict, categories: dict, images_root: Path) -> dict:
+    """Check a manifest row and return the Location values plus its image path."""
+    name = (row.get("name") or "").strip()
+    if not name:
+        raise ImportRowError("Missing name")
+
+    category = str(row.get("category_id") or row.get("category") or "").strip()
+    category_id = categories.get(category.lower())
+    if category_id is None:
+        raise ImportRowError(f"Category not found: {category or '(empty)'}")
+
+    difficulty_level = (row.get("difficulty_level") or "medium").strip().lower()
+    if difficulty_level not in [e.value for e in models.DifficultyLevel]:
+        raise ImportRowError(
+            f"Invalid difficulty level. Must be one of: {', '.join([e.value for e in models.DifficultyLevel])}"
+        )
+
+    image = (row.get("image") or "").strip()
+    if not image:
+        raise ImportRowError("Missing image")
+    image_path = (images_root / image).resolve()
+    if images_root.resolve() not in image_path.parents or not image_path.is_file():
+        raise ImportRowError(f"Image not found: {image}")
+
+    return {
+        "values": {
+            "latitude": _coordinate(row, "latitude", 90),
+            "longitude": _coordinate(row, "longitude", 180),
+            "name": name,
+            "description": row.get("description") or None,
+            "category_id": category_id,
+            "difficulty_level": models.DifficultyLevel(difficulty_level),
+            "country": row.get("country") or None,
+            "region": row.get("region") or None,
+        },
+        "image_path": str(image_path),
+    }
+
+
+def ingest_image(
+    job: Tuple[int, str], images_dir: str = str(IMAGES_DIR)
+) -> Tuple[int, Optional[str], Optional[int], Optional[str]]:
+    """
+    Verify an image, store it in the images directory (downscaled if
+    needed) and compute its perceptual hash. Runs in a worker process;
+    returns (row, file name, image hash, error).
+    """
+    row_number, source = job
+    source = Path(source)
+    file_name = (
+        f"{datetime.now().timestamp()}_{row_number}_{sanitize_filename(source.name)}"
+    )
+    destination = Path(images_dir) / file_name
+    try:
+        with Image.open(source) as image:
+            image.verify()
+        with Image.open(source) as image:
+            if max(image.size) > LOCATION_IMAGE_MAX_SIZE:
+                image_format = image.format
+                image.thumbnail((LOCATION_IMAGE_MAX_SIZE, LOCATION_IMAGE_MAX_SIZE))
+                image.save(destination, format=image_format)
+            else:
+                shutil.copyfile(source, destination)
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        destination.unlink(missing_ok=True)
+        return row_number, None, None, f"Invalid image {source.name}: {str(e)}"
+    return row_number, file_name, image_dhash(destination), None
+
+
+def extract_archive(archive: Path, target: Path) -> Path:
+    """Extract a zip archive of images, refusing members outside the target."""
+    with zipfile.ZipFile(archive) as zip_file:
+        for member in zip_file.namelist():
+            if target.resolve() not in (target / member).resolve().parents:
+                raise ValueError(f"Unsafe path in archive: {member}")
+        zip_file.extractall(target)
+    return target
+
+
+class LocationImporter:
+    """
+    Bulk import of locations from a manifest and a directory of images.
+
+    Rows are validated up front, images are processed in a pool of worker
+    processes, and locations are inserted LOCATION_IMPORT_BATCH_SIZE at a
+    time, one transaction per batch, while the pool keeps working. Every
+    row that is not imported is reported with its row number and reason.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        workers: int = LOCATION_IMPORT_WORKERS,
+        batch_size: int = LOCATION_IMPORT_BATCH_SIZE,
+    ):
+        self.db = db
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.imported: List[int] = []
+        self.failed: List[dict] = []
+
+    def _fail(self, row_number: int, error: str):
+        self.failed.append({"row": row_number, "error": error})
+
+    def _insert_batch(self, batch: List[Tuple[int, dict]]):
+        try:
+            inserted = self.db.execute(
+                insert(models.Location).returning(
+                    models.Location.id,
+                    models.Location.latitude,
+                    models.Location.longitude,
+                    models.Location.category_id,
+                    models.Location.image_hash,
+                ),
+                [values for _, values in batch],
+            ).all()
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error inserting {len(batch)} imported locations: {str(e)}")
+            for row_number, values in batch:
+                (IMAGES_DIR / values["image_url"]).unlink(missing_ok=True)
+                self._fail(row_number, f"Database error: {str(e)}")
+            return
+
+        for location in inserted:
+            location_index.upsert(
+                location.id, location.latitude, location.longitude, location.category_id
+            )
+            duplicate_index.add(
+                "location",
+                location.id,
+                location.latitude,
+                location.longitude,
+                location.image_hash,
+            )
+            self.imported.append(location.id)
+
+    def run(self, rows: List[dict], images_root: Path) -> dict:
+        categories = _category_lookup(self.db)
+        valid = {}
+        # Row numbers are 1-based and count data rows only
+        for row_number, row in enumerate(rows, start=1):
+            try:
+                valid[row_number] = validate_row(row, categories, images_root)
+            except ImportRowError as e:
+                self._fail(row_number, str(e))
+
+        jobs = [(row_number, row["image_path"]) for row_number, row in valid.items()]
+        batch = []
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(
+                ingest_image,
+                jobs,
+                chunksize=max(1, len(jobs) // (self.workers * 4)),
+            )
+            for row_number, file_name, image_hash, error in results:
+                if error:
+                    self._fail(row_number, error)
+                    continue
+                batch.append(
+                    (
+                        row_number,
+                        {
+                            **valid[row_number]["values"],
+                            "image_url": file_name,
+                            "image_hash": image_hash,
+                        },
+                    )
+                )
+                if len(batch) >= self.batch_size:
+                    self._insert_batch(batch)
+                    batch = []
+        if batch:
+            self._insert_batch(batch)
+
+        if self.imported:
+            location_sampler.invalidate()
+
+        self.failed.sort(key=lambda failure: failure["row"])
+        logger.info(
+            f"Imported {len(self.imported)} of {len(rows)} locations "
+            f"({len(self.failed)} failed)"
+        )
+        return {
+            "total": len(rows),
+            "imported": len(self.imported),
+            "location_ids": self.imported,
+            "failed": self.failed,
+        }
+
+
+def import_locations(
+    db: Session,
+    manifest: Path,
+    images: Path,
+    manifest_format: Optional[str] = None,
+    workers: int = LOCATION_IMPORT_WORKERS,
+    batch_size: int = LOCATION_IMPORT_BATCH_SIZE,
+) -> dict:
+    """
+    Import the locations listed in a manifest. `images` is a directory or a
+    zip archive holding the files named in the manifest's `image` column.
+    """
+    manifest_format = manifest_format or manifest.suffix.lstrip(".").lower()
+    if manifest_format == "json":
+        manifest_format = "geojson"
+    rows = read_manifest(manifest.read_text(encoding="utf-8-sig"), manifest_format)
+
+    IMAGES_DIR.mkdir(exist_ok=True)
+    importer = LocationImporter(db, workers=workers, batch_size=batch_size)
+    if images.is_dir():
+        return importer.run(rows, images)
+    with tempfile.TemporaryDirectory() as extracted:
+        return importer.run(rows, extract_archive(images, Path(extracted)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Bulk import locations")
+    parser.add_argument("manifest", type=Path, help="CSV or GeoJSON manifest")
+    parser.add_argument("images", type=Path, help="Image directory or zip archive")
+    parser.add_argument("--format", choices=MANIFEST_FORMATS)
+    parser.add_argument("--workers", type=int, default=LOCATION_IMPORT_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=LOCATION_IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = import_locations(
+            db,
+            args.manifest,
+            args.images,
+            manifest_format=args.format,
+            workers=args.workers,
+            batch_size=args.batch_size,
+        )
+    finally:
+        db.close()
+    print(f"Imported {report['imported']} of {report['total']} locations")
+    for failure in report["failed"]:
+        print(f"Row {failure['row']}: {failure['error']}")
@@ -0,0 +1,214 @@
+import logging
+import os
+import select
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Optional, Tuple
+
+import psycopg2
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the whole index is reloaded, as a backstop for missed changes
+LOCATION_COORDINATES_TTL = int(os.getenv("LOCATION_COORDINATES_TTL", 300))
+
+# Channel the locations trigger notifies with the id of an edited or
+# deleted location (see notify_location_change in init.sql)
+LOCATION_CHANGES_CHANNEL = "location_changes"
+# Seconds before the listener reconnects after losing its connection
+LOCATION_CHANGES_RETRY = int(os.getenv("LOCATION_CHANGES_RETRY", 5))
+
+# Stored in the category array for locations without a category
+_NO_CATEGORY = -1
+
+
+class LocationCoordinateIndex:
+    """
+    In-process lookup of the true coordinates and category of every location.
+
+    Ids are kept sorted in one array with latitudes, longitudes and category
+    ids in parallel arrays, so a lookup is a binary search with no database query.
+    Location writes in this process update the index directly. Edits and
+    deletes made anywhere else reach every worker through LISTEN/NOTIFY:
+    the listener drops the entry, so the next lookup reads it from the
+    database. Ids that are missing are read once and added, and the whole
+    index is reloaded when it expires or the listener had to reconnect.
+    """
+
+    def __init__(self, ttl: int = LOCATION_COORDINATES_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ids = array("l")
+        self._latitudes = array("d")
+        self._longitudes = array("d")
+        self._categories = array("l")
+        self._loaded_at = 0.0
+        self._listener: Optional[threading.Thread] = None
+
+    def _load(self, db: Session):
+        rows = (
+            db.query(
+                models.Location.id,
+                models.Location.latitude,
+                models.Location.longitude,
+                models.Location.category_id,
+            )
+            .order_by(models.Location.id)
+            .all()
+        )
+        self._ids = array("l", (row.id for row in rows))
+        self._latitudes = array("d", (row.latitude for row in rows))
+        self._longitudes = array("d", (row.longitude for row in rows))
+        self._categories = array(
+            "l",
+            (
+                _NO_CATEGORY if row.category_id is None else row.category_id
+                for row in rows
+            ),
+        )
+        self._loaded_at = time.monotonic()
+        logger.info(f"Loaded coordinate index with {len(rows)} locations")
+
+    def _position(self, location_id: int) -> Tuple[int, bool]:
+        position = bisect_left(self._ids, location_id)
+        found = position < len(self._ids) and self._ids[position] == location_id
+        return position, found
+
+    def _set(
+        self,
+        location_id: int,
+        latitude: float,
+        longitude: float,
+        category_id: Optional[int],
+    ):
+        category = _NO_CATEGORY if category_id is None else category_id
+        position, found = self._position(location_id)
+        if found:
+            self._latitudes[position] = latitude
+            self._longitudes[position] = longitude
+            self._categories[position] = category
+        else:
+            self._ids.insert(position, location_id)
+            self._latitudes.insert(position, latitude)
+            self._longitudes.insert(position, longitude)
+            self._categories.insert(position, category)
+
+    def lookup(
+        self, db: Session, location_id: int
+    ) -> Optional[Tuple[float, float, Optional[int]]]:
+        """
+        Return (latitude, longitude, category id) of a location, or None if
+        it does not exist.
+        """
+        with self._lock:
+            if time.monotonic() - self._loaded_at > self.ttl:
+                self._load(db)
+            position, found = self._position(location_id)
+            if found:
+                category = self._categories[position]
+                return (
+                    self._latitudes[position],
+                    self._longitudes[position],
+                    None if category == _NO_CATEGORY else category,
+                )
+
+        # Created by another worker since the last load
+        location = (
+            db.query(
+                models.Location.latitude,
+                models.Location.longitude,
+                models.Location.category_id,
+            )
+            .filter(models.Location.id == location_id)
+            .first()
+        )
+        if location is None:
+            return None
+        self.upsert(
+            location_id, location.latitude, location.longitude, location.category_id
+        )
+        return location.latitude, location.longitude, location.category_id
+
+    def get(self, db: Session, location_id: int) -> Optional[Tuple[float, float]]:
+        """Return (latitude, longitude) of a location, or None if it does not exist."""
+        location = self.lookup(db, location_id)
+        return location[:2] if location else None
+
+    def upsert(
+        self,
+        location_id: int,
+        latitude: float,
+        longitude: float,
+        category_id: Optional[int],
+    ):
+        """Record a created or edited location."""
+        with self._lock:
+            self._set(location_id, latitude, longitude, category_id)
+
+    def remove(self, location_id: int):
+        """Forget a deleted location."""
+        with self._lock:
+            position, found = self._position(location_id)
+            if found:
+                del self._ids[position]
+                del self._latitudes[position]
+                del self._longitudes[position]
+                del self._categories[position]
+
+    def invalidate(self):
+        """Force a reload on the next lookup."""
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def start_listener(self):
+        """Follow location edits made by other workers (call once per worker)."""
+        if self._listener is not None and self._listener.is_alive():
+            return
+        self._listener = threading.Thread(
+            target=self._listen, name="location-changes-listener", daemon=True
+        )
+        self._listener.start()
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(
+                    host=os.getenv("PGHOST"),
+                    dbname=os.getenv("PGDATABASE"),
+                    user=os.getenv("PGUSER"),
+                    password=os.getenv("PGPASSWORD"),
+                    sslmode="require",
+                )
+                conn.autocommit = True
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {LOCATION_CHANGES_CHANNEL};")
+                # Changes made while nobody was listening were missed
+                self.invalidate()
+                logger.info("Listening for location changes")
+
+                while True:
+                    readable, _, _ = select.select([conn], [], [], 60)
+                    if not readable:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            self.remove(int(notify.payload))
+                        except ValueError:
+                            logger.error("Invalid location change payload")
+            except Exception as e:
+                logger.error(f"Location change listener disconnected: {str(e)}")
+            finally:
+                if conn is not None:
+                    conn.close()
+            time.sleep(LOCATION_CHANGES_RETRY)
+
+
+location_index = LocationCoordinateIndex()
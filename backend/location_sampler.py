@@ -0,0 +1,195 @@
+import logging
+import os
+import random
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# How long (in seconds) the in-memory id index is trusted before it is reloaded
+LOCATION_INDEX_TTL = int(os.getenv("LOCATION_INDEX_TTL", 300))
+
+# Percentage of the table read by the TABLESAMPLE fallback
+TABLESAMPLE_PERCENT = float(os.getenv("LOCATION_TABLESAMPLE_PERCENT", 10))
+
+
+class LocationSampler:
+    """
+    Draw random location ids without sorting the locations table.
+
+    Location ids are kept in compact integer arrays bucketed by
+    (category_id, difficulty, empirical difficulty). Sampling k ids is a random.sample over the
+    matching buckets, so the cost does not depend on catalogue size. The
+    index is reloaded lazily when it is older than LOCATION_INDEX_TTL or has
+    been invalidated by a location write.
+    """
+
+    def __init__(self, ttl: int = LOCATION_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[Optional[int], str, Optional[str]], array] = {}
+        self._loaded_at = 0.0
+
+    def invalidate(self):
+        """Force a reload on the next sample (call after location writes)."""
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def _is_stale(self) -> bool:
+        return time.monotonic() - self._loaded_at > self.ttl
+
+    def _load(self, db: Session):
+        rows = (
+            db.query(
+                models.Location.id,
+                models.Location.category_id,
+                models.Location.difficulty_level,
+                models.LocationDifficultyStats.empirical_difficulty,
+            )
+            .outerjoin(
+                models.LocationDifficultyStats,
+                models.LocationDifficultyStats.location_id == models.Location.id,
+            )
+            .all()
+        )
+
+        buckets: Dict[Tuple[Optional[int], str, Optional[str]], array] = {}
+        for location_id, category_id, difficulty, empirical in rows:
+            key = (category_id, _difficulty_value(difficulty), empirical)
+            buckets.setdefault(key, array("i")).append(location_id)
+
+        self._buckets = buckets
+        self._loaded_at = time.monotonic()
+        logger.info(f"Loaded location sampling index with {len(rows)} locations")
+
+    def _candidates(
+        self, category_id: Optional[int], difficulty: Optional[str], calibrated: bool
+    ) -> List[array]:
+        return [
+            ids
+            for (
+                bucket_category,
+                set_difficulty,
+                empirical,
+            ), ids in self._buckets.items()
+            if (category_id is None or bucket_category == category_id)
+            and (
+                difficulty is None
+                or ((empirical or set_difficulty) if calibrated else set_difficulty)
+                == difficulty
+            )
+        ]
+
+    def sample(
+        self,
+        db: Session,
+        k: int,
+        category_id: Optional[int] = None,
+        difficulty: Optional[str] = None,
+        calibrated: bool = False,
+    ) -> List[int]:
+        """
+        Return up to k distinct location ids matching the optional filters.
+        With `calibrated` the difficulty is matched against the empirical
+        difficulty, falling back to the admin-set level for locations that
+        do not have enough guesses yet.
+        """
+        difficulty = _difficulty_value(difficulty) if difficulty else None
+
+        with self._lock:
+            if self._is_stale():
+                try:
+                    self._load(db)
+                except Exception as e:
+                    logger.error(f"Error loading location sampling index: {str(e)}")
+                    # The failed query aborted the transaction
+                    db.rollback()
+                    return sample_with_tablesample(
+                        db, k, category_id, difficulty, calibrated
+                    )
+            candidates = self._candidates(category_id, difficulty, calibrated)
+
+        total = sum(len(ids) for ids in candidates)
+        if total <= k:
+            return [location_id for ids in candidates for location_id in ids]
+
+        # Pick k distinct positions across the concatenated buckets
+        picked = []
+        for position in sorted(random.sample(range(total), k)):
+            for ids in candidates:
+                if position < len(ids):
+                    picked.append(ids[position])
+                    break
+                position -= len(ids)
+
+        random.shuffle(picked)
+        return picked
+
+
+def sample_with_tablesample(
+    db: Session,
+    k: int,
+    category_id: Optional[int] = None,
+    difficulty: Optional[str] = None,
+    calibrated: bool = False,
+) -> List[int]:
+    """
+    Sample ids straight from the database without a full sort.
+
+    TABLESAMPLE SYSTEM reads a random subset of pages; when that subset does
+    not hold enough matching rows (small or heavily filtered catalogues) fall
+    back to ordering the filtered rows randomly.
+    """
+    filters = []
+    params = {"k": k}
+    if category_id is not None:
+        filters.append("category_id = :category_id")
+        params["category_id"] = category_id
+    if difficulty is not None and calibrated:
+        filters.append(
+            "COALESCE((SELECT empirical_difficulty FROM location_difficulty_stats "
+            "WHERE location_id = locations.id), lower(difficulty_level::text)) = :difficulty"
+        )
+        params["difficulty"] = difficulty
+    elif difficulty is not None:
+        filters.append("lower(difficulty_level::text) = :difficulty")
+        params["difficulty"] = difficulty
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+
+    sampled = (
+        db.execute(
+            text(
+                f"SELECT id FROM locations TABLESAMPLE SYSTEM ({TABLESAMPLE_PERCENT}) "
+                f"{where} LIMIT :k"
+            ),
+            params,
+        )
+        .scalars()
+        .all()
+    )
+    if len(sampled) >= k:
+        random.shuffle(sampled)
+        return list(sampled)
+
+    return list(
+        db.execute(
+            text(f"SELECT id FROM locations {where} ORDER BY random() LIMIT :k"),
+            params,
+        ).scalars()
+    )
+
+
+def _difficulty_value(difficulty) -> str:
+    if isinstance(difficulty, models.DifficultyLevel):
+        return difficulty.value
+    return str(difficulty).lower()
+
+
+location_sampler = LocationSampler()
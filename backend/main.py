@@ -1,9 +1,20 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import (
+    FastAPI,
+    Depends,
+    HTTPException,
+    status,
+    UploadFile,
+    File,
+    Form,
+    Request,
+    Query,
+    Response,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, joinedload, selectinload
 from typing import List, Optional
-from sqlalchemy import func, desc, and_, text, or_
+from sqlalchemy import func, desc, and_, text, or_, insert, tuple_
 import models
 import schemas
 import database
@@ -11,22 +22,67 @@ from database import SessionLocal, engine
 import os
 from dotenv import load_dotenv
 import random
+import asyncio
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from utils import calculate_distance, calculate_score
+from utils import calculate_distance, calculate_score, sanitize_filename
 from fastapi.staticfiles import StaticFiles
 from schemas import LocationCategory
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 import logging
 from pathlib import Path
-import re
-from urllib.parse import unquote
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from email_utils import send_verification_email, send_password_reset_email
 import secrets
+import shutil
+import tempfile
+import zipfile
 from dependencies import get_db, get_current_user, get_current_admin_user
 import pending_locations
+import challenge_cache
+import friend_graph
+import friends_leaderboard
+from friends_leaderboard import FRIENDS_LEADERBOARD_SIZE
+import admin_stats
+import user_stats
+from challenge_sweeper import run_periodic_sweeps, CHALLENGE_SWEEP_INTERVAL
+from score_percentiles import (
+    percentile_index,
+    run_periodic_sketch_updates,
+    SCORE_SKETCH_INTERVAL,
+)
+from guess_heatmaps import get_heatmap, run_periodic_heatmap_updates, HEATMAP_INTERVAL
+from location_calibration import (
+    get_location_calibration,
+    run_periodic_calibration,
+    CALIBRATION_INTERVAL,
+)
+from challenge_events import (
+    broker,
+    challenge_event,
+    format_sse,
+    CHALLENGE_EVENTS_KEEPALIVE,
+)
+import crud
+from location_sampler import location_sampler
+from location_index import location_index
+from location_import import import_locations
+from duplicate_detection import duplicate_index, image_dhash
+from data_export import export_table, MEDIA_TYPES as EXPORT_MEDIA_TYPES
+from score_buffer import score_buffer, SCORE_INGESTION_MODE
+from idempotency import (
+    IDEMPOTENCY_PRUNE_INTERVAL,
+    IdempotencyMiddleware,
+    idempotency_store,
+    run_periodic_pruning,
+)
+from pagination import (
+    decode_cursor,
+    encode_cursor,
+    stream_ndjson,
+    NEXT_CURSOR_HEADER,
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -40,6 +96,9 @@ app = FastAPI()
 
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 
+# Replay responses of retried guess and session writes (Idempotency-Key header).
+# Added before CORS so that replayed responses still get CORS headers.
+app.add_middleware(IdempotencyMiddleware)
 
 # Update the CORS middleware configuration
 app.add_middleware(
@@ -62,6 +121,22 @@ oauth2_scheme = OAuth2PasswordBearer(
     auto_error=False,
 )
 
+# Number of locations played in a challenge
+CHALLENGE_LOCATION_COUNT = 5
+
+# Page sizes for the challenge listing
+CHALLENGE_PAGE_SIZE = 50
+MAX_CHALLENGE_PAGE_SIZE = 100
+
+# Results returned by the username search and friend suggestions
+USER_SEARCH_LIMIT = 10
+FRIEND_SUGGESTION_LIMIT = 10
+FRIENDS_LEADERBOARD_LIMIT = 20
+
+# Page sizes for the admin listings
+ADMIN_PAGE_SIZE = 50
+MAX_ADMIN_PAGE_SIZE = 500
+
 # Setup directories
 IMAGES_DIR = Path("images")
 IMAGES_DIR.mkdir(exist_ok=True)
@@ -73,6 +148,68 @@ app.mount("/images", StaticFiles(directory="images"), name="images")
 app.include_router(pending_locations.router)
 
 
+@app.on_event("startup")
+async def start_challenge_sweeper():
+    """Expire, settle and archive stale challenges in the background."""
+    if CHALLENGE_SWEEP_INTERVAL > 0:
+        asyncio.create_task(run_periodic_sweeps(CHALLENGE_SWEEP_INTERVAL))
+
+
+@app.on_event("startup")
+async def start_location_calibration():
+    """Fold new scores into the per-location difficulty statistics."""
+    if CALIBRATION_INTERVAL > 0:
+        asyncio.create_task(run_periodic_calibration(CALIBRATION_INTERVAL))
+
+
+@app.on_event("startup")
+async def start_heatmap_updates():
+    """Bin new guesses into the per-location heatmaps."""
+    if HEATMAP_INTERVAL > 0:
+        asyncio.create_task(run_periodic_heatmap_updates(HEATMAP_INTERVAL))
+
+
+@app.on_event("startup")
+async def start_score_sketch_updates():
+    """Fold new scores into the sketches behind percentile ranks."""
+    if SCORE_SKETCH_INTERVAL > 0:
+        asyncio.create_task(run_periodic_sketch_updates(SCORE_SKETCH_INTERVAL))
+
+
+@app.on_event("startup")
+async def seed_table_counters():
+    """Count the tables whose dashboard counters were never seeded (older databases)."""
+    asyncio.create_task(asyncio.to_thread(admin_stats.run_counter_seeding))
+
+
+@app.on_event("startup")
+async def start_idempotency_pruning():
+    """Delete idempotency keys that can no longer be replayed."""
+    if IDEMPOTENCY_PRUNE_INTERVAL > 0:
+        asyncio.create_task(
+            run_periodic_pruning(idempotency_store, IDEMPOTENCY_PRUNE_INTERVAL)
+        )
+
+
+@app.on_event("startup")
+async def start_location_change_listener():
+    """Keep this worker's coordinate index in step with edits made elsewhere."""
+    location_index.start_listener()
+
+
+@app.on_event("startup")
+async def start_score_buffer():
+    """Replay the score journal and start write-behind ingestion if enabled."""
+    if SCORE_INGESTION_MODE == "buffered":
+        score_buffer.start()
+
+
+@app.on_event("shutdown")
+async def stop_score_buffer():
+    if score_buffer.enabled:
+        await asyncio.to_thread(score_buffer.stop)
+
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -182,11 +319,26 @@ async def create_location(
             difficulty_level=difficulty_enum,  # Use the enum value
             country=country,
             region=region,
+            image_hash=image_dhash(file_path),
         )
 
         db.add(db_location)
         db.commit()
         db.refresh(db_location)
+        location_sampler.invalidate()
+        location_index.upsert(
+            db_location.id,
+            db_location.latitude,
+            db_location.longitude,
+            db_location.category_id,
+        )
+        duplicate_index.add(
+            "location",
+            db_location.id,
+            db_location.latitude,
+            db_location.longitude,
+            db_location.image_hash,
+        )
 
         return db_location
 
@@ -230,6 +382,12 @@ async def get_random_location(
         )
 
 
+@app.get("/locations/{location_id}/heatmap", response_model=schemas.GuessHeatmap)
+async def get_location_heatmap(location_id: int, db: Session = Depends(get_db)):
+    """Where players have guessed a location, precomputed by guess_heatmaps.py"""
+    return get_heatmap(db, location_id)
+
+
 @app.get("/locations/category/{category_name}", response_model=schemas.Location)
 async def get_location_by_category(
     category_name: str,
@@ -354,6 +512,21 @@ def get_leaderboard(category: Optional[str] = None, db: Session = Depends(get_db
         )
 
 
+@app.get(
+    "/leaderboard/friends", response_model=List[schemas.FriendLeaderboardEntry]
+)
+def get_friends_leaderboard(
+    limit: int = Query(FRIENDS_LEADERBOARD_LIMIT, ge=1, le=FRIENDS_LEADERBOARD_SIZE),
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """The current user and their friends ranked by best session score."""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    return friends_leaderboard.get_friends_leaderboard(db, current_user.id, limit)
+
+
 # Protected endpoints (authentication required)
 @app.post("/submit-guess")
 async def submit_guess(
@@ -366,15 +539,39 @@ async def submit_guess(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
         )
 
+    # Score against the true coordinates, never the client's copy
+    location = location_index.lookup(db, guess.location_id)
+    if location is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+    latitude, longitude, category_id = location
+
     # Calculate distance and score
     distance = calculate_distance(
-        guess.guessed_latitude,
-        guess.guessed_longitude,
-        guess.actual_latitude,
-        guess.actual_longitude,
+        guess.guessed_latitude, guess.guessed_longitude, latitude, longitude
     )
     score = calculate_score(distance)
 
+    # In buffered mode the score is written by the flusher in a later batch;
+    # achievements are awarded there too and show up on the next fetch
+    if score_buffer.enqueue(
+        user_id=current_user.id,
+        location_id=guess.location_id,
+        score=score,
+        guess_latitude=guess.guessed_latitude,
+        guess_longitude=guess.guessed_longitude,
+        game_session_id=guess.game_session_id,
+    ):
+        return {
+            "score": score,
+            "distance": round(distance, 2),
+            "message": f"You were {round(distance, 2)} km away from the target!",
+            "has_new_achievements": False,
+            # Ranked against the guesses folded into the sketches so far
+            **percentile_index.guess_percentiles(
+                db, guess.location_id, category_id, score
+            ),
+        }
+
     # Save score
     db_score = models.Score(
         user_id=current_user.id,
@@ -386,6 +583,16 @@ async def submit_guess(
     )
     db.add(db_score)
 
+    # Keep the session's running total up to date
+    if guess.game_session_id:
+        crud.add_score_to_game_session(
+            db,
+            session_id=guess.game_session_id,
+            user_id=current_user.id,
+            location_id=guess.location_id,
+            score=score,
+        )
+
     # Get previous achievements count
     previous_achievements = (
         db.query(models.UserAchievement)
@@ -417,6 +624,9 @@ async def submit_guess(
         "distance": round(distance, 2),
         "message": f"You were {round(distance, 2)} km away from the target!",
         "has_new_achievements": has_new_achievements,
+        **percentile_index.guess_percentiles(
+            db, guess.location_id, category_id, score
+        ),
     }
 
 
@@ -523,59 +733,307 @@ async def get_admin_stats(
             status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized"
         )
 
-    total_users = db.query(models.User).count()
-    total_locations = db.query(models.Location).count()
-    total_guesses = db.query(models.Score).count()
+    # Counters are maintained by triggers and cached briefly, so a dashboard
+    # refresh never scans the users, locations or scores tables
+    return admin_stats.get_admin_stats(db)
 
-    average_score = db.query(func.avg(models.Score.score)).scalar() or 0
 
+def _admin_users_query(
+    db: Session,
+    sort: schemas.AdminUserSort,
+    order: schemas.SortOrder,
+    search: Optional[str],
+    is_admin: Optional[bool],
+    email_verified: Optional[bool],
+    cursor: Optional[list],
+):
+    total_score = func.coalesce(models.UserStats.total_score, 0)
+    sort_column = {
+        schemas.AdminUserSort.CREATED_AT: models.User.created_at,
+        schemas.AdminUserSort.USERNAME: models.User.username,
+        schemas.AdminUserSort.TOTAL_SCORE: total_score,
+    }[sort]
+
+    query = db.query(
+        models.User.id,
+        models.User.username,
+        models.User.email,
+        models.User.is_admin,
+        models.User.created_at,
+        total_score.label("total_score"),
+    ).outerjoin(models.UserStats, models.UserStats.user_id == models.User.id)
+
+    if search:
+        query = query.filter(
+            models.User.username.ilike(crud.escape_like(search) + "%", escape="!")
+        )
+    if is_admin is not None:
+        query = query.filter(models.User.is_admin == is_admin)
+    if email_verified is not None:
+        query = query.filter(models.User.email_verified == email_verified)
+
+    if cursor is not None:
+        value, last_id = cursor
+        if sort == schemas.AdminUserSort.CREATED_AT:
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        key = tuple_(sort_column, models.User.id)
+        query = query.filter(
+            key > tuple_(value, last_id)
+            if order == schemas.SortOrder.ASC
+            else key < tuple_(value, last_id)
+        )
+
+    if order == schemas.SortOrder.ASC:
+        return query.order_by(sort_column.asc(), models.User.id.asc())
+    return query.order_by(sort_column.desc(), models.User.id.desc())
+
+
+def _admin_user_row(user) -> dict:
     return {
-        "totalUsers": total_users,
-        "totalLocations": total_locations,
-        "totalGuesses": total_guesses,
-        "averageScore": float(average_score),
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "is_admin": user.is_admin,
+        "total_score": user.total_score,
+        "created_at": user.created_at,
     }
 
 
 @app.get("/admin/users")
 async def get_admin_users(
-    current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=MAX_ADMIN_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: schemas.AdminUserSort = schemas.AdminUserSort.CREATED_AT,
+    order: schemas.SortOrder = schemas.SortOrder.DESC,
+    search: Optional[str] = None,
+    is_admin: Optional[bool] = None,
+    email_verified: Optional[bool] = None,
+    format: schemas.ListFormat = schemas.ListFormat.JSON,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
+    """
+    List users with their total score, one keyset page at a time.
+
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    With format=ndjson every matching user is streamed instead.
+    """
     if not current_user or not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized"
         )
 
+    filters = dict(
+        sort=sort,
+        order=order,
+        search=search,
+        is_admin=is_admin,
+        email_verified=email_verified,
+    )
+
+    if format == schemas.ListFormat.NDJSON:
+        return stream_ndjson(
+            lambda stream_db: _admin_users_query(stream_db, cursor=None, **filters),
+            _admin_user_row,
+        )
+
     users = (
-        db.query(models.User, func.sum(models.Score.score).label("total_score"))
-        .outerjoin(models.Score)
-        .group_by(models.User.id)
+        _admin_users_query(
+            db,
+            cursor=decode_cursor(
+                cursor, int if sort == schemas.AdminUserSort.TOTAL_SCORE else str, int
+            ),
+            **filters,
+        )
+        .limit(limit + 1)
         .all()
     )
 
-    return [
-        {
-            "id": user.User.id,
-            "username": user.User.username,
-            "email": user.User.email,
-            "total_score": user.total_score or 0,
-            "created_at": user.User.created_at,
-        }
-        for user in users
-    ]
+    if len(users) > limit:
+        users = users[:limit]
+        last = users[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            getattr(last, sort.value), last.id
+        )
+
+    return [_admin_user_row(user) for user in users]
+
+
+# Location columns that can be requested with the `fields` parameter
+ADMIN_LOCATION_FIELDS = [
+    "id",
+    "image_url",
+    "latitude",
+    "longitude",
+    "name",
+    "description",
+    "category_id",
+    "difficulty_level",
+    "country",
+    "region",
+    "created_at",
+    "updated_at",
+]
+
+
+def _parse_location_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return ADMIN_LOCATION_FIELDS
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = set(requested) - set(ADMIN_LOCATION_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}. "
+            f"Must be among: {', '.join(ADMIN_LOCATION_FIELDS)}",
+        )
+    # The id is always returned; it is the pagination key
+    return ["id"] + [field for field in requested if field != "id"]
+
+
+def _admin_locations_query(
+    db: Session,
+    columns: List[str],
+    uncategorized: bool = False,
+    category_id: Optional[int] = None,
+    difficulty: Optional[schemas.DifficultyLevel] = None,
+    country: Optional[str] = None,
+    after_id: Optional[int] = None,
+):
+    query = db.query(*(getattr(models.Location, column) for column in columns))
+
+    if uncategorized:
+        query = query.filter(models.Location.category_id.is_(None))
+    elif category_id is not None:
+        query = query.filter(models.Location.category_id == category_id)
+    if difficulty is not None:
+        query = query.filter(
+            models.Location.difficulty_level == models.DifficultyLevel(difficulty.value)
+        )
+    if country:
+        query = query.filter(func.lower(models.Location.country) == country.lower())
+    if after_id is not None:
+        query = query.filter(models.Location.id > after_id)
+
+    return query.order_by(models.Location.id)
+
+
+def _list_admin_locations(
+    db: Session,
+    response: Response,
+    limit: int,
+    cursor: Optional[str],
+    fields: Optional[str],
+    format: schemas.ListFormat,
+    **filters,
+):
+    """Shared body of the admin location listings (page or NDJSON stream)."""
+    columns = _parse_location_fields(fields)
+
+    def serialize(row) -> dict:
+        return dict(row._mapping)
+
+    if format == schemas.ListFormat.NDJSON:
+        return stream_ndjson(
+            lambda stream_db: _admin_locations_query(stream_db, columns, **filters),
+            serialize,
+        )
+
+    after = decode_cursor(cursor, int)
+    locations = (
+        _admin_locations_query(
+            db, columns, after_id=after[0] if after else None, **filters
+        )
+        .limit(limit + 1)
+        .all()
+    )
+
+    if len(locations) > limit:
+        locations = locations[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(locations[-1].id)
+
+    return [serialize(location) for location in locations]
+
+
+@app.get("/admin/locations/search", response_model=List[schemas.Location])
+async def search_admin_locations(
+    response: Response,
+    q: str,
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=MAX_ADMIN_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    category_id: Optional[int] = None,
+    difficulty: Optional[schemas.DifficultyLevel] = None,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Search locations by name, country, region and description, best match
+    first. Every word of `q` is matched as a prefix. The cursor for the next
+    page is returned in the X-Next-Cursor header.
+    """
+    # Admin only: locations carry their true coordinates
+    if not current_user or not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized"
+        )
+
+    results = crud.search_locations(
+        db,
+        q,
+        limit + 1,
+        category_id=category_id,
+        difficulty=models.DifficultyLevel(difficulty.value) if difficulty else None,
+        after=decode_cursor(cursor, (int, float), int),
+    )
+
+    if len(results) > limit:
+        results = results[:limit]
+        location, rank = results[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rank, location.id)
+
+    return [location for location, _ in results]
 
 
 @app.get("/admin/locations")
 async def get_admin_locations(
-    current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=MAX_ADMIN_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    category_id: Optional[int] = None,
+    difficulty: Optional[schemas.DifficultyLevel] = None,
+    country: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: schemas.ListFormat = schemas.ListFormat.JSON,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
+    """
+    List locations one keyset page at a time, in id order.
+
+    `fields` is a comma-separated subset of ADMIN_LOCATION_FIELDS. The cursor
+    for the next page is returned in the X-Next-Cursor header. With
+    format=ndjson every matching location is streamed instead.
+    """
     if not current_user or not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized"
         )
 
-    locations = db.query(models.Location).all()
-    return locations
+    return _list_admin_locations(
+        db,
+        response,
+        limit,
+        cursor,
+        fields,
+        format,
+        category_id=category_id,
+        difficulty=difficulty,
+        country=country,
+    )
 
 
 @app.get("/check-admin")
@@ -614,10 +1072,37 @@ async def delete_location(
     # Delete the database record
     db.delete(location)
     db.commit()
+    location_sampler.invalidate()
+    location_index.remove(location_id)
+    duplicate_index.remove("location", location_id)
+    challenge_cache.clear()
 
     return {"message": "Location deleted successfully"}
 
 
+@app.get(
+    "/admin/locations/{location_id}/calibration",
+    response_model=schemas.LocationCalibration,
+)
+async def get_location_calibration_stats(
+    location_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """How players do on a location, next to its admin-set difficulty"""
+    if not current_user or not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized"
+        )
+
+    calibration = get_location_calibration(db, location_id)
+    if calibration is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Location not found"
+        )
+    return calibration
+
+
 @app.put("/admin/locations/{location_id}", response_model=schemas.Location)
 async def update_location(
     location_id: int,
@@ -655,10 +1140,23 @@ async def update_location(
             with open(file_path, "wb") as buffer:
                 buffer.write(await image.read())
             location.image_url = file_name
+            location.image_hash = image_dhash(file_path)
 
         # Commit changes
         db.commit()
         db.refresh(location)
+        location_sampler.invalidate()
+        location_index.upsert(
+            location.id, location.latitude, location.longitude, location.category_id
+        )
+        duplicate_index.add(
+            "location",
+            location.id,
+            location.latitude,
+            location.longitude,
+            location.image_hash,
+        )
+        challenge_cache.clear()
 
         logger.info(f"Location {location_id} updated with name: {name}")
         return location
@@ -708,57 +1206,48 @@ async def end_game_session(
     if not session:
         raise HTTPException(status_code=404, detail="Game session not found")
 
-    # Calculate total score for this session
-    total_session_score = (
-        db.query(func.sum(models.Score.score))
-        .filter(models.Score.game_session_id == session_id)
-        .scalar()
-        or 0
-    )
+    # Buffered guesses of this session have to be in its totals first.
+    # flush() waits for a flush already running in the background, so
+    # whatever is still queued afterwards could not be written yet
+    if score_buffer.enabled:
+        await asyncio.to_thread(score_buffer.flush)
+        if score_buffer.pending_for_session(session_id):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Guesses of this session are still being saved, try again",
+                headers={"Retry-After": str(int(score_buffer.flush_interval) + 1)},
+            )
+        db.refresh(session)
 
-    # Get the category for this session's locations
-    session_category = (
-        db.query(models.Category)
-        .join(models.Location)
-        .join(models.Score)
-        .filter(models.Score.game_session_id == session_id)
-        .first()
-    )
+    # The session already carries its running total and category
+    total_session_score = session.total_score or 0
 
-    if session_category:
-        # Create or update category leaderboard entry
-        category_leaderboard = models.CategoryLeaderboard(
-            user_id=current_user.id,
-            category_id=session_category.id,
-            score=total_session_score,
-        )
-        db.add(category_leaderboard)
-
-    # Get or create leaderboard entry for the user
-    leaderboard_entry = (
-        db.query(models.Leaderboard)
-        .filter(models.Leaderboard.user_id == current_user.id)
-        .first()
+    highest_score = crud.record_session_leaderboards(
+        db,
+        user_id=current_user.id,
+        category_id=session.category_id,
+        score=total_session_score,
     )
 
-    if leaderboard_entry:
-        # Update highest score if this session's score is higher
-        if total_session_score > leaderboard_entry.highest_score:
-            leaderboard_entry.highest_score = total_session_score
-    else:
-        # Create new leaderboard entry
-        leaderboard_entry = models.Leaderboard(
-            user_id=current_user.id, highest_score=total_session_score
-        )
-        db.add(leaderboard_entry)
-
     session.ended_at = func.now()
     db.commit()
+    if total_session_score and highest_score == total_session_score:
+        friends_leaderboard.record_best(current_user.id, highest_score)
+
+    # The session's average guess, ranked against the category's guesses
+    category_percentile = (
+        percentile_index.category_percentile(
+            db, session.category_id, total_session_score / session.rounds_played
+        )
+        if session.rounds_played
+        else None
+    )
 
     return {
         "message": "Game session ended",
         "total_score": total_session_score,
-        "is_high_score": leaderboard_entry.highest_score == total_session_score,
+        "is_high_score": highest_score == total_session_score,
+        "category_percentile": category_percentile,
     }
 
 
@@ -779,23 +1268,20 @@ async def add_friend(
         raise HTTPException(status_code=404, detail="User not found")
 
     # Check if already friends
-    existing = (
-        db.query(models.Friends)
-        .filter(
-            (
-                (models.Friends.user_id == current_user.id)
-                & (models.Friends.friend_id == friend_id)
-            )
-        )
-        .first()
-    )
-
-    if existing:
+    if friend_graph.are_friends(db, current_user.id, friend_id):
         raise HTTPException(status_code=400, detail="Already friends")
 
     friendship = models.Friends(user_id=current_user.id, friend_id=friend_id)
     db.add(friendship)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Added by a concurrent request
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Already friends")
+    finally:
+        friend_graph.invalidate(current_user.id)
+        friends_leaderboard.invalidate(current_user.id)
     return {"message": "Friend added successfully"}
 
 
@@ -839,9 +1325,76 @@ async def remove_friend(
 
     db.delete(friendship)
     db.commit()
+    friend_graph.invalidate(current_user.id)
+    friends_leaderboard.invalidate(current_user.id)
     return {"message": "Friend removed successfully"}
 
 
+@app.get("/friends/status/{user_id}")
+async def get_friend_status(
+    user_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Whether the current user and another user have added each other."""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    friend_sets = friend_graph.get_friend_ids_many(db, [current_user.id, user_id])
+    return {
+        "is_friend": user_id in friend_sets[current_user.id],
+        "is_friend_of": current_user.id in friend_sets[user_id],
+        "mutual_friends": len(friend_sets[current_user.id] & friend_sets[user_id]),
+    }
+
+
+@app.get("/friends/mutual/{user_id}", response_model=List[schemas.User])
+async def get_mutual_friends(
+    user_id: int,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Users both the current user and `user_id` have added as friends."""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    mutual_ids = friend_graph.mutual_friends(db, current_user.id, user_id)
+    if not mutual_ids:
+        return []
+    return (
+        db.query(models.User)
+        .filter(models.User.id.in_(mutual_ids))
+        .order_by(models.User.username)
+        .all()
+    )
+
+
+@app.get("/friends/suggestions", response_model=List[schemas.FriendSuggestion])
+async def get_friend_suggestions(
+    limit: int = Query(FRIEND_SUGGESTION_LIMIT, ge=1, le=50),
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Friends of friends, ranked by the number of friends in common."""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    suggestions = friend_graph.suggest_friends(db, current_user.id, limit)
+    if not suggestions:
+        return []
+    users = {
+        user.id: user
+        for user in db.query(models.User).filter(
+            models.User.id.in_([user_id for user_id, _ in suggestions])
+        )
+    }
+    return [
+        {"user": users[user_id], "mutual_friends": mutual}
+        for user_id, mutual in suggestions
+        if user_id in users
+    ]
+
+
 @app.post("/categories/", response_model=schemas.Category)
 async def create_category(
     category: schemas.CategoryCreate,
@@ -898,32 +1451,114 @@ async def get_user_achievements(
     )
 
 
-def sanitize_filename(filename):
-    """Remove spaces and special characters from filename."""
-    # Decode URL-encoded characters
-    filename = unquote(filename)
-    # Replace spaces and special characters with underscores
-    filename = re.sub(r"[^\w.-]", "_", filename)
-    return filename
+@app.post("/admin/locations/import", response_model=schemas.LocationImportReport)
+async def import_admin_locations(
+    manifest: UploadFile = File(...),
+    images: UploadFile = File(...),
+    manifest_format: Optional[str] = Form(None),
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Bulk import locations from a CSV or GeoJSON manifest and a zip archive of
+    the images it names. Rows that fail are listed in the report; the rest
+    are imported.
+    """
+    if not current_user or not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized"
+        )
+
+    with tempfile.TemporaryDirectory() as upload_dir:
+        manifest_path = Path(upload_dir) / sanitize_filename(manifest.filename)
+        archive_path = Path(upload_dir) / "images.zip"
+        with open(manifest_path, "wb") as buffer:
+            shutil.copyfileobj(manifest.file, buffer)
+        with open(archive_path, "wb") as buffer:
+            shutil.copyfileobj(images.file, buffer)
+
+        try:
+            # Image processing runs in worker processes; keep the event loop free
+            report = await asyncio.to_thread(
+                import_locations,
+                db,
+                manifest_path,
+                archive_path,
+                manifest_format=manifest_format,
+            )
+        except (ValueError, zipfile.BadZipFile) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(
+        f"Admin {current_user.id} imported {report['imported']} of "
+        f"{report['total']} locations"
+    )
+    return report
+
+
+@app.get("/admin/export/{table}")
+async def export_admin_data(
+    table: str,
+    format: str = "csv",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    watermark: Optional[str] = None,
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    Stream scores, game_sessions or challenge_scores as CSV, NDJSON or
+    Parquet, optionally limited to [start, end). Passing a `watermark` name
+    resumes from where the last export with that name finished.
+    """
+    if not current_user or not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized"
+        )
+
+    try:
+        chunks = export_table(table, format, start, end, watermark)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{table}.{format}"'
+        },
+    )
 
 
 @app.get("/admin/locations/uncategorized")
 async def get_uncategorized_locations(
+    response: Response,
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=MAX_ADMIN_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    difficulty: Optional[schemas.DifficultyLevel] = None,
+    country: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: schemas.ListFormat = schemas.ListFormat.JSON,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    """Get all locations that have no category assigned"""
+    """Get locations that have no category assigned (paginated like /admin/locations)"""
     if not current_user or not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized"
         )
 
-    locations = (
-        db.query(models.Location).filter(models.Location.category_id.is_(None)).all()
+    return _list_admin_locations(
+        db,
+        response,
+        limit,
+        cursor,
+        fields,
+        format,
+        uncategorized=True,
+        difficulty=difficulty,
+        country=country,
     )
 
-    return locations
-
 
 @app.get("/users/search", response_model=List[schemas.User])
 async def search_users(
@@ -934,26 +1569,13 @@ async def search_users(
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    # Search for users whose usernames contain the search term (case-insensitive)
-    # Exclude the current user and users who are already friends
-    users = (
-        db.query(models.User)
-        .filter(
-            models.User.id != current_user.id,  # Exclude current user
-            func.lower(models.User.username).contains(
-                func.lower(username)
-            ),  # Case-insensitive search
-            ~models.User.id.in_(  # Exclude existing friends
-                db.query(models.Friends.friend_id).filter(
-                    models.Friends.user_id == current_user.id
-                )
-            ),
-        )
-        .limit(10)  # Limit results for performance
-        .all()
-    )
+    if not username.strip():
+        return []
 
-    return users
+    # Excludes the current user and users who are already friends
+    return crud.search_users(
+        db, username.strip(), exclude_user_id=current_user.id, limit=USER_SEARCH_LIMIT
+    )
 
 
 @app.get("/users/{user_id}", response_model=schemas.User)
@@ -998,6 +1620,9 @@ async def get_user_achievements_by_id(
 @app.post("/challenges/", response_model=schemas.Challenge)
 async def create_challenge(
     friend_id: int,
+    category_id: Optional[int] = None,
+    difficulty: Optional[schemas.DifficultyLevel] = None,
+    calibrated: bool = False,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
@@ -1005,62 +1630,151 @@ async def create_challenge(
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     # Check if friend exists and is actually a friend
-    friendship = (
-        db.query(models.Friends)
-        .filter(
-            models.Friends.user_id == current_user.id,
-            models.Friends.friend_id == friend_id,
-        )
-        .first()
-    )
-
-    if not friendship:
+    if not friend_graph.are_friends(db, current_user.id, friend_id):
         raise HTTPException(status_code=404, detail="Friend not found")
 
+    # Select 5 random locations from the in-memory id index
+    location_ids = location_sampler.sample(
+        db,
+        CHALLENGE_LOCATION_COUNT,
+        category_id=category_id,
+        difficulty=difficulty.value if difficulty else None,
+        calibrated=calibrated,
+    )
+    if not location_ids:
+        raise HTTPException(status_code=404, detail="No locations available")
+
     # Create a new challenge
     challenge = models.Challenge(challenger_id=current_user.id, challenged_id=friend_id)
     db.add(challenge)
-    db.commit()
+    db.flush()
+
+    # Add all locations to the challenge in a single bulk insert
+    try:
+        db.execute(
+            insert(models.ChallengeLocation),
+            [
+                {
+                    "challenge_id": challenge.id,
+                    "location_id": location_id,
+                    "order_index": i + 1,  # 1-indexed
+                }
+                for i, location_id in enumerate(location_ids)
+            ],
+        )
+        db.commit()
+    except IntegrityError:
+        # A sampled location was deleted by another worker; rebuild the index
+        db.rollback()
+        location_sampler.invalidate()
+        raise HTTPException(
+            status_code=409, detail="Location pool changed, please try again"
+        )
+
     db.refresh(challenge)
+    broker.publish(db, [friend_id], challenge_event("challenge_created", challenge))
+    return challenge
 
-    # Select 5 random locations
-    locations = db.query(models.Location).order_by(func.random()).limit(5).all()
 
-    # Add these locations to the challenge
-    for i, location in enumerate(locations):
-        challenge_location = models.ChallengeLocation(
-            challenge_id=challenge.id,
-            location_id=location.id,
-            order_index=i + 1,  # 1-indexed
-        )
-        db.add(challenge_location)
+# Stream challenge events to the current user (Server-Sent Events)
+@app.get("/events/challenges")
+async def stream_challenge_events(request: Request, token: str):
+    """
+    Push challenge updates instead of having clients poll.
 
-    db.commit()
+    EventSource cannot send an Authorization header, so the access token is
+    passed as a query parameter. The database session is only held while
+    the token is checked, not for the lifetime of the stream.
+    """
+    db = SessionLocal()
+    try:
+        current_user = await get_current_user(token=token, db=db)
+        user_id = current_user.id if current_user else None
+    finally:
+        db.close()
 
-    return challenge
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    async def event_stream():
+        queue = broker.subscribe(user_id)
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=CHALLENGE_EVENTS_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            broker.unsubscribe(user_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # Get challenges for current user
 @app.get("/challenges/", response_model=List[schemas.ChallengeWithDetails])
 async def get_challenges(
     status: Optional[str] = None,
+    limit: int = Query(CHALLENGE_PAGE_SIZE, ge=1, le=MAX_CHALLENGE_PAGE_SIZE),
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
+    """
+    List the current user's challenges, newest first.
+
+    Pages are keyset-paginated: pass the created_at and id of the last
+    challenge of the previous page as `before` and `before_id`.
+    """
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    query = db.query(models.Challenge).filter(
-        or_(
-            models.Challenge.challenger_id == current_user.id,
-            models.Challenge.challenged_id == current_user.id,
+    query = (
+        db.query(models.Challenge)
+        .options(
+            selectinload(models.Challenge.challenger),
+            selectinload(models.Challenge.challenged),
+            selectinload(models.Challenge.winner),
+        )
+        .filter(
+            or_(
+                models.Challenge.challenger_id == current_user.id,
+                models.Challenge.challenged_id == current_user.id,
+            )
         )
     )
 
     if status:
         query = query.filter(models.Challenge.status == status)
 
-    challenges = query.order_by(models.Challenge.created_at.desc()).all()
+    if before is not None:
+        if before_id is not None:
+            query = query.filter(
+                or_(
+                    models.Challenge.created_at < before,
+                    and_(
+                        models.Challenge.created_at == before,
+                        models.Challenge.id < before_id,
+                    ),
+                )
+            )
+        else:
+            query = query.filter(models.Challenge.created_at < before)
+
+    challenges = (
+        query.order_by(models.Challenge.created_at.desc(), models.Challenge.id.desc())
+        .limit(limit)
+        .all()
+    )
     return challenges
 
 
@@ -1106,6 +1820,11 @@ async def respond_to_challenge(
 
     db.commit()
     db.refresh(challenge)
+    broker.publish(
+        db,
+        [challenge.challenger_id],
+        challenge_event("challenge_responded", challenge, accepted=accept),
+    )
     return challenge
 
 
@@ -1119,11 +1838,9 @@ async def get_challenge_detail(
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    # Get the challenge with challenger and challenged users
+    # Participants are only loaded when the static detail is not cached yet
     challenge = (
         db.query(models.Challenge)
-        .options(joinedload(models.Challenge.challenger))
-        .options(joinedload(models.Challenge.challenged))
         .filter(
             models.Challenge.id == challenge_id,
             or_(
@@ -1137,41 +1854,14 @@ async def get_challenge_detail(
     if not challenge:
         raise HTTPException(status_code=404, detail="Challenge not found")
 
-    # Get the challenge locations with their associated location details
-    challenge_locations = (
-        db.query(models.ChallengeLocation, models.Location)
-        .join(
-            models.Location, models.ChallengeLocation.location_id == models.Location.id
-        )
-        .filter(models.ChallengeLocation.challenge_id == challenge_id)
-        .order_by(models.ChallengeLocation.order_index)
-        .all()
-    )
-
-    # Get all guesses made by the current user for this challenge
-    user_guesses = (
-        db.query(models.ChallengeScore)
-        .filter(
-            models.ChallengeScore.challenge_id == challenge_id,
-            models.ChallengeScore.user_id == current_user.id,
-        )
-        .order_by(models.ChallengeScore.round_number.desc())
-        .all()
-    )
-
-    # Calculate the next round based on the last guess made
-    if user_guesses:
-        next_round = user_guesses[0].round_number + 1
-    else:
-        next_round = 1
+    # Participants, ordered locations and location metadata never change
+    static_detail = challenge_cache.get_static_detail(db, challenge)
 
-    # Update the challenge's current round
-    if not challenge.current_round or challenge.current_round != next_round:
-        challenge.current_round = next_round
-        db.commit()
+    # The current user's progress is the only per-request part; it is computed
+    # from their own guesses rather than written back on this GET
+    next_round = crud.get_next_challenge_round(db, challenge_id, current_user.id)
 
-    # Create the response data structure
-    response_data = {
+    return {
         "id": challenge.id,
         "challenger_id": challenge.challenger_id,
         "challenged_id": challenge.challenged_id,
@@ -1179,48 +1869,10 @@ async def get_challenge_detail(
         "created_at": challenge.created_at,
         "completed_at": challenge.completed_at,
         "winner_id": challenge.winner_id,
-        "current_round": challenge.current_round,
-        "challenger": {
-            "id": challenge.challenger.id,
-            "username": challenge.challenger.username,
-            "email": challenge.challenger.email,
-            "is_admin": challenge.challenger.is_admin,
-            "created_at": challenge.challenger.created_at,
-        },
-        "challenged": {
-            "id": challenge.challenged.id,
-            "username": challenge.challenged.username,
-            "email": challenge.challenged.email,
-            "is_admin": challenge.challenged.is_admin,
-            "created_at": challenge.challenged.created_at,
-        },
-        "locations": [
-            {
-                "id": cl.id,
-                "challenge_id": cl.challenge_id,
-                "location_id": cl.location_id,
-                "order_index": cl.order_index,
-                "location": {
-                    "id": loc.id,
-                    "name": loc.name,
-                    "latitude": loc.latitude,
-                    "longitude": loc.longitude,
-                    "image_url": loc.image_url,
-                    "category_id": loc.category_id,
-                    "difficulty_level": loc.difficulty_level,
-                    "country": loc.country,
-                    "region": loc.region,
-                    "description": loc.description,
-                    "created_at": loc.created_at,
-                    "updated_at": loc.updated_at,
-                },
-            }
-            for cl, loc in challenge_locations
-        ],
+        "current_round": next_round,
+        **static_detail,
     }
 
-    return response_data
-
 
 # Start a challenge (set to in_progress)
 @app.put("/challenges/{challenge_id}/start", response_model=schemas.Challenge)
@@ -1250,20 +1902,9 @@ async def start_challenge(
             status_code=404, detail="Challenge not found or not accepted"
         )
 
-    # Check if user has any existing guesses
-    existing_guesses = (
-        db.query(models.ChallengeScore)
-        .filter(
-            models.ChallengeScore.challenge_id == challenge_id,
-            models.ChallengeScore.user_id == current_user.id,
-        )
-        .order_by(models.ChallengeScore.round_number.desc())
-        .first()
-    )
-
     challenge.status = "in_progress"
-    challenge.current_round = (
-        (existing_guesses.round_number + 1) if existing_guesses else 1
+    challenge.current_round = crud.get_next_challenge_round(
+        db, challenge_id, current_user.id
     )
 
     db.commit()
@@ -1304,11 +1945,14 @@ async def submit_challenge_guess(
                 status_code=404, detail="Challenge not found or not in progress"
             )
 
-        # Verify the round number matches the challenge's current round
-        if guess.round_number != challenge.current_round:
+        # Verify the round number matches the player's own next round
+        expected_round = crud.get_next_challenge_round(
+            db, challenge_id, current_user.id
+        )
+        if guess.round_number != expected_round:
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid round number. Expected {challenge.current_round}, got {guess.round_number}",
+                detail=f"Invalid round number. Expected {expected_round}, got {guess.round_number}",
             )
 
         # Verify the location belongs to this challenge
@@ -1343,12 +1987,12 @@ async def submit_challenge_guess(
                 detail="You have already submitted a guess for this location",
             )
 
-        # Calculate distance and score
+        # Calculate distance and score against the true coordinates
+        actual_coordinates = location_index.get(db, guess.location_id)
+        if actual_coordinates is None:
+            raise HTTPException(status_code=404, detail="Location not found")
         distance = calculate_distance(
-            guess.guessed_latitude,
-            guess.guessed_longitude,
-            guess.actual_latitude,
-            guess.actual_longitude,
+            guess.guessed_latitude, guess.guessed_longitude, *actual_coordinates
         )
 
         # Base score uses existing calculation
@@ -1452,6 +2096,29 @@ async def submit_challenge_guess(
 
         db.commit()
         db.refresh(challenge_score)
+
+        # Let the opponent know about the guess, and both players about the end
+        opponent_id = (
+            challenge.challenged_id
+            if current_user.id == challenge.challenger_id
+            else challenge.challenger_id
+        )
+        broker.publish(
+            db,
+            [opponent_id],
+            challenge_event(
+                "challenge_guess",
+                challenge,
+                user_id=current_user.id,
+                round_number=challenge_score.round_number,
+            ),
+        )
+        if challenge.status == "completed":
+            broker.publish(
+                db,
+                [challenge.challenger_id, challenge.challenged_id],
+                challenge_event("challenge_completed", challenge),
+            )
         return challenge_score
 
     except SQLAlchemyError as e:
@@ -1475,10 +2142,23 @@ async def get_challenge_results(
 ):
     """
     Retrieve the results of a specific challenge.
+
+    Results of completed challenges are serialized once into
+    challenges.results_snapshot and served from a local LRU cache after
+    that; only challenges still in play are read from the live tables.
     """
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
+    cached_results = challenge_cache.get_results(challenge_id)
+    if cached_results is not None:
+        if current_user.id not in (
+            cached_results["challenge"]["challenger_id"],
+            cached_results["challenge"]["challenged_id"],
+        ):
+            raise HTTPException(status_code=404, detail="Challenge not found")
+        return cached_results
+
     # Get the challenge with challenger and challenged info
     challenge = (
         db.query(models.Challenge)
@@ -1497,6 +2177,10 @@ async def get_challenge_results(
     if not challenge:
         raise HTTPException(status_code=404, detail="Challenge not found")
 
+    if challenge.status == "completed" and challenge.results_snapshot:
+        challenge_cache.set_results(challenge_id, challenge.results_snapshot)
+        return challenge.results_snapshot
+
     # Get scores with user information
     scores = (
         db.query(models.ChallengeScore)
@@ -1506,6 +2190,7 @@ async def get_challenge_results(
     )
 
     # Check if we have all 10 guesses and challenge is still in progress
+    just_completed = False
     if len(scores) == 10 and challenge.status == "in_progress":
         # Calculate final scores for both players
         challenger_total = sum(
@@ -1528,11 +2213,28 @@ async def get_challenge_results(
         )
         db.commit()
         db.refresh(challenge)
+        just_completed = True
 
-    return schemas.ChallengeResults(
+    results = schemas.ChallengeResults(
         challenge=challenge, scores=scores, is_complete=challenge.status == "completed"
     )
 
+    if results.is_complete:
+        # Store the final results once; later reads skip the live tables
+        snapshot = results.model_dump(mode="json")
+        challenge.results_snapshot = snapshot
+        db.commit()
+        challenge_cache.set_results(challenge_id, snapshot)
+
+    if just_completed:
+        broker.publish(
+            db,
+            [challenge.challenger_id, challenge.challenged_id],
+            challenge_event("challenge_completed", challenge),
+        )
+
+    return results
+
 
 # Add this error handler
 @app.exception_handler(Exception)
@@ -1576,6 +2278,7 @@ async def delete_challenge(
 
     db.delete(challenge)
     db.commit()
+    challenge_cache.invalidate(challenge_id)
     return {"message": "Challenge deleted successfully"}
 
 
@@ -1693,20 +2396,7 @@ async def get_user_stats(
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    # Get user's average score and total guesses
-    stats = (
-        db.query(
-            func.count(models.Score.id).label("totalGuesses"),
-            func.avg(models.Score.score).label("averageScore"),
-        )
-        .filter(models.Score.user_id == user_id)
-        .first()
-    )
-
-    return {
-        "averageScore": float(stats.averageScore if stats.averageScore else 0),
-        "totalGuesses": stats.totalGuesses,
-    }
+    return user_stats.get_user_stats(db, user_id)
 
 
 @app.get("/users/stats/")
@@ -1718,17 +2408,4 @@ async def get_current_user_stats(
     if not current_user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    # Get user's average score and total guesses
-    stats = (
-        db.query(
-            func.count(models.Score.id).label("totalGuesses"),
-            func.avg(models.Score.score).label("averageScore"),
-        )
-        .filter(models.Score.user_id == current_user.id)
-        .first()
-    )
-
-    return {
-        "averageScore": float(stats.averageScore if stats.averageScore else 0),
-        "totalGuesses": stats.totalGuesses,
-    }
+    return user_stats.get_user_stats(db, current_user.id)
@@ -5,14 +5,19 @@ from sqlalchemy import (
     Float,
     ForeignKey,
     DateTime,
+    Date,
     Boolean,
     Text,
     TIMESTAMP,
     func,
     Enum as SQLAlchemyEnum,
     UniqueConstraint,
+    Index,
+    BigInteger,
+    LargeBinary,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from database import Base
 import enum
 
@@ -55,6 +60,7 @@ class User(Base):
         "Friends", foreign_keys="[Friends.friend_id]", back_populates="friend"
     )
     achievements = relationship("UserAchievement", back_populates="user")
+    stats = relationship("UserStats", back_populates="user", uselist=False)
 
 
 class Category(Base):
@@ -82,6 +88,11 @@ class Location(Base):
     )
     country = Column(String(100))
     region = Column(String(100))
+    # Perceptual hash of the photo, used to flag duplicate submissions
+    image_hash = Column(BigInteger)
+    # Weighted name/country/region/description vector, kept up to date by a
+    # trigger (see init.sql)
+    search_vector = deferred(Column(TSVECTOR))
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
     updated_at = Column(
         TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now()
@@ -91,6 +102,10 @@ class Location(Base):
     category = relationship("Category", back_populates="locations")
     scores = relationship("Score", back_populates="location")
 
+    __table_args__ = (
+        Index("idx_locations_search", "search_vector", postgresql_using="gin"),
+    )
+
     def get_full_image_url(self):
         """Return the full image URL path."""
         return f"images/{self.image_url}"
@@ -112,6 +127,8 @@ class PendingLocation(Base):
     )
     country = Column(String(100))
     region = Column(String(100))
+    # Perceptual hash of the photo, used to flag duplicate submissions
+    image_hash = Column(BigInteger)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
     status = Column(
         SQLAlchemyEnum(
@@ -119,9 +136,15 @@ class PendingLocation(Base):
         ),
         default="pending",
     )
+    # Moderator currently holding the submission, until claimed_until
+    claimed_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
+    claimed_until = Column(TIMESTAMP(timezone=True))
 
     # Relationships
-    user = relationship("User")
+    user = relationship("User", foreign_keys=[user_id])
+
+    # Keyset order of the moderation queue
+    __table_args__ = (Index("idx_pending_locations_status_id", "status", "id"),)
     category = relationship("Category")
 
     def get_full_image_url(self):
@@ -136,11 +159,20 @@ class GameSession(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     ended_at = Column(DateTime(timezone=True), nullable=True)
+    # Running totals, incremented as each guess of the session is submitted
+    total_score = Column(Integer, nullable=False, default=0, server_default="0")
+    rounds_played = Column(Integer, nullable=False, default=0, server_default="0")
+    category_id = Column(
+        Integer, ForeignKey("categories.id", ondelete="SET NULL"), nullable=True
+    )
 
     # Relationships
     user = relationship("User", back_populates="game_sessions")
     scores = relationship("Score", back_populates="game_session")
 
+    # Keyset order of incremental exports of finished sessions
+    __table_args__ = (Index("idx_game_sessions_ended_at", "ended_at", "id"),)
+
 
 class Score(Base):
     __tablename__ = "scores"
@@ -249,7 +281,12 @@ class Challenge(Base):
     challenged_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     status = Column(
         SQLAlchemyEnum(
-            "pending", "accepted", "in_progress", "completed", name="challenge_status"
+            "pending",
+            "accepted",
+            "in_progress",
+            "completed",
+            "expired",
+            name="challenge_status",
         ),
         default="pending",
     )
@@ -259,6 +296,8 @@ class Challenge(Base):
         Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True
     )
     current_round = Column(Integer, default=1)
+    # Serialized results, written once the challenge is completed
+    results_snapshot = Column(JSONB, nullable=True)
 
     # Relationships
     challenger = relationship(
@@ -271,6 +310,22 @@ class Challenge(Base):
     locations = relationship("ChallengeLocation", back_populates="challenge")
     scores = relationship("ChallengeScore", back_populates="challenge")
 
+    # Back the per-user listing, its status filter and created_at ordering
+    __table_args__ = (
+        Index(
+            "idx_challenges_challenger_status_created",
+            "challenger_id",
+            "status",
+            "created_at",
+        ),
+        Index(
+            "idx_challenges_challenged_status_created",
+            "challenged_id",
+            "status",
+            "created_at",
+        ),
+    )
+
 
 class ChallengeLocation(Base):
     __tablename__ = "challenge_locations"
@@ -309,7 +364,209 @@ class ChallengeScore(Base):
     location = relationship("Location")
 
     # Unique constraint to ensure one score per user per location in a challenge
-    __table_args__ = (UniqueConstraint("challenge_id", "user_id", "location_id"),)
+    __table_args__ = (
+        UniqueConstraint("challenge_id", "user_id", "location_id"),
+        # Keyset order of incremental exports
+        Index("idx_challenge_scores_created_at", "created_at", "id"),
+    )
+
+
+class ChallengeHistory(Base):
+    """Compact record of an archived challenge (see challenge_sweeper.py)."""
+
+    __tablename__ = "challenge_history"
+
+    challenge_id = Column(Integer, primary_key=True)
+    challenger_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    challenged_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    winner_id = Column(
+        Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True
+    )
+    challenger_score = Column(Integer, nullable=False, default=0)
+    challenged_score = Column(Integer, nullable=False, default=0)
+    created_at = Column(TIMESTAMP(timezone=True))
+    completed_at = Column(TIMESTAMP(timezone=True))
+
+    __table_args__ = (
+        Index("idx_challenge_history_challenger", "challenger_id"),
+        Index("idx_challenge_history_challenged", "challenged_id"),
+    )
+
+
+class UserStats(Base):
+    """Per-user score rollup, maintained by triggers on scores (see init.sql)."""
+
+    __tablename__ = "user_stats"
+
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    total_guesses = Column(Integer, nullable=False, default=0)
+    total_score = Column(BigInteger, nullable=False, default=0, index=True)
+    best_score = Column(Integer, nullable=False, default=0)
+    # Consecutive UTC days with at least one guess, ending on last_played_on
+    current_streak = Column(Integer, nullable=False, default=0)
+    longest_streak = Column(Integer, nullable=False, default=0)
+    last_played_on = Column(Date)
+
+    # Relationship
+    user = relationship("User", back_populates="stats")
+
+
+class UserCategoryStats(Base):
+    """Per-user, per-category score rollup (see UserStats)."""
+
+    __tablename__ = "user_category_stats"
+
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    category_id = Column(
+        Integer, ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True
+    )
+    total_guesses = Column(Integer, nullable=False, default=0)
+    total_score = Column(BigInteger, nullable=False, default=0)
+    best_score = Column(Integer, nullable=False, default=0)
+
+    category = relationship("Category")
+
+
+class UserDifficultyStats(Base):
+    """Per-user, per-difficulty score rollup (see UserStats)."""
+
+    __tablename__ = "user_difficulty_stats"
+
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    difficulty_level = Column(String(20), primary_key=True)
+    total_guesses = Column(Integer, nullable=False, default=0)
+    total_score = Column(BigInteger, nullable=False, default=0)
+    best_score = Column(Integer, nullable=False, default=0)
+
+
+class TableCounter(Base):
+    """
+    Row counts maintained by triggers (see init.sql). Each counter is spread
+    over several shards so concurrent inserts do not queue on one row.
+    """
+
+    __tablename__ = "table_counters"
+
+    name = Column(String(50), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+
+class TableCounterSeed(Base):
+    """A table whose counter holds a full count; triggers skip the others."""
+
+    __tablename__ = "table_counter_seeds"
+
+    name = Column(String(50), primary_key=True)
+    seeded_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+
+class LocationDifficultyStats(Base):
+    """
+    How players actually do on a location, aggregated from scores by
+    location_calibration.py. The distance sketch is a log-bucketed histogram
+    of guess distances, so batches can be merged by adding counts.
+    """
+
+    __tablename__ = "location_difficulty_stats"
+
+    location_id = Column(
+        Integer, ForeignKey("locations.id", ondelete="CASCADE"), primary_key=True
+    )
+    guess_count = Column(Integer, nullable=False, default=0)
+    total_distance_km = Column(Float, nullable=False, default=0)
+    total_score = Column(BigInteger, nullable=False, default=0)
+    distance_sketch = Column(ARRAY(Integer), nullable=False)
+    median_distance_km = Column(Float)
+    # Derived from the median distance; NULL until the location has enough guesses
+    empirical_difficulty = Column(String(20))
+    updated_at = Column(
+        TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class LocationHeatmap(Base):
+    """
+    Where players guessed a location, binned into Web Mercator tiles at
+    `zoom` by guess_heatmaps.py. Only tiles with guesses are stored: `cells`
+    holds the tile numbers (y * 2^zoom + x) in ascending order and `counts`
+    the guesses in each.
+    """
+
+    __tablename__ = "location_heatmaps"
+
+    location_id = Column(
+        Integer, ForeignKey("locations.id", ondelete="CASCADE"), primary_key=True
+    )
+    zoom = Column(Integer, nullable=False)
+    cells = Column(ARRAY(Integer), nullable=False)
+    counts = Column(ARRAY(Integer), nullable=False)
+    total_guesses = Column(Integer, nullable=False, default=0)
+    updated_at = Column(
+        TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class ScoreDistribution(Base):
+    """
+    Histogram of guess scores on a location or in a category, folded from
+    scores by score_percentiles.py and used to rank new guesses.
+    """
+
+    __tablename__ = "score_distributions"
+
+    scope = Column(String(20), primary_key=True)  # "location" or "category"
+    scope_id = Column(Integer, primary_key=True)
+    counts = Column(ARRAY(Integer), nullable=False)
+    total_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(
+        TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class UserActivityHour(Base):
+    """Guesses per user and clock hour over the last day, kept by a trigger."""
+
+    __tablename__ = "user_activity_hours"
+
+    hour = Column(TIMESTAMP(timezone=True), primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    guesses = Column(Integer, nullable=False, default=0)
+
+
+class IdempotencyKey(Base):
+    """Stored response of a request sent with an Idempotency-Key (see idempotency.py)."""
+
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(64), primary_key=True)
+    # NULL while the first request is still running
+    status_code = Column(Integer)
+    body = Column(LargeBinary)
+    media_type = Column(String(255))
+    created_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+
+
+class ExportWatermark(Base):
+    """Position reached by a named incremental export (see data_export.py)."""
+
+    __tablename__ = "export_watermarks"
+
+    name = Column(String(100), primary_key=True)
+    table_name = Column(String(50), nullable=False)
+    last_timestamp = Column(TIMESTAMP(timezone=True), nullable=False)
+    last_id = Column(Integer, nullable=False)
+    updated_at = Column(
+        TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
 
 
 class GameResult(Base):
@@ -0,0 +1,74 @@
+import base64
+import json
+import logging
+from typing import Any, Callable, Iterator, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Header carrying the cursor of the next page on list endpoints
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Rows fetched per round trip from a server-side cursor when streaming
+STREAM_BATCH_SIZE = 1000
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode the sort key of the last row of a page as an opaque cursor."""
+    payload = json.dumps(list(values), default=str).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor: Optional[str], *types) -> Optional[list]:
+    """
+    Decode a cursor made by encode_cursor. When `types` are given, the
+    cursor must hold one value of each type (as for isinstance), in order.
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if types and not (
+        isinstance(values, list)
+        and len(values) == len(types)
+        and all(
+            isinstance(value, value_type) and not isinstance(value, bool)
+            for value, value_type in zip(values, types)
+        )
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def stream_ndjson(
+    build_query: Callable, serialize: Callable[[Any], dict]
+) -> StreamingResponse:
+    """
+    Stream query results as newline-delimited JSON.
+
+    The query is built on a session owned by the stream (the request's
+    session is closed before the body is sent) and read through a
+    server-side cursor, so memory stays flat whatever the result size.
+    """
+
+    def rows() -> Iterator[str]:
+        db = SessionLocal()
+        try:
+            query = build_query(db).execution_options(
+                stream_results=True, yield_per=STREAM_BATCH_SIZE
+            )
+            for row in query:
+                yield json.dumps(serialize(row), default=str) + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming rows: {str(e)}")
+            raise
+        finally:
+            db.close()
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
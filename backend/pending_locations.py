@@ -1,18 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Form, File, UploadFile
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    status,
+    Form,
+    File,
+    UploadFile,
+    Query,
+    Response,
+)
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import crud
 import models
 import schemas
 from dependencies import get_db, get_current_user, get_current_admin_user
+from location_sampler import location_sampler
+from location_index import location_index
+from duplicate_detection import duplicate_index, image_dhash
+from pagination import decode_cursor, encode_cursor, NEXT_CURSOR_HEADER
 from datetime import datetime
 from pathlib import Path
 import logging
+import os
 
 # Setup directories
 IMAGES_DIR = Path("images")
 IMAGES_DIR.mkdir(exist_ok=True)
 
+MODERATION_PAGE_SIZE = 50
+MAX_MODERATION_BATCH_SIZE = 500
+# Seconds a moderator holds claimed submissions before others can take them
+PENDING_CLAIM_LEASE_SECONDS = int(os.getenv("PENDING_CLAIM_LEASE_SECONDS", 600))
+
 router = APIRouter(
     prefix="/api/locations/pending",
     tags=["pending_locations"],
@@ -60,27 +80,51 @@ async def create_pending_location(
         country=country,
         region=region,
         image_url=file_name,
+        image_hash=image_dhash(file_path),
         status="pending",
     )
 
-    return crud.create_pending_location(
+    pending_location = crud.create_pending_location(
         db=db, location=location_data, user_id=current_user.id
     )
+    duplicate_index.add(
+        "pending",
+        pending_location.id,
+        pending_location.latitude,
+        pending_location.longitude,
+        pending_location.image_hash,
+    )
+    return pending_location
 
 
 @router.get("/", response_model=List[schemas.PendingLocation])
 def get_pending_locations(
+    response: Response,
+    limit: int = Query(MODERATION_PAGE_SIZE, ge=1, le=MAX_MODERATION_BATCH_SIZE),
+    cursor: Optional[str] = None,
+    available_only: bool = False,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_admin_user),
 ):
-    """Get all pending location submissions (admin only)."""
+    """
+    Get pending location submissions in id order, one page at a time (admin
+    only). The cursor of the next page is returned in the X-Next-Cursor
+    header. With available_only, submissions claimed by other moderators
+    are left out.
+    """
+    if not current_user or not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to view pending locations",
+        )
+    after = decode_cursor(cursor, int)
     try:
-        if not current_user or not current_user.is_admin:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not authorized to view pending locations",
-            )
-        return crud.get_pending_locations(db=db)
+        locations = crud.get_pending_locations(
+            db=db,
+            limit=limit + 1,
+            after_id=after[0] if after else None,
+            available_to=current_user.id if available_only else None,
+        )
     except Exception as e:
         logger.error(f"Error fetching pending locations: {str(e)}")
         raise HTTPException(
@@ -88,6 +132,148 @@ def get_pending_locations(
             detail="Error fetching pending locations",
         )
 
+    if len(locations) > limit:
+        locations = locations[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(locations[-1].id)
+    return duplicate_index.annotate(db, locations)
+
+
+@router.get(
+    "/{location_id}/duplicates", response_model=List[schemas.DuplicateCandidate]
+)
+def get_pending_location_duplicates(
+    location_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_admin_user),
+):
+    """Locations and submissions near a submission, with photo similarity (admin only)."""
+    pending_location = db.get(models.PendingLocation, location_id)
+    if not pending_location:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Pending location not found"
+        )
+    return duplicate_index.find(
+        db,
+        pending_location.latitude,
+        pending_location.longitude,
+        pending_location.image_hash,
+        exclude=("pending", pending_location.id),
+    )
+
+
+@router.post("/claim", response_model=List[schemas.PendingLocation])
+def claim_pending_locations(
+    limit: int = Query(MODERATION_PAGE_SIZE, ge=1, le=MAX_MODERATION_BATCH_SIZE),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_admin_user),
+):
+    """
+    Lease the oldest available submissions to the current moderator for
+    PENDING_CLAIM_LEASE_SECONDS (admin only). Concurrent claims never
+    return the same submission.
+    """
+    claimed = crud.claim_pending_locations(
+        db=db,
+        moderator_id=current_user.id,
+        limit=limit,
+        lease_seconds=PENDING_CLAIM_LEASE_SECONDS,
+    )
+    logger.info(f"Moderator {current_user.id} claimed {len(claimed)} locations")
+    return duplicate_index.annotate(db, claimed)
+
+
+@router.post("/release")
+def release_pending_locations(
+    body: schemas.PendingLocationIds,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_admin_user),
+):
+    """Give back submissions claimed by the current moderator (admin only)."""
+    released = crud.release_pending_locations(
+        db=db, moderator_id=current_user.id, location_ids=body.ids
+    )
+    return {"released": released}
+
+
+@router.post("/approve", response_model=schemas.PendingLocationApproval)
+def approve_pending_locations(
+    body: schemas.PendingLocationIds,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_admin_user),
+):
+    """
+    Approve several submissions in one transaction (admin only). Ids that
+    are no longer pending or are claimed by another moderator are skipped.
+    """
+    _check_batch_size(body.ids)
+    try:
+        approved_ids, approved = crud.approve_pending_locations(
+            db=db, location_ids=body.ids, moderator_id=current_user.id
+        )
+    except Exception as e:
+        logger.error(f"Error approving locations {body.ids}: {str(e)}")
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error approving locations: {str(e)}",
+        )
+
+    if approved:
+        location_sampler.invalidate()
+        for location in approved:
+            location_index.upsert(
+                location.id, location.latitude, location.longitude, location.category_id
+            )
+            duplicate_index.add(
+                "location",
+                location.id,
+                location.latitude,
+                location.longitude,
+                location.image_hash,
+            )
+    for location_id in approved_ids:
+        duplicate_index.remove("pending", location_id)
+    logger.info(f"Moderator {current_user.id} approved {len(approved)} locations")
+    return {
+        "approved": approved,
+        "skipped": [
+            location_id for location_id in body.ids if location_id not in approved_ids
+        ],
+    }
+
+
+@router.post("/reject", response_model=schemas.PendingLocationRejection)
+def reject_pending_locations(
+    body: schemas.PendingLocationIds,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_admin_user),
+):
+    """
+    Reject several submissions in one statement (admin only). Ids that are
+    no longer pending or are claimed by another moderator are skipped.
+    """
+    _check_batch_size(body.ids)
+    rejected = crud.reject_pending_locations(
+        db=db, location_ids=body.ids, moderator_id=current_user.id
+    )
+    for location_id in rejected:
+        duplicate_index.remove("pending", location_id)
+    logger.info(f"Moderator {current_user.id} rejected {len(rejected)} locations")
+    return {
+        "rejected": rejected,
+        "skipped": [
+            location_id for location_id in body.ids if location_id not in rejected
+        ],
+    }
+
+
+def _check_batch_size(location_ids: List[int]):
+    if len(location_ids) > MAX_MODERATION_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_MODERATION_BATCH_SIZE} locations per request",
+        )
+
 
 @router.post("/{location_id}/approve", response_model=schemas.Location)
 def approve_pending_location(
@@ -98,7 +284,17 @@ def approve_pending_location(
     """Approve a pending location and move it to the main locations table (admin only)."""
     logger.info(f"Attempting to approve location {location_id}")
     try:
-        result = crud.approve_pending_location(db=db, location_id=location_id)
+        result = crud.approve_pending_location(
+            db=db, location_id=location_id, moderator_id=current_user.id
+        )
+        location_sampler.invalidate()
+        location_index.upsert(
+            result.id, result.latitude, result.longitude, result.category_id
+        )
+        duplicate_index.remove("pending", location_id)
+        duplicate_index.add(
+            "location", result.id, result.latitude, result.longitude, result.image_hash
+        )
         logger.info(f"Successfully approved location {location_id}")
         return result
     except Exception as e:
@@ -118,7 +314,10 @@ def reject_pending_location(
     """Reject and delete a pending location (admin only)."""
     logger.info(f"Attempting to reject location {location_id}")
     try:
-        result = crud.reject_pending_location(db=db, location_id=location_id)
+        result = crud.reject_pending_location(
+            db=db, location_id=location_id, moderator_id=current_user.id
+        )
+        duplicate_index.remove("pending", location_id)
         logger.info(f"Successfully rejected location {location_id}")
         return {"message": "Location rejected successfully"}
     except Exception as e:
@@ -27,6 +27,11 @@ class User(UserBase):
         from_attributes = True
 
 
+class FriendSuggestion(BaseModel):
+    user: User
+    mutual_friends: int
+
+
 class LocationCategory(str, Enum):
     LANDMARK = "landmark"
     NATURE = "nature"
@@ -46,6 +51,22 @@ class DifficultyLevel(str, Enum):
     HARD = "hard"
 
 
+class SortOrder(str, Enum):
+    ASC = "asc"
+    DESC = "desc"
+
+
+class ListFormat(str, Enum):
+    JSON = "json"
+    NDJSON = "ndjson"
+
+
+class AdminUserSort(str, Enum):
+    CREATED_AT = "created_at"
+    USERNAME = "username"
+    TOTAL_SCORE = "total_score"
+
+
 class CategoryBase(BaseModel):
     name: str
 
@@ -100,6 +121,29 @@ class Location(BaseModel):
         from_attributes = True
 
 
+class LocationCalibration(BaseModel):
+    location_id: int
+    difficulty_level: str
+    guess_count: int
+    mean_distance_km: Optional[float] = None
+    median_distance_km: Optional[float] = None
+    mean_score: Optional[float] = None
+    empirical_difficulty: Optional[str] = None
+
+
+class GuessHeatmap(BaseModel):
+    """Guess counts per Web Mercator tile; tile number = y * 2^zoom + x."""
+
+    location_id: int
+    zoom: int
+    total_guesses: int
+    cells: List[int]
+    counts: List[int]
+
+    class Config:
+        from_attributes = True
+
+
 class PendingLocationBase(LocationBase):
     image_url: str
 
@@ -114,15 +158,54 @@ class PendingLocationCreate(BaseModel):
     country: str
     region: str
     image_url: str
+    image_hash: Optional[int] = None
     status: str = "pending"
 
 
+class PendingLocationIds(BaseModel):
+    ids: List[int]
+
+
+class PendingLocationApproval(BaseModel):
+    approved: List[Location]
+    skipped: List[int]
+
+
+class PendingLocationRejection(BaseModel):
+    rejected: List[int]
+    skipped: List[int]
+
+
+class LocationImportFailure(BaseModel):
+    row: int
+    error: str
+
+
+class LocationImportReport(BaseModel):
+    total: int
+    imported: int
+    location_ids: List[int]
+    failed: List[LocationImportFailure]
+
+
+class DuplicateCandidate(BaseModel):
+    kind: str  # "location" or "pending"
+    id: int
+    distance_m: float
+    image_similarity: Optional[float] = None
+    likely_duplicate: bool
+
+
 class PendingLocation(PendingLocationBase):
     id: int
     user_id: int
     image_url: str
     created_at: datetime
     status: str
+    claimed_by: Optional[int] = None
+    claimed_until: Optional[datetime] = None
+    # Filled in by the moderation endpoints
+    duplicates: List[DuplicateCandidate] = []
 
     @validator("image_url", pre=True)
     def get_full_image_url(cls, v):
@@ -146,6 +229,9 @@ class GameSession(GameSessionBase):
     id: int
     started_at: datetime
     ended_at: Optional[datetime] = None
+    total_score: int = 0
+    rounds_played: int = 0
+    category_id: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -164,6 +250,14 @@ class LeaderboardEntry(BaseModel):
         from_attributes = True
 
 
+class FriendLeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    username: str
+    score: int
+    is_current_user: bool
+
+
 class FriendBase(BaseModel):
     user_id: int
     friend_id: int
@@ -182,8 +276,6 @@ class GuessCreate(BaseModel):
     location_id: int
     guessed_latitude: float
     guessed_longitude: float
-    actual_latitude: float
-    actual_longitude: float
     game_session_id: Optional[int] = None
 
 
@@ -275,8 +367,6 @@ class ChallengeGuessCreate(BaseModel):
     location_id: int
     guessed_latitude: float
     guessed_longitude: float
-    actual_latitude: float
-    actual_longitude: float
     time_taken: int  # In seconds
     round_number: int
 
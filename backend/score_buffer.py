@@ -0,0 +1,412 @@
+import csv
+import io
+import json
+import logging
+import os
+import secrets
+import threading
+from collections import deque
+from pathlib import Path
+from typing import List, Optional
+
+import psycopg2
+from sqlalchemy import exc as sa_exc
+
+from database import engine
+
+try:
+    import fcntl
+except ImportError:  # Journal locking is only available on Unix
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# "direct" inserts every guess in its own transaction, "buffered" enables
+# write-behind ingestion through this module. Buffered mode needs a single
+# API worker: ending a game session only flushes the ending worker's buffer,
+# so guesses still queued in another worker would miss the session's totals
+SCORE_INGESTION_MODE = os.getenv("SCORE_INGESTION_MODE", "direct").lower()
+# Seconds between flushes of the buffer
+SCORE_FLUSH_INTERVAL = float(os.getenv("SCORE_FLUSH_INTERVAL", 2))
+# Number of buffered guesses that triggers an early flush, and the batch size
+SCORE_FLUSH_SIZE = int(os.getenv("SCORE_FLUSH_SIZE", 500))
+# Guesses held in memory before submissions fall back to direct inserts
+SCORE_BUFFER_MAX_SIZE = int(os.getenv("SCORE_BUFFER_MAX_SIZE", 10000))
+# Append-only journal replayed after a crash (empty disables it). Each worker
+# journals to its own file next to this path (score_journal.<worker>.jsonl)
+SCORE_JOURNAL_PATH = os.getenv("SCORE_JOURNAL_PATH", "score_journal.jsonl")
+SCORE_JOURNAL_FSYNC = os.getenv("SCORE_JOURNAL_FSYNC", "false").lower() == "true"
+# Guesses that cannot be written even on their own are appended here
+# (empty only logs them)
+SCORE_DEAD_LETTER_PATH = os.getenv("SCORE_DEAD_LETTER_PATH", "score_dead_letter.jsonl")
+
+# Errors that mean the database could not be reached rather than that the
+# rows were rejected; the batch is kept and retried on the next flush
+_TRANSIENT_ERRORS = (
+    psycopg2.OperationalError,
+    psycopg2.InterfaceError,
+    sa_exc.OperationalError,
+    sa_exc.InterfaceError,
+)
+
+# created_at is left to the column default, so a buffered or replayed score
+# is stamped when it reaches the table and never lands behind the watermark
+# of the jobs that fold new scores in (see data_export.fold_new_rows)
+SCORE_COLUMNS = (
+    "user_id",
+    "location_id",
+    "game_session_id",
+    "score",
+    "guess_latitude",
+    "guess_longitude",
+)
+
+COPY_SCORES_SQL = (
+    f"COPY scores ({', '.join(SCORE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+)
+
+UPDATE_SESSIONS_SQL = """
+    UPDATE game_sessions gs SET
+        total_score = gs.total_score + v.total_score,
+        rounds_played = gs.rounds_played + v.rounds_played,
+        category_id = COALESCE(
+            gs.category_id,
+            (SELECT category_id FROM locations WHERE id = v.location_id)
+        )
+    FROM (
+        SELECT
+            unnest(%s::int[]) AS id,
+            unnest(%s::int[]) AS user_id,
+            unnest(%s::int[]) AS total_score,
+            unnest(%s::int[]) AS rounds_played,
+            unnest(%s::int[]) AS location_id
+    ) v
+    WHERE gs.id = v.id AND gs.user_id = v.user_id
+"""
+
+AWARD_ACHIEVEMENTS_SQL = """
+    SELECT check_and_award_achievements(t.user_id, t.location_id, t.score)
+    FROM unnest(%s::int[], %s::int[], %s::int[]) AS t(user_id, location_id, score)
+"""
+
+
+class ScoreBuffer:
+    """
+    Write-behind ingestion of guesses into the scores table.
+
+    Guesses are appended to a bounded in-memory queue (and to an append-only
+    journal when SCORE_JOURNAL_PATH is set). A flusher thread COPYs them into
+    scores in batches, then updates game session totals and achievements
+    with one statement each per batch. The category leaderboard trigger is
+    statement-level, so it also runs once per batch.
+
+    Every worker keeps its own journal and holds a lock on it while it runs.
+    On start, journals that no running worker holds are replayed into the
+    new worker's queue (and journal), then removed.
+
+    Delivery is at-least-once: a crash between a committed batch and its
+    journal checkpoint replays that batch on the next start.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = SCORE_FLUSH_INTERVAL,
+        flush_size: int = SCORE_FLUSH_SIZE,
+        max_size: int = SCORE_BUFFER_MAX_SIZE,
+        journal_path: Optional[str] = SCORE_JOURNAL_PATH,
+    ):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_size = max_size
+        self.journal_base = Path(journal_path) if journal_path else None
+        # Set on start, so every (forked) worker gets its own journal
+        self.journal_path: Optional[Path] = None
+        self.checkpoint_path: Optional[Path] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._pending = deque()
+        self._sequence = 0
+        self._journal = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Replay the journal and start the flusher thread."""
+        if self.enabled:
+            return
+        orphans = self._recover()
+        if self.journal_base:
+            base = self.journal_base
+            worker = f"{os.getpid()}-{secrets.token_hex(4)}"
+            self.journal_path = base.with_name(f"{base.stem}.{worker}{base.suffix}")
+            self.checkpoint_path = self.journal_path.with_suffix(".checkpoint")
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+            if fcntl is not None:
+                fcntl.flock(self._journal, fcntl.LOCK_EX)
+            # Carry the replayed guesses over before dropping the old journals
+            for entry in self._pending:
+                self._journal.write(json.dumps(entry) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        for path, journal in orphans:
+            path.unlink(missing_ok=True)
+            path.with_suffix(".checkpoint").unlink(missing_ok=True)
+            journal.close()
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="score-buffer-flusher", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Buffered score ingestion started ({len(self._pending)} replayed)")
+
+    def stop(self):
+        """Stop the flusher and write out everything that is still buffered."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+            if not self._pending:
+                self.journal_path.unlink(missing_ok=True)
+                self.checkpoint_path.unlink(missing_ok=True)
+
+    def enqueue(
+        self,
+        user_id: int,
+        location_id: int,
+        score: int,
+        guess_latitude: float,
+        guess_longitude: float,
+        game_session_id: Optional[int] = None,
+    ) -> bool:
+        """
+        Buffer a guess. Returns False when the buffer is full or disabled,
+        in which case the caller should insert the score directly.
+        """
+        if not self.enabled:
+            return False
+
+        with self._lock:
+            if len(self._pending) >= self.max_size:
+                return False
+            self._sequence += 1
+            entry = {
+                "seq": self._sequence,
+                "user_id": user_id,
+                "location_id": location_id,
+                "game_session_id": game_session_id,
+                "score": score,
+                "guess_latitude": guess_latitude,
+                "guess_longitude": guess_longitude,
+            }
+            if self._journal is not None:
+                self._journal.write(json.dumps(entry) + "\n")
+                self._journal.flush()
+                if SCORE_JOURNAL_FSYNC:
+                    os.fsync(self._journal.fileno())
+            self._pending.append(entry)
+            pending = len(self._pending)
+
+        if pending >= self.flush_size:
+            self._wakeup.set()
+        return True
+
+    def pending_for_session(self, game_session_id: int) -> int:
+        """Number of guesses of a game session still waiting in the buffer."""
+        with self._lock:
+            return sum(
+                1
+                for entry in self._pending
+                if entry["game_session_id"] == game_session_id
+            )
+
+    def flush(self) -> int:
+        """Write all buffered guesses to the database. Returns the row count."""
+        flushed = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [
+                        self._pending.popleft()
+                        for _ in range(min(self.flush_size, len(self._pending)))
+                    ]
+                if not batch:
+                    return flushed
+
+                try:
+                    self._write_batch(batch)
+                    remaining = []
+                except _TRANSIENT_ERRORS as e:
+                    logger.error(f"Error flushing {len(batch)} buffered scores: {e}")
+                    remaining = batch
+                except Exception as e:
+                    # A single bad row fails the whole COPY; find it
+                    logger.warning(
+                        f"Batch of {len(batch)} buffered scores was rejected ({e}), "
+                        "retrying row by row"
+                    )
+                    remaining = self._write_rows(batch)
+
+                written = len(batch) - len(remaining)
+                if remaining:
+                    with self._lock:
+                        self._pending.extendleft(reversed(remaining))
+                if written:
+                    self._checkpoint(batch[written - 1]["seq"])
+                    flushed += written
+                if remaining:
+                    return flushed
+
+    def _write_rows(self, batch: list) -> list:
+        """
+        Write guesses one at a time, dead-lettering the ones the database
+        rejects. Returns the guesses left unwritten because the database
+        became unreachable.
+        """
+        for position, entry in enumerate(batch):
+            try:
+                self._write_batch([entry])
+            except _TRANSIENT_ERRORS as e:
+                logger.error(f"Error writing buffered score: {e}")
+                return batch[position:]
+            except Exception as e:
+                self._dead_letter(entry, e)
+        return []
+
+    def _dead_letter(self, entry: dict, error: Exception):
+        logger.error(f"Dropping buffered score {entry} that cannot be written: {error}")
+        if not SCORE_DEAD_LETTER_PATH:
+            return
+        try:
+            with open(SCORE_DEAD_LETTER_PATH, "a", encoding="utf-8") as dead_letter:
+                dead_letter.write(json.dumps({**entry, "error": str(error)}) + "\n")
+        except OSError as e:
+            logger.error(f"Could not write to the score dead-letter file: {e}")
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _write_batch(self, batch: list):
+        rows = io.StringIO()
+        writer = csv.writer(rows)
+        for entry in batch:
+            writer.writerow(
+                "" if entry[column] is None else entry[column]
+                for column in SCORE_COLUMNS
+            )
+        rows.seek(0)
+
+        # Aggregate the batch per game session for a single UPDATE
+        sessions = {}
+        for entry in batch:
+            if entry["game_session_id"] is None:
+                continue
+            key = (entry["game_session_id"], entry["user_id"])
+            total, rounds, location_id = sessions.get(key, (0, 0, entry["location_id"]))
+            sessions[key] = (total + entry["score"], rounds + 1, location_id)
+
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.copy_expert(COPY_SCORES_SQL, rows)
+            if sessions:
+                cursor.execute(
+                    UPDATE_SESSIONS_SQL,
+                    (
+                        [session_id for session_id, _ in sessions],
+                        [user_id for _, user_id in sessions],
+                        [total for total, _, _ in sessions.values()],
+                        [rounds for _, rounds, _ in sessions.values()],
+                        [location_id for _, _, location_id in sessions.values()],
+                    ),
+                )
+            cursor.execute(
+                AWARD_ACHIEVEMENTS_SQL,
+                (
+                    [entry["user_id"] for entry in batch],
+                    [entry["location_id"] for entry in batch],
+                    [entry["score"] for entry in batch],
+                ),
+            )
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    def _checkpoint(self, sequence: int):
+        if self.journal_path is None:
+            return
+        with self._lock:
+            if not self._pending and self._journal is not None:
+                # Everything is in the database: start a fresh journal
+                self._journal.truncate(0)
+                self._journal.seek(0)
+                self.checkpoint_path.unlink(missing_ok=True)
+                self._sequence = 0
+            else:
+                self.checkpoint_path.write_text(str(sequence))
+
+    def _journals(self) -> List[Path]:
+        base = self.journal_base
+        # The unsuffixed path is the journal of versions before per-worker files
+        return sorted({base, *base.parent.glob(f"{base.stem}.*{base.suffix}")})
+
+    def _recover(self) -> list:
+        """
+        Queue the entries of journals left behind by stopped or crashed
+        workers that were not checkpointed. Returns the journals read, still
+        open and locked, to be removed once their entries are in this
+        worker's journal.
+        """
+        if self.journal_base is None:
+            return []
+        recovered = []
+        for path in self._journals():
+            try:
+                journal = open(path, encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            if fcntl is not None:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    if os.stat(path).st_ino != os.fstat(journal.fileno()).st_ino:
+                        raise FileNotFoundError(path)
+                except (BlockingIOError, FileNotFoundError):
+                    # Owned by a running worker, or already recovered by one
+                    journal.close()
+                    continue
+
+            checkpoint_path = path.with_suffix(".checkpoint")
+            checkpoint = 0
+            if checkpoint_path.exists():
+                checkpoint = int(checkpoint_path.read_text() or 0)
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn write at the end of the journal
+                    logger.warning("Skipping unreadable score journal entry")
+                    continue
+                if entry["seq"] > checkpoint:
+                    self._sequence += 1
+                    entry["seq"] = self._sequence
+                    self._pending.append(entry)
+            recovered.append((path, journal))
+        return recovered
+
+
+score_buffer = ScoreBuffer()
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import threading
+from itertools import accumulate
+from typing import Iterable, Optional
+
+from cachetools import TTLCache
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import models
+from data_export import fold_new_rows
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Scores folded into the sketches per transaction
+SCORE_SKETCH_BATCH_SIZE = int(os.getenv("SCORE_SKETCH_BATCH_SIZE", 20000))
+# Seconds between sketch updates inside the API process (0 disables)
+SCORE_SKETCH_INTERVAL = int(os.getenv("SCORE_SKETCH_INTERVAL", 60))
+# Seconds a worker keeps a loaded sketch before reading the merged one again
+SCORE_SKETCH_CACHE_TTL = int(os.getenv("SCORE_SKETCH_CACHE_TTL", 60))
+SCORE_SKETCH_CACHE_SIZE = int(os.getenv("SCORE_SKETCH_CACHE_SIZE", 20000))
+
+# Watermark (in export_watermarks) of the last score folded in
+SCORE_SKETCH_WATERMARK = "score_sketches"
+# Key of the advisory lock that keeps sketch updates from overlapping
+_SCORE_SKETCH_LOCK_KEY = 50_001
+
+# Guess scores run from 0 to 5000, so the sketch is a fixed-width histogram:
+# percentiles are interpolated within a bucket of BUCKET_WIDTH points
+MAX_SCORE = 5000
+BUCKET_WIDTH = 25
+SKETCH_BUCKETS = MAX_SCORE // BUCKET_WIDTH + 1
+
+NEW_SCORES_SQL = text(
+    """
+    SELECT s.id, s.location_id, l.category_id, s.score, s.created_at
+    FROM scores s
+    JOIN locations l ON l.id = s.location_id
+    WHERE (s.created_at, s.id) > (:last_timestamp, :last_id)
+    AND s.created_at < :horizon
+    ORDER BY s.created_at, s.id
+    LIMIT :batch_size
+    """
+)
+
+
+class ScoreSketch:
+    """
+    Histogram of guess scores.
+
+    Sketches merge by adding their bucket counts, so the ones built by
+    separate batches (or workers) combine exactly. Prefix sums are kept
+    alongside the counts, making a percentile lookup a constant-time read.
+    """
+
+    def __init__(self, counts: Optional[Iterable[int]] = None):
+        self.counts = list(counts or [])
+        self.counts.extend([0] * (SKETCH_BUCKETS - len(self.counts)))
+        self._cumulative = None
+
+    @staticmethod
+    def bucket(score: int) -> int:
+        return min(max(score, 0), MAX_SCORE) // BUCKET_WIDTH
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def add(self, score: int):
+        self.counts[self.bucket(score)] += 1
+        self._cumulative = None
+
+    def merge(self, other: "ScoreSketch"):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self._cumulative = None
+
+    def percentile(self, score: int) -> Optional[float]:
+        """Percentage of recorded scores below `score`, None when there are none."""
+        if self._cumulative is None:
+            self._cumulative = [0, *accumulate(self.counts)]
+        total = self._cumulative[-1]
+        if not total:
+            return None
+        score = min(max(score, 0), MAX_SCORE)
+        index = self.bucket(score)
+        # Scores in the same bucket are taken as spread evenly over it
+        within = (score - index * BUCKET_WIDTH) / BUCKET_WIDTH
+        below = self._cumulative[index] + self.counts[index] * within
+        return round(100 * below / total, 1)
+
+
+def _fold(db: Session, rows: list):
+    """Merge a batch of scores into the location and category sketches."""
+    partials = {}
+    for row in rows:
+        keys = [("location", row.location_id)]
+        if row.category_id is not None:
+            keys.append(("category", row.category_id))
+        for key in keys:
+            partials.setdefault(key, ScoreSketch()).add(row.score)
+
+    existing = {
+        (distribution.scope, distribution.scope_id): distribution
+        for distribution in db.query(models.ScoreDistribution)
+        .filter(
+            models.ScoreDistribution.scope.in_({scope for scope, _ in partials}),
+            models.ScoreDistribution.scope_id.in_({key for _, key in partials}),
+        )
+        .with_for_update()
+    }
+    for (scope, scope_id), partial in partials.items():
+        distribution = existing.get((scope, scope_id))
+        if distribution is None:
+            distribution = models.ScoreDistribution(scope=scope, scope_id=scope_id)
+            db.add(distribution)
+        sketch = ScoreSketch(distribution.counts)
+        sketch.merge(partial)
+        distribution.counts = sketch.counts
+        distribution.total_count = sketch.total
+
+
+def update_score_sketches(
+    db: Session, batch_size: int = SCORE_SKETCH_BATCH_SIZE
+) -> int:
+    """
+    Fold the scores recorded since the last run into the persisted sketches,
+    without rescanning what earlier runs have seen. Returns the number of
+    scores folded in.
+    """
+    total = fold_new_rows(
+        db,
+        SCORE_SKETCH_WATERMARK,
+        "scores",
+        NEW_SCORES_SQL,
+        _fold,
+        batch_size,
+        _SCORE_SKETCH_LOCK_KEY,
+    )
+    logger.info(f"Folded {total} scores into the score sketches")
+    return total
+
+
+class PercentileIndex:
+    """
+    Per-worker cache of the persisted sketches.
+
+    Every worker reads the same merged sketches, refreshed after
+    SCORE_SKETCH_CACHE_TTL seconds, so a warm lookup needs no query.
+    Percentiles are extra information on a response: a failed lookup is
+    logged and reported as None rather than failing the request.
+    """
+
+    def __init__(
+        self, ttl: int = SCORE_SKETCH_CACHE_TTL, maxsize: int = SCORE_SKETCH_CACHE_SIZE
+    ):
+        self._lock = threading.Lock()
+        # (scope, scope id) -> sketch
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def _sketch(self, db: Session, scope: str, scope_id: int) -> ScoreSketch:
+        key = (scope, scope_id)
+        with self._lock:
+            sketch = self._cache.get(key)
+        if sketch is None:
+            distribution = db.get(models.ScoreDistribution, key)
+            sketch = ScoreSketch(distribution.counts if distribution else None)
+            with self._lock:
+                self._cache[key] = sketch
+        return sketch
+
+    def guess_percentiles(
+        self, db: Session, location_id: int, category_id: Optional[int], score: int
+    ) -> dict:
+        """Share of earlier guesses a score beats, on the location and in its category."""
+        try:
+            return {
+                "location_percentile": self._sketch(
+                    db, "location", location_id
+                ).percentile(score),
+                "category_percentile": (
+                    self._sketch(db, "category", category_id).percentile(score)
+                    if category_id is not None
+                    else None
+                ),
+            }
+        except Exception as e:
+            logger.error(
+                f"Error reading percentiles of location {location_id}: {str(e)}"
+            )
+            db.rollback()
+            return {"location_percentile": None, "category_percentile": None}
+
+    def category_percentile(
+        self, db: Session, category_id: Optional[int], score: float
+    ) -> Optional[float]:
+        if category_id is None:
+            return None
+        try:
+            return self._sketch(db, "category", category_id).percentile(round(score))
+        except Exception as e:
+            logger.error(
+                f"Error reading percentiles of category {category_id}: {str(e)}"
+            )
+            db.rollback()
+            return None
+
+
+def run_sketch_update() -> int:
+    db = SessionLocal()
+    try:
+        return update_score_sketches(db)
+    finally:
+        db.close()
+
+
+async def run_periodic_sketch_updates(interval: int = SCORE_SKETCH_INTERVAL):
+    """Fold new scores in every `interval` seconds without blocking the event loop."""
+    while True:
+        try:
+            await asyncio.to_thread(run_sketch_update)
+        except Exception as e:
+            logger.error(f"Error updating score sketches: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+percentile_index = PercentileIndex()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Folded in {run_sketch_update()} scores")
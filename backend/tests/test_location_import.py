@@ -0,0 +1,103 @@
+import time
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+import location_import
+from duplicate_detection import NearDuplicateIndex
+from location_index import LocationCoordinateIndex
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return self._rows
+
+
+class FakeSession:
+    """
+    Stands in for the database: the category lookup returns fixed rows and
+    an INSERT ... RETURNING hands back only the returned columns, as
+    Postgres would.
+    """
+
+    def __init__(self, categories):
+        self.categories = categories
+        self.batches = []
+        self.commits = 0
+        self._next_id = 0
+
+    def query(self, *columns):
+        return self.categories
+
+    def execute(self, statement, parameters):
+        returned = [column.key for column in statement._returning]
+        Row = namedtuple("Row", returned)
+        rows = []
+        for values in parameters:
+            self._next_id += 1
+            row = {**values, "id": self._next_id}
+            rows.append(Row(*(row[key] for key in returned)))
+        self.batches.append(len(parameters))
+        return FakeResult(rows)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def images_root(tmp_path, monkeypatch):
+    # Imported images are written to ./images
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "images").mkdir()
+    root = tmp_path / "upload"
+    root.mkdir()
+    return root
+
+
+@pytest.fixture
+def indexes(monkeypatch):
+    # Fresh, already "loaded" indexes, so lookups never go to the database
+    location_index, duplicate_index = LocationCoordinateIndex(), NearDuplicateIndex()
+    location_index._loaded_at = duplicate_index._loaded_at = time.monotonic()
+    monkeypatch.setattr(location_import, "location_index", location_index)
+    monkeypatch.setattr(location_import, "duplicate_index", duplicate_index)
+    return location_index, duplicate_index
+
+
+def test_import_inserts_every_batch_and_indexes_the_locations(images_root, indexes):
+    location_index, duplicate_index = indexes
+    rows = []
+    for number in range(5):
+        Image.new("RGB", (8, 8), (number * 40, 0, 0)).save(
+            images_root / f"{number}.png"
+        )
+        rows.append(
+            {
+                "name": f"Location {number}",
+                "category": "Nature",
+                "latitude": str(10 + number),
+                "longitude": str(20 + number),
+                "image": f"{number}.png",
+            }
+        )
+    db = FakeSession([SimpleNamespace(id=3, name="Nature")])
+
+    report = location_import.LocationImporter(db, workers=1, batch_size=2).run(
+        rows, images_root
+    )
+
+    assert db.batches == [2, 2, 1]
+    assert db.commits == 3
+    assert report["imported"] == 5
+    assert report["failed"] == []
+    for number, location_id in enumerate(report["location_ids"]):
+        assert location_index.lookup(db, location_id) == (10 + number, 20 + number, 3)
+        assert ("location", location_id) in duplicate_index._entries
@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+REBUILD_USER_STATS_SQL = text(
+    """
+    WITH days AS (
+        SELECT DISTINCT user_id, (created_at AT TIME ZONE 'UTC')::date AS day
+        FROM scores
+        WHERE user_id IS NOT NULL
+    ),
+    runs AS (
+        -- Consecutive days share day - row_number()
+        SELECT user_id, COUNT(*) AS length, MAX(day) AS last_day
+        FROM (
+            SELECT user_id, day,
+                   day - (ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day))::int AS run
+            FROM days
+        ) numbered
+        GROUP BY user_id, run
+    ),
+    streaks AS (
+        SELECT user_id,
+               (array_agg(length ORDER BY last_day DESC))[1] AS current_streak,
+               MAX(length) AS longest_streak,
+               MAX(last_day) AS last_played_on
+        FROM runs
+        GROUP BY user_id
+    )
+    INSERT INTO user_stats (
+        user_id, total_guesses, total_score, best_score,
+        current_streak, longest_streak, last_played_on
+    )
+    SELECT s.user_id, COUNT(*), SUM(s.score), MAX(s.score),
+           st.current_streak, st.longest_streak, st.last_played_on
+    FROM scores s
+    JOIN streaks st ON st.user_id = s.user_id
+    GROUP BY s.user_id, st.current_streak, st.longest_streak, st.last_played_on
+    """
+)
+
+REBUILD_CATEGORY_STATS_SQL = text(
+    """
+    INSERT INTO user_category_stats (
+        user_id, category_id, total_guesses, total_score, best_score
+    )
+    SELECT s.user_id, l.category_id, COUNT(*), SUM(s.score), MAX(s.score)
+    FROM scores s
+    JOIN locations l ON l.id = s.location_id
+    WHERE s.user_id IS NOT NULL AND l.category_id IS NOT NULL
+    GROUP BY s.user_id, l.category_id
+    """
+)
+
+REBUILD_DIFFICULTY_STATS_SQL = text(
+    """
+    INSERT INTO user_difficulty_stats (
+        user_id, difficulty_level, total_guesses, total_score, best_score
+    )
+    SELECT s.user_id, lower(l.difficulty_level::text), COUNT(*), SUM(s.score), MAX(s.score)
+    FROM scores s
+    JOIN locations l ON l.id = s.location_id
+    WHERE s.user_id IS NOT NULL
+    GROUP BY s.user_id, lower(l.difficulty_level::text)
+    """
+)
+
+
+def _breakdown(row, **key) -> dict:
+    return {
+        **key,
+        "totalGuesses": row.total_guesses,
+        "averageScore": (
+            float(row.total_score / row.total_guesses) if row.total_guesses else 0.0
+        ),
+        "bestScore": row.best_score,
+    }
+
+
+def get_user_stats(db: Session, user_id: int) -> dict:
+    """Profile statistics of a user, read from the rollup tables by primary key."""
+    stats = db.get(models.UserStats, user_id)
+    categories = (
+        db.query(models.UserCategoryStats, models.Category.name)
+        .join(models.Category)
+        .filter(models.UserCategoryStats.user_id == user_id)
+        .order_by(models.Category.name)
+        .all()
+    )
+    difficulties = (
+        db.query(models.UserDifficultyStats)
+        .filter(models.UserDifficultyStats.user_id == user_id)
+        .order_by(models.UserDifficultyStats.difficulty_level)
+        .all()
+    )
+
+    current_streak = 0
+    if stats and stats.last_played_on:
+        # The streak is only still running if the user played today or yesterday
+        yesterday = datetime.now(timezone.utc).date() - timedelta(days=1)
+        if stats.last_played_on >= yesterday:
+            current_streak = stats.current_streak
+
+    return {
+        "averageScore": (
+            float(stats.total_score / stats.total_guesses)
+            if stats and stats.total_guesses
+            else 0.0
+        ),
+        "totalGuesses": stats.total_guesses if stats else 0,
+        "bestScore": stats.best_score if stats else 0,
+        "currentStreak": current_streak,
+        "longestStreak": stats.longest_streak if stats else 0,
+        "categories": [
+            _breakdown(row, categoryId=row.category_id, categoryName=name)
+            for row, name in categories
+        ],
+        "difficulties": [
+            _breakdown(row, difficulty=row.difficulty_level) for row in difficulties
+        ],
+    }
+
+
+def rebuild_user_stats(db: Session):
+    """
+    Recompute every user's rollup from scores. Run once on databases created
+    before the rollup, or to correct breakdowns after locations were deleted.
+    """
+    # Block score writers so no trigger update is lost while recounting
+    db.execute(text("LOCK TABLE scores IN SHARE MODE"))
+    db.execute(text("DELETE FROM user_stats"))
+    db.execute(text("DELETE FROM user_category_stats"))
+    db.execute(text("DELETE FROM user_difficulty_stats"))
+    db.execute(REBUILD_USER_STATS_SQL)
+    db.execute(REBUILD_CATEGORY_STATS_SQL)
+    db.execute(REBUILD_DIFFICULTY_STATS_SQL)
+    db.commit()
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        rebuild_user_stats(db)
+        print("User stats rebuilt")
+    finally:
+        db.close()
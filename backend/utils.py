@@ -1,4 +1,6 @@
+import re
 from math import radians, sin, cos, sqrt, atan2
+from urllib.parse import unquote
 
 
 def calculate_distance(lat1, lon1, lat2, lon2):
@@ -33,3 +35,12 @@ def calculate_score(distance):
     else:
         # Linear decrease from 5000 to 0 points
         return int(5000 * (1 - (distance - 1) / 4999))
+
+
+def sanitize_filename(filename):
+    """Remove spaces and special characters from filename."""
+    # Decode URL-encoded characters
+    filename = unquote(filename)
+    # Replace spaces and special characters with underscores
+    filename = re.sub(r"[^\w.-]", "_", filename)
+    return filename
@@ -1,3 +1,6 @@
+-- Trigram matching for username search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Users table (No changes)
 CREATE TABLE users (
     id SERIAL PRIMARY KEY,
@@ -35,10 +38,48 @@ CREATE TABLE locations (
     difficulty_level difficultylevel NOT NULL DEFAULT 'medium',
     country VARCHAR(100),
     region VARCHAR(100),
+    -- Perceptual hash of the photo, used to flag duplicate submissions
+    image_hash BIGINT,
+    -- Full-text search vector, kept up to date by update_location_search_vector
+    search_vector TSVECTOR,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX idx_locations_search ON locations USING gin (search_vector);
+
+-- Names weigh most, then country and region, then the description.
+-- The 'simple' configuration keeps place names unstemmed.
+CREATE OR REPLACE FUNCTION update_location_search_vector()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.country, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(NEW.region, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'C');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER location_search_vector_update
+    BEFORE INSERT OR UPDATE OF name, description, country, region ON locations
+    FOR EACH ROW EXECUTE FUNCTION update_location_search_vector();
+
+-- Tell every API worker to drop its cached copy of an edited or deleted
+-- location (see location_index.py)
+CREATE OR REPLACE FUNCTION notify_location_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('location_changes', OLD.id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER location_changes_notify
+    AFTER UPDATE OF latitude, longitude, category_id OR DELETE ON locations
+    FOR EACH ROW EXECUTE FUNCTION notify_location_change();
+
 -- Pending locations table for user submissions
 CREATE TABLE pending_locations (
     id SERIAL PRIMARY KEY,
@@ -52,20 +93,29 @@ CREATE TABLE pending_locations (
     difficulty_level VARCHAR(20) NOT NULL DEFAULT 'medium', -- Added VARCHAR(20)
     country VARCHAR(100),
     region VARCHAR(100),
+    image_hash BIGINT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'approved', 'rejected'))
+    status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'approved', 'rejected')),
+    -- Moderator currently holding the submission, until claimed_until
+    claimed_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    claimed_until TIMESTAMP WITH TIME ZONE
 );
 
 -- Index for pending locations
 CREATE INDEX idx_pending_locations_user ON pending_locations(user_id);
 CREATE INDEX idx_pending_locations_status ON pending_locations(status);
+CREATE INDEX idx_pending_locations_status_id ON pending_locations(status, id);
 
 -- Game sessions table to track individual game attempts
 CREATE TABLE game_sessions (
     id SERIAL PRIMARY KEY,
     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
     started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    ended_at TIMESTAMP WITH TIME ZONE
+    ended_at TIMESTAMP WITH TIME ZONE,
+    -- Running totals, incremented as each guess of the session is submitted
+    total_score INTEGER NOT NULL DEFAULT 0,
+    rounds_played INTEGER NOT NULL DEFAULT 0,
+    category_id INTEGER REFERENCES categories(id) ON DELETE SET NULL
 );
 
 -- Scores table with game_session_id column
@@ -83,7 +133,8 @@ CREATE TABLE scores (
 -- Create leaderboard table
 CREATE TABLE leaderboard (
     id SERIAL PRIMARY KEY,
-    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    user_id INTEGER UNIQUE REFERENCES users(id) ON DELETE CASCADE,
+    highest_score INTEGER NOT NULL DEFAULT 0,
     total_score INTEGER NOT NULL DEFAULT 0,
     total_games INTEGER NOT NULL DEFAULT 0,
     average_score FLOAT NOT NULL DEFAULT 0,
@@ -106,31 +157,34 @@ CREATE INDEX idx_category_leaderboard_score ON category_leaderboard(score DESC);
 CREATE INDEX idx_category_leaderboard_user ON category_leaderboard(user_id);
 
 -- Create a function to update category leaderboard
+-- Runs once per INSERT/COPY statement on scores, so batched ingestion pays
+-- for leaderboard maintenance per batch instead of per row
 CREATE OR REPLACE FUNCTION update_category_leaderboard()
 RETURNS TRIGGER AS $$
 BEGIN
-    -- Insert the score into category_leaderboard if it's in the top 10 for that category
+    -- Insert the new scores that are in the top 10 for their category
     INSERT INTO category_leaderboard (user_id, category_id, score)
     SELECT 
-        NEW.user_id,
+        n.user_id,
         l.category_id,
-        NEW.score
-    FROM locations l
-    WHERE l.id = NEW.location_id
+        n.score
+    FROM new_scores n
+    JOIN locations l ON l.id = n.location_id
+    WHERE l.category_id IS NOT NULL
     AND (
         SELECT COUNT(*)
         FROM category_leaderboard cl
         WHERE cl.category_id = l.category_id
-        AND cl.score >= NEW.score
+        AND cl.score >= n.score
     ) < 10
     ON CONFLICT (user_id, category_id, score) DO NOTHING;
 
     -- Remove scores that are no longer in the top 10
     DELETE FROM category_leaderboard cl
     WHERE cl.category_id IN (
-        SELECT category_id
-        FROM locations
-        WHERE id = NEW.location_id
+        SELECT DISTINCT l.category_id
+        FROM new_scores n
+        JOIN locations l ON l.id = n.location_id
     )
     AND cl.score < (
         SELECT MIN(score)
@@ -143,14 +197,15 @@ BEGIN
         ) top_10
     );
 
-    RETURN NEW;
+    RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
--- Create trigger to update category leaderboard when a new score is added
+-- Create trigger to update category leaderboard when new scores are added
 CREATE TRIGGER update_category_leaderboard_trigger
     AFTER INSERT ON scores
-    FOR EACH ROW
+    REFERENCING NEW TABLE AS new_scores
+    FOR EACH STATEMENT
     EXECUTE FUNCTION update_category_leaderboard();
 
 -- Friends system for social interaction
@@ -188,6 +243,382 @@ CREATE INDEX idx_achievements_category ON achievements(category_id);
 CREATE INDEX idx_achievements_country ON achievements(country);
 CREATE INDEX idx_user_achievements_user ON user_achievements(user_id);
 
+CREATE INDEX idx_scores_created_at ON scores(created_at, id);
+
+-- Username search: prefix matches use the btree, infix matches the trigram index
+CREATE INDEX idx_users_username_prefix ON users (lower(username) text_pattern_ops);
+CREATE INDEX idx_users_username_trgm ON users USING gin (lower(username) gin_trgm_ops);
+CREATE INDEX idx_game_sessions_ended_at ON game_sessions(ended_at, id);
+
+-- Position reached by each named incremental export (data_export.py)
+CREATE TABLE export_watermarks (
+    name VARCHAR(100) PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    last_timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_id INTEGER NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Responses of requests sent with an Idempotency-Key (idempotency.py), shared
+-- by every API worker. status_code stays NULL while the first request runs.
+CREATE TABLE idempotency_keys (
+    key VARCHAR(64) PRIMARY KEY,
+    status_code INTEGER,
+    body BYTEA,
+    media_type VARCHAR(255),
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_idempotency_keys_created_at ON idempotency_keys(created_at);
+
+-- Guess statistics per location (location_calibration.py). distance_sketch
+-- is a log-bucketed histogram of guess distances; empirical_difficulty is
+-- derived from the median distance once a location has enough guesses.
+CREATE TABLE location_difficulty_stats (
+    location_id INTEGER PRIMARY KEY REFERENCES locations(id) ON DELETE CASCADE,
+    guess_count INTEGER NOT NULL DEFAULT 0,
+    total_distance_km DOUBLE PRECISION NOT NULL DEFAULT 0,
+    total_score BIGINT NOT NULL DEFAULT 0,
+    distance_sketch INTEGER[] NOT NULL,
+    median_distance_km DOUBLE PRECISION,
+    empirical_difficulty VARCHAR(20),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Guess heatmaps per location (guess_heatmaps.py): guesses binned into
+-- Web Mercator tiles, stored as parallel arrays of tile numbers and counts
+CREATE TABLE location_heatmaps (
+    location_id INTEGER PRIMARY KEY REFERENCES locations(id) ON DELETE CASCADE,
+    zoom INTEGER NOT NULL,
+    cells INTEGER[] NOT NULL,
+    counts INTEGER[] NOT NULL,
+    total_guesses INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Guess score histograms per location and per category (score_percentiles.py),
+-- used to tell players which share of earlier guesses they beat
+CREATE TABLE score_distributions (
+    scope VARCHAR(20) NOT NULL,
+    scope_id INTEGER NOT NULL,
+    counts INTEGER[] NOT NULL,
+    total_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (scope, scope_id)
+);
+
+-- Row counters for the admin dashboard, kept up to date by triggers.
+-- Each counter is split over shards so concurrent writers rarely touch the same row.
+CREATE TABLE table_counters (
+    name VARCHAR(50) NOT NULL,
+    shard INTEGER NOT NULL,
+    value BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, shard)
+);
+
+-- Tables whose counters hold a full count. The triggers leave a table alone
+-- until it is listed here, so an unseeded counter never holds just the
+-- changes since the triggers were added (admin_stats.seed_table_counters).
+CREATE TABLE table_counter_seeds (
+    name VARCHAR(50) PRIMARY KEY,
+    seeded_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION count_inserted_rows()
+RETURNS TRIGGER AS $$
+DECLARE
+    target_shard INTEGER := floor(random() * 16);
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM table_counter_seeds WHERE name = TG_TABLE_NAME) THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO table_counters (name, shard, value)
+    SELECT TG_TABLE_NAME, target_shard, COUNT(*) FROM new_rows
+    ON CONFLICT (name, shard) DO UPDATE SET value = table_counters.value + EXCLUDED.value;
+
+    IF TG_TABLE_NAME = 'scores' THEN
+        INSERT INTO table_counters (name, shard, value)
+        SELECT 'scores_sum', target_shard, COALESCE(SUM(score), 0) FROM new_rows
+        ON CONFLICT (name, shard) DO UPDATE SET value = table_counters.value + EXCLUDED.value;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION count_deleted_rows()
+RETURNS TRIGGER AS $$
+DECLARE
+    target_shard INTEGER := floor(random() * 16);
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM table_counter_seeds WHERE name = TG_TABLE_NAME) THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO table_counters (name, shard, value)
+    SELECT TG_TABLE_NAME, target_shard, -COUNT(*) FROM old_rows
+    ON CONFLICT (name, shard) DO UPDATE SET value = table_counters.value + EXCLUDED.value;
+
+    IF TG_TABLE_NAME = 'scores' THEN
+        INSERT INTO table_counters (name, shard, value)
+        SELECT 'scores_sum', target_shard, -COALESCE(SUM(score), 0) FROM old_rows
+        ON CONFLICT (name, shard) DO UPDATE SET value = table_counters.value + EXCLUDED.value;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER count_users_inserted AFTER INSERT ON users
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION count_inserted_rows();
+CREATE TRIGGER count_users_deleted AFTER DELETE ON users
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION count_deleted_rows();
+CREATE TRIGGER count_locations_inserted AFTER INSERT ON locations
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION count_inserted_rows();
+CREATE TRIGGER count_locations_deleted AFTER DELETE ON locations
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION count_deleted_rows();
+CREATE TRIGGER count_scores_inserted AFTER INSERT ON scores
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION count_inserted_rows();
+CREATE TRIGGER count_scores_deleted AFTER DELETE ON scores
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION count_deleted_rows();
+
+-- The tables are still empty here, so their counters start out complete
+INSERT INTO table_counter_seeds (name) VALUES ('users'), ('locations'), ('scores');
+
+-- Guesses per user and clock hour for the dashboard's recent activity, so it
+-- does not scan a day of scores. Only the last day is kept.
+CREATE TABLE user_activity_hours (
+    hour TIMESTAMP WITH TIME ZONE NOT NULL,
+    user_id INTEGER NOT NULL,
+    guesses INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, user_id)
+);
+
+CREATE OR REPLACE FUNCTION rollup_user_activity()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO user_activity_hours (hour, user_id, guesses)
+    SELECT date_trunc('hour', created_at), user_id, COUNT(*)
+    FROM new_rows
+    WHERE user_id IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (hour, user_id) DO UPDATE
+        SET guesses = user_activity_hours.guesses + EXCLUDED.guesses;
+
+    DELETE FROM user_activity_hours WHERE hour < now() - interval '25 hours';
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rollup_scores_activity AFTER INSERT ON scores
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_user_activity();
+
+-- Per-user score rollup, kept up to date by triggers on scores in the same
+-- transaction as every insert. best_score is the best guess ever made, so
+-- it is not lowered when scores are deleted. The streak counts consecutive
+-- UTC days with at least one guess.
+CREATE TABLE user_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    total_guesses INTEGER NOT NULL DEFAULT 0,
+    total_score BIGINT NOT NULL DEFAULT 0,
+    best_score INTEGER NOT NULL DEFAULT 0,
+    current_streak INTEGER NOT NULL DEFAULT 0,
+    longest_streak INTEGER NOT NULL DEFAULT 0,
+    last_played_on DATE
+);
+
+CREATE INDEX idx_user_stats_total_score ON user_stats(total_score);
+
+CREATE TABLE user_category_stats (
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    category_id INTEGER REFERENCES categories(id) ON DELETE CASCADE,
+    total_guesses INTEGER NOT NULL DEFAULT 0,
+    total_score BIGINT NOT NULL DEFAULT 0,
+    best_score INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, category_id)
+);
+
+CREATE TABLE user_difficulty_stats (
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    difficulty_level VARCHAR(20),
+    total_guesses INTEGER NOT NULL DEFAULT 0,
+    total_score BIGINT NOT NULL DEFAULT 0,
+    best_score INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, difficulty_level)
+);
+
+CREATE OR REPLACE FUNCTION rollup_inserted_user_scores()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- The batch can span several days (buffered or imported scores), so its
+    -- streak comes from the distinct days it covers, as in the rebuild
+    WITH days AS (
+        SELECT DISTINCT user_id, (created_at AT TIME ZONE 'UTC')::date AS day
+        FROM new_rows
+        WHERE user_id IS NOT NULL
+    ),
+    runs AS (
+        -- Consecutive days share day - row_number()
+        SELECT user_id, COUNT(*) AS length, MAX(day) AS last_day
+        FROM (
+            SELECT user_id, day,
+                   day - (ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day))::int AS run
+            FROM days
+        ) numbered
+        GROUP BY user_id, run
+    ),
+    streaks AS (
+        SELECT user_id,
+               (array_agg(length ORDER BY last_day DESC))[1] AS current_streak,
+               MAX(length) AS longest_streak,
+               MAX(last_day) AS last_played_on
+        FROM runs
+        GROUP BY user_id
+    )
+    INSERT INTO user_stats AS us (
+        user_id, total_guesses, total_score, best_score,
+        current_streak, longest_streak, last_played_on
+    )
+    SELECT n.user_id, COUNT(*), SUM(n.score), MAX(n.score),
+           st.current_streak, st.longest_streak, st.last_played_on
+    FROM new_rows n
+    JOIN streaks st ON st.user_id = n.user_id
+    GROUP BY n.user_id, st.current_streak, st.longest_streak, st.last_played_on
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_guesses = us.total_guesses + EXCLUDED.total_guesses,
+        total_score = us.total_score + EXCLUDED.total_score,
+        best_score = GREATEST(us.best_score, EXCLUDED.best_score),
+        -- The batch's last run starts on last_played_on - current_streak + 1;
+        -- it extends the stored streak when it starts no later than the day
+        -- after the stored last_played_on
+        current_streak = CASE
+            WHEN us.last_played_on IS NULL THEN EXCLUDED.current_streak
+            WHEN us.last_played_on >= EXCLUDED.last_played_on THEN us.current_streak
+            WHEN EXCLUDED.last_played_on - EXCLUDED.current_streak <= us.last_played_on
+                THEN us.current_streak + (EXCLUDED.last_played_on - us.last_played_on)
+            ELSE EXCLUDED.current_streak
+        END,
+        longest_streak = GREATEST(us.longest_streak, EXCLUDED.longest_streak, CASE
+            WHEN us.last_played_on IS NULL THEN EXCLUDED.current_streak
+            WHEN us.last_played_on >= EXCLUDED.last_played_on THEN us.current_streak
+            WHEN EXCLUDED.last_played_on - EXCLUDED.current_streak <= us.last_played_on
+                THEN us.current_streak + (EXCLUDED.last_played_on - us.last_played_on)
+            ELSE EXCLUDED.current_streak
+        END),
+        last_played_on = GREATEST(us.last_played_on, EXCLUDED.last_played_on);
+
+    INSERT INTO user_category_stats AS ucs (
+        user_id, category_id, total_guesses, total_score, best_score
+    )
+    SELECT n.user_id, l.category_id, COUNT(*), SUM(n.score), MAX(n.score)
+    FROM new_rows n
+    JOIN locations l ON l.id = n.location_id
+    WHERE n.user_id IS NOT NULL AND l.category_id IS NOT NULL
+    GROUP BY n.user_id, l.category_id
+    ON CONFLICT (user_id, category_id) DO UPDATE SET
+        total_guesses = ucs.total_guesses + EXCLUDED.total_guesses,
+        total_score = ucs.total_score + EXCLUDED.total_score,
+        best_score = GREATEST(ucs.best_score, EXCLUDED.best_score);
+
+    INSERT INTO user_difficulty_stats AS uds (
+        user_id, difficulty_level, total_guesses, total_score, best_score
+    )
+    SELECT n.user_id, lower(l.difficulty_level::text), COUNT(*), SUM(n.score), MAX(n.score)
+    FROM new_rows n
+    JOIN locations l ON l.id = n.location_id
+    WHERE n.user_id IS NOT NULL
+    GROUP BY n.user_id, lower(l.difficulty_level::text)
+    ON CONFLICT (user_id, difficulty_level) DO UPDATE SET
+        total_guesses = uds.total_guesses + EXCLUDED.total_guesses,
+        total_score = uds.total_score + EXCLUDED.total_score,
+        best_score = GREATEST(uds.best_score, EXCLUDED.best_score);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_deleted_user_scores()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE user_stats us SET
+        total_guesses = us.total_guesses - d.total_guesses,
+        total_score = us.total_score - d.total_score
+    FROM (
+        SELECT user_id, COUNT(*) AS total_guesses, SUM(score) AS total_score
+        FROM old_rows
+        GROUP BY user_id
+    ) d
+    WHERE us.user_id = d.user_id;
+
+    UPDATE user_category_stats ucs SET
+        total_guesses = ucs.total_guesses - d.total_guesses,
+        total_score = ucs.total_score - d.total_score
+    FROM (
+        SELECT o.user_id, l.category_id, COUNT(*) AS total_guesses, SUM(o.score) AS total_score
+        FROM old_rows o
+        JOIN locations l ON l.id = o.location_id
+        GROUP BY o.user_id, l.category_id
+    ) d
+    WHERE ucs.user_id = d.user_id AND ucs.category_id = d.category_id;
+
+    UPDATE user_difficulty_stats uds SET
+        total_guesses = uds.total_guesses - d.total_guesses,
+        total_score = uds.total_score - d.total_score
+    FROM (
+        SELECT o.user_id, lower(l.difficulty_level::text) AS difficulty_level,
+               COUNT(*) AS total_guesses, SUM(o.score) AS total_score
+        FROM old_rows o
+        JOIN locations l ON l.id = o.location_id
+        GROUP BY o.user_id, lower(l.difficulty_level::text)
+    ) d
+    WHERE uds.user_id = d.user_id AND uds.difficulty_level = d.difficulty_level;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Scores cascade-deleted with their location are gone from locations by the
+-- time rollup_deleted_user_scores runs, so its joins skip them; take them out
+-- of the breakdowns while the location row is still there
+CREATE OR REPLACE FUNCTION rollup_deleted_location_scores()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE user_category_stats ucs SET
+        total_guesses = ucs.total_guesses - d.total_guesses,
+        total_score = ucs.total_score - d.total_score
+    FROM (
+        SELECT user_id, COUNT(*) AS total_guesses, SUM(score) AS total_score
+        FROM scores
+        WHERE location_id = OLD.id AND user_id IS NOT NULL
+        GROUP BY user_id
+    ) d
+    WHERE ucs.user_id = d.user_id AND ucs.category_id = OLD.category_id;
+
+    UPDATE user_difficulty_stats uds SET
+        total_guesses = uds.total_guesses - d.total_guesses,
+        total_score = uds.total_score - d.total_score
+    FROM (
+        SELECT user_id, COUNT(*) AS total_guesses, SUM(score) AS total_score
+        FROM scores
+        WHERE location_id = OLD.id AND user_id IS NOT NULL
+        GROUP BY user_id
+    ) d
+    WHERE uds.user_id = d.user_id
+    AND uds.difficulty_level = lower(OLD.difficulty_level::text);
+
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rollup_user_scores_inserted AFTER INSERT ON scores
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_inserted_user_scores();
+CREATE TRIGGER rollup_user_scores_deleted AFTER DELETE ON scores
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_deleted_user_scores();
+CREATE TRIGGER rollup_location_scores_deleted BEFORE DELETE ON locations
+    FOR EACH ROW EXECUTE FUNCTION rollup_deleted_location_scores();
+
 -- Make sure this function is defined before any triggers that use it
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
@@ -353,12 +784,13 @@ CREATE TABLE challenges (
     id SERIAL PRIMARY KEY,
     challenger_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
     challenged_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-    status VARCHAR(20) CHECK (status IN ('pending', 'accepted', 'in_progress', 'completed')),
+    status VARCHAR(20) CHECK (status IN ('pending', 'accepted', 'in_progress', 'completed', 'expired')),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     completed_at TIMESTAMP WITH TIME ZONE,
     winner_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
-    current_round INTEGER DEFAULT 1
+    current_round INTEGER DEFAULT 1,
+    results_snapshot JSONB -- Serialized results, written once the challenge is completed
 );
 
 -- Challenge locations table to store the 5 locations for each challenge
@@ -386,12 +818,29 @@ CREATE TABLE challenge_scores (
     UNIQUE(challenge_id, user_id, location_id)
 );
 
+-- Compact history of archived challenges (filled by challenge_sweeper.py)
+CREATE TABLE challenge_history (
+    challenge_id INTEGER PRIMARY KEY,
+    challenger_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    challenged_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    winner_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    challenger_score INTEGER NOT NULL DEFAULT 0,
+    challenged_score INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE,
+    completed_at TIMESTAMP WITH TIME ZONE
+);
+
 -- Create indexes for performance
+CREATE INDEX idx_challenge_history_challenger ON challenge_history(challenger_id);
+CREATE INDEX idx_challenge_history_challenged ON challenge_history(challenged_id);
 CREATE INDEX idx_challenges_challenger ON challenges(challenger_id);
 CREATE INDEX idx_challenges_challenged ON challenges(challenged_id);
+CREATE INDEX idx_challenges_challenger_status_created ON challenges(challenger_id, status, created_at);
+CREATE INDEX idx_challenges_challenged_status_created ON challenges(challenged_id, status, created_at);
 CREATE INDEX idx_challenge_locations_challenge ON challenge_locations(challenge_id);
 CREATE INDEX idx_challenge_scores_challenge ON challenge_scores(challenge_id);
 CREATE INDEX idx_challenge_scores_user ON challenge_scores(user_id);
+CREATE INDEX idx_challenge_scores_created_at ON challenge_scores(created_at, id);
 
 -- Add challenge-related achievements
 INSERT INTO achievements (name, description, points_required) VALUES
@@ -16,11 +16,17 @@ function Admin() {
     totalUsers: 0,
     totalLocations: 0,
     totalGuesses: 0,
-    averageScore: 0
+    averageScore: 0,
+    guessesLastHour: 0,
+    activeUsers: 0
   });
   const [locations, setLocations] = useState([]);
+  const [locationsCursor, setLocationsCursor] = useState(null);
+  const [locationSearch, setLocationSearch] = useState('');
+  const [locationQuery, setLocationQuery] = useState('');
   const [pendingLocations, setPendingLocations] = useState([]);
   const [users, setUsers] = useState([]);
+  const [usersCursor, setUsersCursor] = useState(null);
   const [newLocation, setNewLocation] = useState({
     latitude: '',
     longitude: '',
@@ -112,6 +118,7 @@ function Admin() {
       });
       const locationsData = await locationsResponse.json();
       setLocations(locationsData);
+      setLocationsCursor(locationsResponse.headers.get('X-Next-Cursor'));
 
       // Fetch users
       const usersResponse = await fetch('http://localhost:8000/admin/users', {
@@ -119,6 +126,7 @@ function Admin() {
       });
       const usersData = await usersResponse.json();
       setUsers(usersData);
+      setUsersCursor(usersResponse.headers.get('X-Next-Cursor'));
 
       setLoading(false);
     } catch (error) {
@@ -127,6 +135,62 @@ function Admin() {
     }
   };
 
+  const fetchMoreUsers = async () => {
+    try {
+      const token = localStorage.getItem('token');
+      const response = await fetch(
+        `http://localhost:8000/admin/users?cursor=${encodeURIComponent(usersCursor)}`,
+        { headers: { 'Authorization': `Bearer ${token}` } }
+      );
+      const data = await response.json();
+      setUsers(prev => [...prev, ...data]);
+      setUsersCursor(response.headers.get('X-Next-Cursor'));
+    } catch (error) {
+      console.error('Error fetching users:', error);
+    }
+  };
+
+  const locationsUrl = (query, cursor) => {
+    const params = new URLSearchParams();
+    if (query) params.set('q', query);
+    if (cursor) params.set('cursor', cursor);
+    const path = query ? 'admin/locations/search' : 'admin/locations';
+    return `http://localhost:8000/${path}?${params}`;
+  };
+
+  const fetchMoreLocations = async () => {
+    try {
+      const token = localStorage.getItem('token');
+      const response = await fetch(
+        locationsUrl(locationQuery, locationsCursor),
+        { headers: { 'Authorization': `Bearer ${token}` } }
+      );
+      const data = await response.json();
+      setLocations(prev => [...prev, ...data]);
+      setLocationsCursor(response.headers.get('X-Next-Cursor'));
+    } catch (error) {
+      console.error('Error fetching locations:', error);
+    }
+  };
+
+  const handleLocationSearch = async (e) => {
+    e.preventDefault();
+    const query = locationSearch.trim();
+    try {
+      const token = localStorage.getItem('token');
+      const response = await fetch(
+        locationsUrl(query, null),
+        { headers: { 'Authorization': `Bearer ${token}` } }
+      );
+      const data = await response.json();
+      setLocationQuery(query);
+      setLocations(data);
+      setLocationsCursor(response.headers.get('X-Next-Cursor'));
+    } catch (error) {
+      console.error('Error searching locations:', error);
+    }
+  };
+
   const fetchCategories = async () => {
     try {
       const response = await fetch('http://localhost:8000/categories/');
@@ -439,6 +503,35 @@ function Admin() {
     }
   };
 
+  const handleBulkModeration = async (action) => {
+    try {
+      const token = localStorage.getItem('token');
+      const response = await fetch(`http://localhost:8000/api/locations/pending/${action}`, {
+        method: 'POST',
+        headers: {
+          'Authorization': `Bearer ${token}`,
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ ids: pendingLocations.map(location => location.id) })
+      });
+
+      if (!response.ok) {
+        throw new Error(`Failed to ${action} locations`);
+      }
+
+      const data = await response.json();
+      const done = action === 'approve' ? data.approved.length : data.rejected.length;
+      await Promise.all([fetchDashboardData(), fetchPendingLocations()]);
+      setMessage(
+        `${done} location(s) ${action === 'approve' ? 'approved' : 'rejected'}` +
+        (data.skipped.length ? `, ${data.skipped.length} skipped` : '')
+      );
+    } catch (error) {
+      console.error(`Error running bulk ${action}:`, error);
+      setError(`Failed to ${action} locations`);
+    }
+  };
+
   if (loading) return <div className="text-white">Loading...</div>;
   if (error) return <div className="text-red-500">Error: {error}</div>;
 
@@ -459,7 +552,7 @@ function Admin() {
           <h1 className="mb-6 text-3xl font-bold text-white">Admin Dashboard</h1>
           
           {/* Statistics Grid */}
-          <div className="grid grid-cols-1 gap-4 mb-8 sm:grid-cols-2 lg:grid-cols-4">
+          <div className="grid grid-cols-1 gap-4 mb-8 sm:grid-cols-2 lg:grid-cols-3">
             <div className="p-6 border rounded-xl bg-white/10 border-white/20">
               <h3 className="mb-2 text-sm text-white/90">Total Users</h3>
               <p className="text-2xl font-bold text-white">{stats.totalUsers}</p>
@@ -476,11 +569,37 @@ function Admin() {
               <h3 className="mb-2 text-sm text-white/90">Average Score</h3>
               <p className="text-2xl font-bold text-white">{stats.averageScore.toFixed(2)}</p>
             </div>
+            <div className="p-6 border rounded-xl bg-white/10 border-white/20">
+              <h3 className="mb-2 text-sm text-white/90">Guesses (Last Hour)</h3>
+              <p className="text-2xl font-bold text-white">{stats.guessesLastHour}</p>
+            </div>
+            <div className="p-6 border rounded-xl bg-white/10 border-white/20">
+              <h3 className="mb-2 text-sm text-white/90">Active Users (24h)</h3>
+              <p className="text-2xl font-bold text-white">{stats.activeUsers}</p>
+            </div>
           </div>
 
           {/* Pending Locations Section */}
           <section className="mb-8">
-            <h2 className="mb-6 text-2xl font-bold text-white">Pending Locations</h2>
+            <div className="flex items-center justify-between mb-6">
+              <h2 className="text-2xl font-bold text-white">Pending Locations</h2>
+              {pendingLocations.length > 0 && (
+                <div className="flex space-x-2">
+                  <button
+                    onClick={() => handleBulkModeration('reject')}
+                    className="px-4 py-2 text-white transition-all duration-300 border rounded-xl bg-red-500/80 border-red-500/20 hover:bg-red-500/90"
+                  >
+                    Reject all
+                  </button>
+                  <button
+                    onClick={() => handleBulkModeration('approve')}
+                    className="px-4 py-2 text-white transition-all duration-300 border rounded-xl bg-green-500/80 border-green-500/20 hover:bg-green-500/90"
+                  >
+                    Approve all
+                  </button>
+                </div>
+              )}
+            </div>
             {pendingLocations.length === 0 ? (
               <p className="text-white/70">No pending locations to review.</p>
             ) : (
@@ -501,6 +620,20 @@ function Admin() {
                       <p>Region: {location.region}</p>
                       <p>Submitted by: {users.find(u => u.id === location.user_id)?.username}</p>
                     </div>
+                    {location.duplicates?.length > 0 && (
+                      <div className="p-3 mb-4 text-sm text-yellow-200 border rounded-xl bg-yellow-500/10 border-yellow-500/20">
+                        <p className="mb-1 font-semibold">Possible duplicates</p>
+                        {location.duplicates.map(duplicate => (
+                          <p key={`${duplicate.kind}-${duplicate.id}`}>
+                            {duplicate.kind === 'pending' ? 'Submission' : 'Location'} #{duplicate.id}
+                            {' '}({Math.round(duplicate.distance_m)} m away
+                            {duplicate.image_similarity !== null &&
+                              `, ${Math.round(duplicate.image_similarity * 100)}% similar photo`})
+                            {duplicate.likely_duplicate && ' - likely duplicate'}
+                          </p>
+                        ))}
+                      </div>
+                    )}
                     <div className="flex justify-end space-x-2">
                       <button
                         onClick={() => handleRejectLocation(location.id)}
@@ -740,11 +873,34 @@ function Admin() {
                 </tbody>
               </table>
             </div>
+            {usersCursor && (
+              <button
+                onClick={fetchMoreUsers}
+                className="px-4 py-2 mt-4 text-white transition-all duration-300 border rounded-xl bg-white/10 border-white/20 hover:bg-white/20"
+              >
+                Load more users
+              </button>
+            )}
           </section>
 
           {/* Locations Section */}
           <section className="p-6 mb-8 border rounded-xl bg-white/10 border-white/20">
             <h2 className="mb-6 text-2xl font-bold text-white">Locations</h2>
+            <form onSubmit={handleLocationSearch} className="flex mb-6 space-x-2">
+              <input
+                type="text"
+                placeholder="Search by name, country, region or description"
+                value={locationSearch}
+                onChange={(e) => setLocationSearch(e.target.value)}
+                className="w-full px-4 py-2 text-white border rounded-xl bg-white/10 border-white/20 focus:outline-none focus:ring-2 focus:ring-blue-500/50 focus:border-transparent placeholder-white/50"
+              />
+              <button
+                type="submit"
+                className="px-4 py-2 text-white transition-all duration-300 border rounded-xl bg-white/10 border-white/20 hover:bg-white/20"
+              >
+                Search
+              </button>
+            </form>
             <div className="overflow-x-auto">
               <table className="w-full">
                 <thead>
@@ -784,6 +940,14 @@ function Admin() {
                 </tbody>
               </table>
             </div>
+            {locationsCursor && (
+              <button
+                onClick={fetchMoreLocations}
+                className="px-4 py-2 mt-4 text-white transition-all duration-300 border rounded-xl bg-white/10 border-white/20 hover:bg-white/20"
+              >
+                Load more locations
+              </button>
+            )}
           </section>
         </div>
       </div>
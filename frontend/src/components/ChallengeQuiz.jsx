@@ -132,8 +132,6 @@ function ChallengeQuiz() {
           location_id: currentLocation.id,
           guessed_latitude: position.lat,
           guessed_longitude: position.lng,
-          actual_latitude: currentLocation.latitude,
-          actual_longitude: currentLocation.longitude,
           time_taken: timeElapsed,
           round_number: currentRound
         })
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
+import { subscribeToChallengeEvents } from '../utils/challengeEvents';
 
 function ChallengeResults() {
   /**
@@ -22,6 +23,13 @@ function ChallengeResults() {
 
   useEffect(() => {
     fetchResults();
+
+    // Reload when the opponent makes a guess or the challenge is completed
+    return subscribeToChallengeEvents((event) => {
+      if (String(event.challenge_id) === String(challengeId)) {
+        fetchResults();
+      }
+    });
   }, [challengeId]);
 
   const fetchResults = async () => {
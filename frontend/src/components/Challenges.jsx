@@ -1,5 +1,8 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
+import { subscribeToChallengeEvents } from '../utils/challengeEvents';
+
+const CHALLENGE_PAGE_SIZE = 50;
 
 function Challenges() {
   const [challenges, setChallenges] = useState([]);
@@ -10,6 +13,7 @@ function Challenges() {
   const [activeTab, setActiveTab] = useState('pending');
   const [currentUser, setCurrentUser] = useState(null);
   const [results, setResults] = useState(null);
+  const [hasMoreChallenges, setHasMoreChallenges] = useState(false);
   const navigate = useNavigate();
 
   useEffect(() => {
@@ -18,6 +22,9 @@ function Challenges() {
       fetchChallenges();
       fetchFriends();
     });
+
+    // Refresh the list when an opponent creates, accepts, plays or finishes a challenge
+    return subscribeToChallengeEvents(() => fetchChallenges());
   }, []);
 
   const fetchCurrentUser = async () => {
@@ -39,20 +46,32 @@ function Challenges() {
     }
   };
 
+  // Challenges come newest first, CHALLENGE_PAGE_SIZE at a time
+  const fetchChallengePage = async (before) => {
+    const token = localStorage.getItem('token');
+    const params = new URLSearchParams({ limit: CHALLENGE_PAGE_SIZE });
+    if (before) {
+      params.set('before', before.created_at);
+      params.set('before_id', before.id);
+    }
+    const response = await fetch(`http://localhost:8000/challenges/?${params}`, {
+      headers: {
+        'Authorization': `Bearer ${token}`
+      }
+    });
+
+    if (!response.ok) {
+      throw new Error('Failed to fetch challenges');
+    }
+
+    const data = await response.json();
+    setHasMoreChallenges(data.length === CHALLENGE_PAGE_SIZE);
+    return data;
+  };
+
   const fetchChallenges = async () => {
     try {
-      const token = localStorage.getItem('token');
-      const response = await fetch('http://localhost:8000/challenges/', {
-        headers: {
-          'Authorization': `Bearer ${token}`
-        }
-      });
-      
-      if (!response.ok) {
-        throw new Error('Failed to fetch challenges');
-      }
-      
-      const data = await response.json();
+      const data = await fetchChallengePage(null);
       console.log('Fetched challenges:', data);
       setChallenges(data);
       setLoading(false);
@@ -62,6 +81,15 @@ function Challenges() {
     }
   };
 
+  const fetchMoreChallenges = async () => {
+    try {
+      const data = await fetchChallengePage(challenges[challenges.length - 1]);
+      setChallenges(prev => [...prev, ...data]);
+    } catch (error) {
+      setError(error.message);
+    }
+  };
+
   const fetchFriends = async () => {
     try {
       const token = localStorage.getItem('token');
@@ -445,6 +473,17 @@ function Challenges() {
               })
             )}
           </div>
+
+          {hasMoreChallenges && (
+            <div className="text-center">
+              <button
+                onClick={fetchMoreChallenges}
+                className="px-4 py-2 mt-4 text-white transition-all duration-300 border rounded-xl bg-white/10 border-white/20 hover:bg-white/20"
+              >
+                Load more challenges
+              </button>
+            </div>
+          )}
         </div>
       </div>
     </div>
@@ -1,5 +1,5 @@
-import React from 'react';
-import { MapContainer, TileLayer, Marker, useMapEvents } from 'react-leaflet';
+import React, { useEffect, useState } from 'react';
+import { MapContainer, TileLayer, Marker, Rectangle, useMapEvents } from 'react-leaflet';
 import 'leaflet/dist/leaflet.css';
 import L from 'leaflet';
 
@@ -29,8 +29,6 @@ function MapClickHandler({ onGuessSubmit, correctLocation, locationId }) {
         console.log('Submitting guess with data:', {
           guessed_latitude: e.latlng.lat,
           guessed_longitude: e.latlng.lng,
-          actual_latitude: correctLocation.lat,
-          actual_longitude: correctLocation.lng,
           location_id: locationId
         });
 
@@ -44,8 +42,6 @@ function MapClickHandler({ onGuessSubmit, correctLocation, locationId }) {
           body: JSON.stringify({
             guessed_latitude: e.latlng.lat,
             guessed_longitude: e.latlng.lng,
-            actual_latitude: correctLocation.lat,
-            actual_longitude: correctLocation.lng,
             location_id: locationId
           })
         });
@@ -60,6 +56,62 @@ function MapClickHandler({ onGuessSubmit, correctLocation, locationId }) {
   return null;
 }
 
+/**
+ * Converts a Web Mercator tile number (y * 2^zoom + x) to its lat/lng bounds.
+ */
+function tileBounds(cell, zoom) {
+  const size = 2 ** zoom;
+  const x = cell % size;
+  const y = Math.floor(cell / size);
+  const latitude = (row) => Math.atan(Math.sinh(Math.PI * (1 - (2 * row) / size))) * 180 / Math.PI;
+  const longitude = (column) => (column / size) * 360 - 180;
+  return [
+    [latitude(y + 1), longitude(x)],
+    [latitude(y), longitude(x + 1)]
+  ];
+}
+
+/**
+ * Shaded tiles showing where other players guessed a location.
+ *
+ * Props:
+ * @param {number} locationId - ID of the location to show guesses for
+ */
+function GuessHeatmap({ locationId }) {
+  const [heatmap, setHeatmap] = useState(null);
+
+  useEffect(() => {
+    const fetchHeatmap = async () => {
+      try {
+        const response = await fetch(`http://localhost:8000/locations/${locationId}/heatmap`);
+        if (response.ok) {
+          setHeatmap(await response.json());
+        }
+      } catch (error) {
+        console.error('Error fetching guess heatmap:', error);
+      }
+    };
+    fetchHeatmap();
+  }, [locationId]);
+
+  if (!heatmap || heatmap.cells.length === 0) {
+    return null;
+  }
+
+  const maxCount = Math.max(...heatmap.counts);
+  return heatmap.cells.map((cell, index) => (
+    <Rectangle
+      key={cell}
+      bounds={tileBounds(cell, heatmap.zoom)}
+      pathOptions={{
+        stroke: false,
+        fillColor: '#f97316',
+        fillOpacity: 0.15 + 0.55 * (heatmap.counts[index] / maxCount)
+      }}
+    />
+  ));
+}
+
 /**
  * Interactive map component for GuessWhere game.
  * Uses Leaflet for map rendering and handling user interactions.
@@ -67,6 +119,7 @@ function MapClickHandler({ onGuessSubmit, correctLocation, locationId }) {
  * Features:
  * - Allows users to click on the map to submit guesses
  * - Shows markers for correct location (green) and guessed location (red) after submission
+ * - Shows where other players guessed the location after submission
  * - Handles guess submission to backend API
  * 
  * Props:
@@ -111,6 +164,8 @@ function Map({ onGuessSubmit, showResult, correctLocation, guessedLocation, loca
           />
         )}
         
+        {showResult && <GuessHeatmap locationId={locationId} />}
+
         {showResult && formattedLocation && (
           <Marker 
             position={formattedLocation}
@@ -5,7 +5,11 @@ function Profile() {
   const { userId } = useParams(); // Get userId from URL if viewing another user's profile
   const [userStats, setUserStats] = useState({
     averageScore: 0,
-    totalGuesses: 0
+    totalGuesses: 0,
+    bestScore: 0,
+    currentStreak: 0,
+    longestStreak: 0,
+    categories: []
   });
   const [achievements, setAchievements] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -133,7 +137,7 @@ function Profile() {
           </div>
 
           {/* Stats Section */}
-          <div className="grid grid-cols-2 gap-4 mb-8">
+          <div className="grid grid-cols-2 gap-4 mb-8 lg:grid-cols-4">
             <div className="p-6 border rounded-xl bg-white/10 border-white/20 backdrop-blur-sm">
               <h3 className="mb-2 text-sm font-medium text-white/80">Average Score</h3>
               <p className="text-2xl font-bold text-white">
@@ -146,8 +150,39 @@ function Profile() {
                 {userStats.totalGuesses}
               </p>
             </div>
+            <div className="p-6 border rounded-xl bg-white/10 border-white/20 backdrop-blur-sm">
+              <h3 className="mb-2 text-sm font-medium text-white/80">Best Guess</h3>
+              <p className="text-2xl font-bold text-white">
+                {userStats.bestScore}
+              </p>
+            </div>
+            <div className="p-6 border rounded-xl bg-white/10 border-white/20 backdrop-blur-sm">
+              <h3 className="mb-2 text-sm font-medium text-white/80">Day Streak</h3>
+              <p className="text-2xl font-bold text-white">
+                {userStats.currentStreak}
+                <span className="ml-2 text-sm font-normal text-white/60">
+                  (best {userStats.longestStreak})
+                </span>
+              </p>
+            </div>
           </div>
 
+          {userStats.categories?.length > 0 && (
+            <div className="mb-8">
+              <h2 className="mb-4 text-2xl font-bold text-white">By Category</h2>
+              <div className="grid grid-cols-1 gap-4 md:grid-cols-2 lg:grid-cols-3">
+                {userStats.categories.map(category => (
+                  <div key={category.categoryId} className="p-4 border rounded-xl bg-white/10 border-white/20">
+                    <h3 className="mb-1 font-semibold text-white">{category.categoryName}</h3>
+                    <p className="text-sm text-white/70">
+                      {category.totalGuesses} guesses, average {category.averageScore.toFixed(2)}, best {category.bestScore}
+                    </p>
+                  </div>
+                ))}
+              </div>
+            </div>
+          )}
+
           <div className="space-y-8">
             <h2 className="mb-6 text-2xl font-bold text-white">Achievements</h2>
             
@@ -3,12 +3,15 @@ import Map from './Map';
 import AchievementNotification from './AchievementNotification';
 import { useNavigate } from 'react-router-dom';
 
+const END_SESSION_ATTEMPTS = 5;
+
 function Quiz({ category, onGameComplete }) {
   const [currentImage, setCurrentImage] = useState(null);
   const [showResult, setShowResult] = useState(false);
   const [score, setScore] = useState(0);
   const [totalScore, setTotalScore] = useState(0);
   const [distance, setDistance] = useState(null);
+  const [locationPercentile, setLocationPercentile] = useState(null);
   const [correctLocation, setCorrectLocation] = useState(null);
   const [guessedLocation, setGuessedLocation] = useState(null);
   const [error, setError] = useState(null);
@@ -68,12 +71,18 @@ function Quiz({ category, onGameComplete }) {
     
     try {
       const token = localStorage.getItem('token');
-      await fetch(`http://localhost:8000/game-sessions/${gameSessionId}/end`, {
-        method: 'PUT',
-        headers: {
-          'Authorization': `Bearer ${token}`
-        }
-      });
+      // 503 means the last guesses are still being saved; retry shortly
+      for (let attempt = 0; attempt < END_SESSION_ATTEMPTS; attempt++) {
+        const response = await fetch(`http://localhost:8000/game-sessions/${gameSessionId}/end`, {
+          method: 'PUT',
+          headers: {
+            'Authorization': `Bearer ${token}`
+          }
+        });
+        if (response.status !== 503) break;
+        const retryAfter = Number(response.headers.get('Retry-After')) || 1;
+        await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+      }
     } catch (error) {
       console.error('Failed to end game session:', error);
     }
@@ -174,8 +183,6 @@ function Quiz({ category, onGameComplete }) {
         body: JSON.stringify({
           guessed_latitude: position.lat,
           guessed_longitude: position.lng,
-          actual_latitude: correctLocation[0],
-          actual_longitude: correctLocation[1],
           location_id: locationId,
           game_session_id: gameSessionId
         })
@@ -190,6 +197,7 @@ function Quiz({ category, onGameComplete }) {
       setScore(data.score);
       setTotalScore(prevTotal => prevTotal + data.score);
       setDistance(data.distance);
+      setLocationPercentile(data.location_percentile);
       setShowResult(true);
     } catch (error) {
       console.error('Detailed error:', error);
@@ -332,6 +340,11 @@ function Quiz({ category, onGameComplete }) {
               <p className="text-lg text-white/80">
                 You were {Math.round(distance)} km away from {locationName}!
               </p>
+              {locationPercentile !== null && locationPercentile !== undefined && (
+                <p className="text-white/70">
+                  You beat {Math.round(locationPercentile)}% of players on this location
+                </p>
+              )}
               <button 
                 onClick={handleNextRound}
                 className="px-8 py-3 bg-white/10 hover:bg-white/20 
@@ -0,0 +1,32 @@
+// Subscribe to challenge updates pushed by the server (Server-Sent Events)
+
+const CHALLENGE_EVENT_TYPES = [
+  'challenge_created',
+  'challenge_responded',
+  'challenge_guess',
+  'challenge_completed',
+];
+
+// Calls onEvent with the parsed event and returns a function that closes the stream
+export const subscribeToChallengeEvents = (onEvent) => {
+  const token = localStorage.getItem('token');
+  if (!token) {
+    return () => {};
+  }
+
+  const source = new EventSource(
+    `http://localhost:8000/events/challenges?token=${encodeURIComponent(token)}`
+  );
+
+  const handleEvent = (message) => {
+    try {
+      onEvent(JSON.parse(message.data));
+    } catch (error) {
+      console.error('Error handling challenge event:', error);
+    }
+  };
+
+  CHALLENGE_EVENT_TYPES.forEach((type) => source.addEventListener(type, handleEvent));
+
+  return () => source.close();
+};